@@ -1,17 +1,58 @@
-import tkinter as tk
-from tkinter import scrolledtext, messagebox
 import os
 import sys
 import io
 import shutil
 import time
-import pythoncom
-import win32com.client
+import contextlib
+import multiprocessing
+import multiprocessing.util
 from PyPDF2 import PdfReader, PdfWriter, errors as pypdf_errors
+from PyPDF2.generic import DictionaryObject, NameObject, NumberObject, StreamObject
 import gc
+import random
+import zlib
 import threading
 import queue
 import re
+import sqlite3
+
+from pdf_index import PdfIndex
+from pdf_probe import probe_page_count
+from run_manifest import (file_sha256, reader_page_fingerprints, page_fingerprint, merge_signatures, load_manifest,
+                          save_manifest, save_postprint_record)
+from pdf_stream import ShardedPdfWriter, StreamingPdfWriter, remove_stale_shards
+from pdf_update import IncrementalUpdateError, append_title_page
+import pdf_linearize
+from pdf_dedup import new_dedup_stats, deduplicate_writer
+from memory_monitor import MemoryPeakMonitor
+from log_writer import LogFileWriter
+import scan_optimizer
+import sheet_pdf
+import title_match
+import folder_watch
+import xlsm_convert
+import xlsx_reader
+from pipeline import run_pipeline
+import renderer_service
+from tracing import Tracer, activate, record_events, span, traced
+
+try:
+    import tkinter as tk
+    from tkinter import scrolledtext, messagebox
+except ImportError:  # на серверах без Tk доступен только консольный режим (techdoc.py)
+    tk = None
+
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:  # pywin32 доступен только в Windows; без него работают только рендереры без Excel
+    pythoncom = None
+    win32com = None
+
+try:
+    import winreg
+except ImportError:  # только Windows
+    winreg = None
 
 # --- CAPTURE ORIGINAL STDOUT VERY EARLY ---
 _original_stdout = sys.__stdout__
@@ -21,6 +62,9 @@ log_queue = queue.Queue()
 gui_response_queue = queue.Queue()
 log_output = None
 root = None
+btn_check_excel = None
+btn_preprint = None
+btn_postprint = None
 
 
 # --- КОНФИГУРАЦИЯ ---
@@ -33,11 +77,52 @@ class Config:
     SERVICE_DIR = None
     FINAL_OUTPUT_DIR = None
     TITLE_SCAN_PDF = None
+    RENDERER = "excel"  # Имя рендерера из RENDERERS
+    RENDERER_OPTIONS = {}  # Параметры конструктора рендерера
+    EXPORT_WORKERS = 1  # Количество параллельных процессов экспорта (1 — экспорт в текущем процессе)
+    POSTPRINT_WORKERS = 1  # Количество параллельных процессов замены титульников (1 — в текущем процессе)
+    SCAN_OPTIMIZE = False  # Пережимать изображения title_scan.pdf перед заменой титульников (нужен Pillow)
+    SCAN_TARGET_DPI = 200  # Разрешение, до которого уменьшаются сканы
+    SCAN_COLOR_MODE = "auto"  # "auto" (серый, если скан фактически серый), "color", "gray" или "bilevel"
+    SCAN_JPEG_QUALITY = 75  # Качество JPEG для пережатых сканов
+    SCAN_OPTIMIZED_SUFFIX = "_optimized"  # Пережатые копии сканов в папке Service: title_scan_optimized.pdf и т. п.
+    TRACE = False  # Записывать время этапов: таблица в сводке и trace_<процесс>.json (Chrome Trace) в папке Service
+    TITLE_REPLACEMENT = "rewrite"  # Замена титульника: "rewrite" (файл переписывается) или "append" (добавочное обновление)
+    TITLE_MATCHING = "auto"  # Сопоставление сканов с файлами: "auto" (по изображению, нужны NumPy и PyMuPDF) или "positional"
+    TITLE_MISMATCH_POLICY = "ask"  # Несовпадение числа титульников: "ask" (диалог GUI), "continue" или "abort"
+    XLSM_DIRECT_CONVERT = True  # Удалять макросы из .xlsm без Excel; Excel — только для книг, где это невозможно
+    WATCH_DEBOUNCE_SEC = 2.0  # Режим наблюдения: запуск, когда файлы не меняются столько секунд
+    WATCH_POLL_INTERVAL = 1.0  # Режим наблюдения: интервал опроса папок (без inotify)
+    PDF_INDEX_ENABLED = True  # Кэшировать результаты проверки PDF в индексе
+    PDF_INDEX_FILE = "pdf_index.sqlite3"  # Файл индекса в папке Service (не удаляется при очистке)
+    INCREMENTAL = False  # Экспортировать только новые и изменённые книги (по манифесту предыдущего запуска)
+    MANIFEST_FILE = "preprint_manifest.json"  # Манифест запуска в папке Service
+    POSTPRINT_RECORD_FILE = "postprint_record.json"  # Запись замены титульников в папке Service
+    MERGE_STREAMING = "auto"  # Потоковое объединение PDF: "auto" (по лимиту памяти), "always" или "never"
+    MERGE_MEMORY_LIMIT_MB = 1024  # Лимит памяти для объединения в памяти; при превышении оценки — потоковый режим
+    MERGE_DEDUP = False  # Записывать одинаковые шрифты и изображения в объединённые PDF один раз
+    MERGE_SHARD_MAX_PAGES = 0  # Делить объединения на части _partNN не больше N страниц (0 — не делить)
+    MERGE_SHARD_MAX_MB = 0  # Делить объединения на части _partNN не больше N МБ (0 — не делить)
+    MERGE_SHARD_MODES = ("full", "notitle")  # Какие объединения делятся (title_merged.pdf остаётся целым)
+    LINEARIZE = False  # Записывать объединения Print и файлы Final линеаризованными (быстрый просмотр, нужен pikepdf)
+    PREPRINT_PIPELINE = True  # Проверять, копировать и объединять PDF параллельно с экспортом следующих книг
+    PIPELINE_QUEUE_SIZE = 2  # Сколько документов может ждать каждого этапа конвейера
+    RENDERER_SERVICE = "auto"  # Служба рендерера: "auto" (использовать, если запущена) или "never"
+    LOG_LEVEL = "DEBUG"  # Минимальный уровень сообщений: "DEBUG" (все), "INFO", "WARNING", "ERROR", "CRITICAL"
+    LOG_FILE = "app_log.txt"  # Файл лога GUI (None — не записывать)
+    LOG_MAX_BYTES = 5 * 1024 * 1024  # Размер файла лога, после которого он переименовывается в .1, .2, ...
+    LOG_BACKUP_COUNT = 3  # Количество сохраняемых старых файлов лога
+    LOG_JSON = False  # Записывать файл лога в формате JSON Lines
+    GUI_LOG_MAX_LINES = 5000  # В окне лога остаются последние строки; полный лог — в LOG_FILE
+    GUI_LOG_BATCH = 1000  # Сколько сообщений выводится в окно лога за один цикл обновления
 
     @staticmethod
-    def initialize_paths():
-        Config.BASE_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(
-            os.path.abspath(__file__))
+    def initialize_paths(base_dir=None):
+        if base_dir:
+            Config.BASE_DIR = os.path.abspath(base_dir)
+        else:
+            Config.BASE_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(
+                os.path.abspath(__file__))
         Config.EXCEL_INPUT_DIR = os.path.join(Config.BASE_DIR, "Excel")
         Config.PRINT_DIR = os.path.join(Config.BASE_DIR, "Print")
         Config.EXPORT_DIR = os.path.join(Config.BASE_DIR, "NotSignedExport")
@@ -45,6 +130,17 @@ class Config:
         Config.FINAL_OUTPUT_DIR = os.path.join(Config.BASE_DIR, "Final")
         Config.TITLE_SCAN_PDF = os.path.join(Config.PRINT_DIR, "title_scan.pdf")
 
+    @staticmethod
+    def export_state():
+        """Возвращает настройки в виде словаря для передачи в рабочие процессы."""
+        return {name: value for name, value in vars(Config).items() if name.isupper()}
+
+    @staticmethod
+    def apply_state(state):
+        """Применяет настройки, полученные из export_state()."""
+        for name, value in state.items():
+            setattr(Config, name, value)
+
 
 # --- 1. Настройка и утилиты (Configuration & Utilities) ---
 
@@ -52,36 +148,75 @@ class RedirectText(io.TextIOBase):
     """
     Класс для перенаправления вывода стандартного потока (stdout)
     в виджет ScrolledText Tkinter и файл.
+    Запись в файл выполняет LogFileWriter в фоновом потоке, поэтому write() не ждёт диска.
     """
 
-    def __init__(self, message_queue, original_stdout_ref):
+    def __init__(self, message_queue, original_stdout_ref, log_file_writer=None):
         self.message_queue = message_queue
         self.original_stdout = original_stdout_ref
+        self.log_file_writer = log_file_writer
 
     def write(self, string):
-        self.message_queue.put(string)
+        if self.message_queue is not None:
+            self.message_queue.put(string)
+            # Классификация выполняется в потоке, который пишет в лог, а не в потоке GUI.
+            # Лог рабочих процессов приходит одним фрагментом из нескольких строк.
+            for line in string.splitlines():
+                error = classify_error(line)
+                if error:
+                    self.message_queue.put({"type": "show_error", "title": error[0], "message": error[1]})
         if self.original_stdout:
             self.original_stdout.write(string)
-
-        try:
-            with open("app_log.txt", "a", encoding="utf-8") as f_log:
-                f_log.write(string)
-        except Exception as e:
-            if self.original_stdout:
-                self.original_stdout.write(f"[{time.strftime('%H:%M:%S')}] [ERROR] Ошибка записи в файл лога: {e}\n")
+        if self.log_file_writer:
+            self.log_file_writer.write(string)
 
     def flush(self):
         if self.original_stdout:
             self.original_stdout.flush()
 
 
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+# Заголовок диалога ошибки → фрагмент текста сообщения
+ERROR_PATTERNS = {
+    "Ошибка Excel: Открытие файла": "Не удалось открыть файл Excel",
+    "Ошибка Excel: Конвертация": "Не удалось преобразовать",
+    "Ошибка Excel: Экспорт в PDF": "Не удалось экспортировать",
+    "Ошибка PDF: Объединение": "Не удалось объединить PDF",
+    "Ошибка PDF: Чтение": "Не удалось прочитать PDF файл",
+    "Ошибка PDF: Замена титульника": "Не удалось заменить первую страницу",
+    "Ошибка файловой системы: Директория": "Не удалось создать директорию",
+    "Ошибка файловой системы: Удаление": "Ошибка при удалении",
+    "Ошибка: Excel не найден": "Microsoft Excel не установлен",
+    "Ошибка (CRITICAL)": "Критическая ошибка"
+}
+
+_ERROR_LINE = re.compile(r'\[\d{2}:\d{2}:\d{2}\]\s\[(ERROR|CRITICAL)\]\s(.+)')
+
+
+def classify_error(message):
+    """Возвращает (заголовок диалога, текст ошибки) для строки лога уровня ERROR/CRITICAL, иначе None."""
+    match = _ERROR_LINE.match(message)
+    if not match:
+        return None
+    level = match.group(1)
+    error_msg_content = match.group(2).strip()
+    for title_key, pattern in ERROR_PATTERNS.items():
+        if pattern in error_msg_content:
+            return title_key, error_msg_content
+    return f"Ошибка ({level})", error_msg_content
+
+
 def log(msg, level="INFO"):
-    """Централизованная функция для логирования сообщений."""
+    """Централизованная функция для логирования сообщений. Сообщения ниже Config.LOG_LEVEL не выводятся."""
+    if LOG_LEVELS.get(level, 20) < LOG_LEVELS.get(Config.LOG_LEVEL, 10):
+        return
     timestamp = time.strftime("%H:%M:%S")
     formatted_msg = f"[{timestamp}] [{level}] {msg}\n"
     print(formatted_msg)
 
 
+@traced("ensure_and_clear_folder")
 def ensure_and_clear_folder(folder_path, is_output_folder=False):
     """
     Проверяет существование папки, создает её при необходимости и очищает.
@@ -96,54 +231,170 @@ def ensure_and_clear_folder(folder_path, is_output_folder=False):
         return
 
     for item_name in os.listdir(folder_path):
+        if item_name.startswith(Config.PDF_INDEX_FILE):
+            continue  # индекс PDF (и его журнал) переживает очистку, устаревшие записи отсекаются по размеру и времени
         item_path = os.path.join(folder_path, item_name)
         try:
             if os.path.isfile(item_path) or os.path.islink(item_path):
                 os.remove(item_path)
-                log(f"Удален файл: {item_name}")
+                log(f"Удален файл: {item_name}", level="DEBUG")
             elif os.path.isdir(item_path):
                 shutil.rmtree(item_path)
-                log(f"Удалена директория: {item_name}")
+                log(f"Удалена директория: {item_name}", level="DEBUG")
         except OSError as e:
             log(f"Ошибка при удалении '{item_path}': {e} (Код ошибки: {e.winerror})", level="ERROR")
             raise
 
 
-def is_pdf_valid(file_path):
-    """Проверяет, является ли PDF файл действительным и содержит ли страницы."""
+_pdf_indexes = {}
+_pdf_indexes_lock = threading.Lock()
+
+
+def get_pdf_index():
+    """Возвращает индекс PDF текущей папки Service или None, если индекс отключён или папки нет."""
+    if not Config.PDF_INDEX_ENABLED or not Config.SERVICE_DIR or not os.path.isdir(Config.SERVICE_DIR):
+        return None
+    db_path = os.path.join(Config.SERVICE_DIR, Config.PDF_INDEX_FILE)
+    with _pdf_indexes_lock:
+        index = _pdf_indexes.get(db_path)
+        if index is None:
+            try:
+                index = PdfIndex(db_path)
+            except sqlite3.Error as e:
+                log(f"Не удалось открыть индекс PDF '{db_path}': {e}", level="WARNING")
+                return None
+            _pdf_indexes[db_path] = index
+        return index
+
+
+def _check_pdf_file(file_path):
+    """Проверяет, что PDF файл существует и не пуст."""
     if not os.path.exists(file_path):
         log(f"PDF файл не существует: {os.path.basename(file_path)}", level="ERROR")
-        return False, 0
+        return False
     if os.path.getsize(file_path) == 0:
         log(f"PDF файл пуст (размер 0 байт): {os.path.basename(file_path)}", level="WARNING")
-        return False, 0
+        return False
+    return True
+
+
+def _inspect_pdf(file_path):
+    """
+    Разбирает PDF без логирования.
+    Возвращает (reader, сведения о файле); reader равен None, если файл невалиден.
+    """
+    file_name = os.path.basename(file_path)
     try:
-        with open(file_path, "rb") as f:
-            reader = PdfReader(f)
-            num_pages = len(reader.pages)
-            if num_pages == 0:
-                log(f"PDF файл не содержит страниц: {os.path.basename(file_path)}", level="WARNING")
-                return False, 0
-            return True, num_pages
+        reader = PdfReader(file_path)
+        num_pages = len(reader.pages)
+        if num_pages == 0:
+            return None, {"valid": False, "num_pages": 0, "page_sizes": [],
+                          "problem": ("WARNING", f"PDF файл не содержит страниц: {file_name}")}
+        page_sizes = [[float(page.mediabox.width), float(page.mediabox.height)] for page in reader.pages]
+        return reader, {"valid": True, "num_pages": num_pages, "page_sizes": page_sizes, "problem": None}
     except pypdf_errors.PdfReadError as e:
-        log(f"Поврежденный PDF файл: {os.path.basename(file_path)} - {e}", level="ERROR")
-        return False, 0
+        return None, {"valid": False, "num_pages": 0, "page_sizes": [],
+                      "problem": ("ERROR", f"Поврежденный PDF файл: {file_name} - {e}")}
     except Exception as e:
-        log(f"Непредвиденная ошибка при проверке PDF: {os.path.basename(file_path)} - {e}", level="ERROR")
+        return None, {"valid": False, "num_pages": 0, "page_sizes": [],
+                      "problem": ("ERROR", f"Непредвиденная ошибка при проверке PDF: {file_name} - {e}")}
+
+
+def _lookup_pdf_info(file_path, stat_result):
+    """Ищет сведения о файле в индексе PDF."""
+    index = get_pdf_index()
+    if index is None:
+        return None
+    try:
+        return index.get(file_path, stat_result)
+    except sqlite3.Error as e:
+        log(f"Ошибка чтения индекса PDF: {e}", level="WARNING")
+        return None
+
+
+def _store_pdf_info(file_path, stat_result, info):
+    """Сохраняет сведения о файле в индекс PDF."""
+    index = get_pdf_index()
+    if index is None:
+        return
+    try:
+        index.put(file_path, stat_result, info)
+    except sqlite3.Error as e:
+        log(f"Ошибка записи индекса PDF: {e}", level="WARNING")
+
+
+def read_valid_pdf(file_path):
+    """
+    Открывает PDF и проверяет, что он действителен и содержит страницы; обновляет индекс PDF.
+    Возвращает (reader, количество страниц) или (None, 0).
+    """
+    if not _check_pdf_file(file_path):
+        return None, 0
+    stat_result = os.stat(file_path)
+    reader, info = _inspect_pdf(file_path)
+    _store_pdf_info(file_path, stat_result, info)
+    if info["problem"]:
+        level, message = info["problem"]
+        log(message, level=level)
+    return reader, info["num_pages"]
+
+
+def _probe_pdf(file_path):
+    """
+    Проверяет PDF быстрым чтением /Count корня дерева страниц (без размеров страниц).
+    Если так определить количество страниц нельзя, файл разбирается полностью.
+    """
+    num_pages = probe_page_count(file_path)
+    if num_pages is None:
+        return _inspect_pdf(file_path)[1]
+    if num_pages == 0:
+        return {"valid": False, "num_pages": 0, "page_sizes": [],
+                "problem": ("WARNING", f"PDF файл не содержит страниц: {os.path.basename(file_path)}")}
+    return {"valid": True, "num_pages": num_pages, "page_sizes": None, "problem": None}
+
+
+def get_pdf_info(file_path, page_sizes=True):
+    """
+    Возвращает сведения о PDF (valid, num_pages, page_sizes, problem) из индекса PDF,
+    а если файл изменился или ещё не проиндексирован — разбирает его. Возвращает None, если файла нет или он пуст.
+    При page_sizes=False достаточно валидности и количества страниц: файл проверяется быстрым
+    чтением дерева страниц, page_sizes может быть None.
+    """
+    if not _check_pdf_file(file_path):
+        return None
+    stat_result = os.stat(file_path)
+    info = _lookup_pdf_info(file_path, stat_result)
+    if info is None or (page_sizes and info["page_sizes"] is None):
+        info = _inspect_pdf(file_path)[1] if page_sizes else _probe_pdf(file_path)
+        _store_pdf_info(file_path, stat_result, info)
+    if info["problem"]:
+        level, message = info["problem"]
+        log(message, level=level)
+    return info
+
+
+@traced("is_pdf_valid")
+def is_pdf_valid(file_path):
+    """Проверяет, является ли PDF файл действительным и содержит ли страницы."""
+    info = get_pdf_info(file_path, page_sizes=False)
+    if info is None:
         return False, 0
+    return info["valid"], info["num_pages"]
 
 
 def is_excel_installed():
-    """Проверяет, установлен ли Microsoft Excel на системе."""
-    try:
-        obj = win32com.client.Dispatch("Excel.Application")
-        obj.Quit()
-        del obj
-        gc.collect()
-        return True
-    except pythoncom.com_error:
+    """
+    Проверяет, установлен ли Microsoft Excel на системе: по регистрации COM-сервера Excel.Application
+    в реестре, не запуская Excel.
+    """
+    if win32com is None or winreg is None:
         return False
-    except Exception:
+    try:
+        with winreg.OpenKey(winreg.HKEY_CLASSES_ROOT, r"Excel.Application\CLSID") as key:
+            clsid, _ = winreg.QueryValueEx(key, "")
+        with winreg.OpenKey(winreg.HKEY_CLASSES_ROOT, rf"CLSID\{clsid}\LocalServer32"):
+            return True
+    except OSError:
         return False
 
 
@@ -153,22 +404,30 @@ def close_excel_app(excel_app):
         try:
             excel_app.DisplayAlerts = True
             excel_app.Quit()
-            log("Excel приложение закрыто.")
+            log("Excel приложение закрыто.", level="DEBUG")
         except Exception as e:
             log(f"Ошибка при закрытии Excel приложения: {e}", level="WARNING")
         finally:
             del excel_app
             gc.collect()
-            log("COM-объект Excel освобожден и память очищена.")
+            log("COM-объект Excel освобожден и память очищена.", level="DEBUG")
     try:
         pythoncom.CoUninitialize()
-        log("COM-библиотека деинициализирована.")
+        log("COM-библиотека деинициализирована.", level="DEBUG")
     except Exception as e:
         log(f"Ошибка при деинициализации COM-библиотеки: {e}", level="WARNING")
 
 
 # --- 2. Функции обработки Excel (Excel Processing Functions) ---
 
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+
+
+def find_excel_files():
+    """Возвращает отсортированный список файлов Excel (.xlsx, .xlsm, .xls) в папке Excel."""
+    return sorted(f for f in os.listdir(Config.EXCEL_INPUT_DIR) if f.lower().endswith(EXCEL_EXTENSIONS))
+
+
 def get_exclude_count(filename):
     """
     Определяет количество листов Excel для исключения из печати
@@ -187,8 +446,9 @@ def get_exclude_count(filename):
 def _open_excel_workbook(excel_app, file_path):
     """Вспомогательная функция для безопасного открытия рабочей книги Excel."""
     try:
-        wb = excel_app.Workbooks.Open(file_path)
-        log(f"Открыта рабочая книга Excel: {os.path.basename(file_path)}")
+        with span("Workbooks.Open", file=os.path.basename(file_path)):
+            wb = excel_app.Workbooks.Open(file_path)
+        log(f"Открыта рабочая книга Excel: {os.path.basename(file_path)}", level="DEBUG")
         return wb
     except Exception as e:
         log(f"Ошибка при открытии Excel файла '{os.path.basename(file_path)}': {e}", level="ERROR")
@@ -201,22 +461,295 @@ def _close_excel_workbook(workbook):
         try:
             workbook.Close(False)
             time.sleep(0.05)
-            log(f"Закрыта рабочая книга Excel.")
+            log(f"Закрыта рабочая книга Excel.", level="DEBUG")
         except Exception as e:
             log(f"Ошибка при закрытии рабочей книги Excel: {e}", level="WARNING")
 
 
-def convert_xlsm_to_xlsx(excel_app, full_path, base_filename):
-    """Конвертирует файл .xlsm в .xlsx и удаляет исходный .xlsm."""
+class ExcelRenderer:
+    """
+    Базовый интерфейс рендерера: открывает книги Excel, сохраняет их как XLSX и экспортирует в PDF.
+    Экземпляр рендерера используется только из одного потока (процесса) и владеет своим приложением.
+    """
+    name = None
+    unavailable_message = "Рендерер недоступен на этой системе."
+
+    @classmethod
+    def is_available(cls):
+        """Проверяет, может ли рендерер работать на этой системе."""
+        return True
+
+    def start(self):
+        """Запускает рендерер. Возвращает True при успехе."""
+        return True
+
+    def stop(self):
+        """Останавливает рендерер и освобождает ресурсы."""
+
+    def is_healthy(self):
+        """Проверяет, что запущенный рендерер отвечает (используется службой рендерера)."""
+        return True
+
+    def save_as_xlsx(self, source_path, xlsx_path):
+        """Сохраняет книгу source_path в формате XLSX. Возвращает True при успехе."""
+        raise NotImplementedError
+
+    def export_pdf(self, source_path, pdf_path, exclude_count):
+        """
+        Экспортирует в pdf_path все листы книги, кроме exclude_count последних.
+        Возвращает ожидаемое количество страниц (если оно <= 0, экспорт не выполняется)
+        или None, если книгу не удалось открыть.
+        """
+        raise NotImplementedError
+
+
+RENDERERS = {}
+
+
+def register_renderer(renderer_cls):
+    """Регистрирует класс рендерера под его именем (используется как декоратор)."""
+    RENDERERS[renderer_cls.name] = renderer_cls
+    return renderer_cls
+
+
+def create_renderer(name, **options):
+    """Создаёт рендерер по имени из RENDERERS."""
+    if name not in RENDERERS:
+        raise ValueError(f"Неизвестный рендерер: {name}. Доступны: {', '.join(sorted(RENDERERS))}")
+    return RENDERERS[name](**options)
+
+
+@register_renderer
+class ComExcelRenderer(ExcelRenderer):
+    """Рендерер на основе Microsoft Excel через COM. Каждый экземпляр запускает отдельный процесс Excel."""
+    name = "excel"
+    unavailable_message = "Microsoft Excel не установлен или не найден. Установите Excel и попробуйте снова."
+
+    def __init__(self):
+        self.excel_app = None
+
+    @classmethod
+    def is_available(cls):
+        return pythoncom is not None and is_excel_installed()
+
+    def start(self):
+        try:
+            pythoncom.CoInitialize()
+            # DispatchEx создаёт собственный процесс Excel, а не подключается к уже запущенному
+            self.excel_app = win32com.client.DispatchEx("Excel.Application")
+            self.excel_app.DisplayAlerts = False
+            self.excel_app.Visible = False
+            return True
+        except Exception as e:
+            log(f"Ошибка COM-объекта (возможно, Excel не установлен или не отвечает): {e}", level="CRITICAL")
+            self.stop()
+            return False
+
+    def stop(self):
+        excel_app, self.excel_app = self.excel_app, None
+        close_excel_app(excel_app)
+
+    def is_healthy(self):
+        if self.excel_app is None:
+            return False
+        try:
+            return bool(self.excel_app.Version)
+        except Exception:
+            return False
+
+    def save_as_xlsx(self, source_path, xlsx_path):
+        wb = _open_excel_workbook(self.excel_app, source_path)
+        if not wb:
+            return False
+        try:
+            with span("SaveAs", file=os.path.basename(xlsx_path)):
+                wb.SaveAs(xlsx_path, FileFormat=51)  # 51 = xlOpenXMLWorkbook (xlsx)
+            return True
+        finally:
+            _close_excel_workbook(wb)
+
+    def export_pdf(self, source_path, pdf_path, exclude_count):
+        wb = _open_excel_workbook(self.excel_app, source_path)
+        if not wb:
+            return None
+        try:
+            expected_pages = wb.Sheets.Count - exclude_count
+            if expected_pages <= 0:
+                return expected_pages
+
+            log(f"Экспорт листов 1-{expected_pages} из '{os.path.basename(source_path)}' в PDF: {os.path.basename(pdf_path)}")
+            with span("ExportAsFixedFormat", file=os.path.basename(pdf_path)):
+                wb.ExportAsFixedFormat(
+                    Type=0,  # xlTypePDF
+                    Filename=pdf_path,
+                    Quality=0,  # xlQualityStandard
+                    IncludeDocProperties=False,
+                    IgnorePrintAreas=False,
+                    From=1,
+                    To=expected_pages
+                )
+            return expected_pages
+        finally:
+            _close_excel_workbook(wb)
+
+
+@register_renderer
+class FakeRenderer(ExcelRenderer):
+    """
+    Рендерер без Excel для проверки пула, порядка нумерации и обработки ошибок (в том числе на Linux).
+    Вместо экспорта создаёт PDF из sheet_count пустых страниц минус исключаемые листы.
+    Если задан sheet_count_max, количество листов каждой книги выбирается детерминированно по её имени
+    в диапазоне sheet_count..sheet_count_max. При image_kb > 0 на каждую страницу выводится изображение
+    такого размера (одно на документ, с данными, зависящими от имени книги).
+    Файлы, в имени которых встречается одна из строк fail_on, завершаются ошибкой.
+    """
+    name = "fake"
+
+    def __init__(self, sheet_count=3, delay=0.0, fail_on=(), sheet_count_max=None, image_kb=0):
+        self.sheet_count = sheet_count
+        self.delay = delay
+        self.fail_on = tuple(fail_on)
+        self.sheet_count_max = sheet_count_max
+        self.image_kb = image_kb
+
+    def _check_failure(self, source_path, action):
+        filename = os.path.basename(source_path)
+        if any(marker in filename for marker in self.fail_on):
+            raise RuntimeError(f"Имитация ошибки ({action}): {filename}")
+
+    def _sheets_for(self, source_path):
+        if not self.sheet_count_max or self.sheet_count_max <= self.sheet_count:
+            return self.sheet_count
+        seed = zlib.crc32(os.path.basename(source_path).encode("utf-8"))
+        return self.sheet_count + seed % (self.sheet_count_max - self.sheet_count + 1)
+
+    def _image_for(self, writer, source_path):
+        """Добавляет в writer изображение image_kb КБ и возвращает ссылку на него."""
+        side = max(1, int((self.image_kb * 1024) ** 0.5))
+        seed = zlib.crc32(os.path.basename(source_path).encode("utf-8"))
+        image = StreamObject()
+        image._data = random.Random(seed).randbytes(side * side)
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(side),
+            NameObject("/Height"): NumberObject(side),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        })
+        return writer._add_object(image)
+
+    def save_as_xlsx(self, source_path, xlsx_path):
+        self._check_failure(source_path, "конвертация")
+        shutil.copyfile(source_path, xlsx_path)
+        return True
+
+    def export_pdf(self, source_path, pdf_path, exclude_count):
+        if self.delay:
+            time.sleep(self.delay)
+        self._check_failure(source_path, "экспорт")
+
+        expected_pages = self._sheets_for(source_path) - exclude_count
+        if expected_pages <= 0:
+            return expected_pages
+
+        writer = PdfWriter()
+        image_ref = self._image_for(writer, source_path) if self.image_kb else None
+        for page_number in range(expected_pages):
+            writer.add_blank_page(width=595, height=842)  # A4 в пунктах
+            if image_ref is not None:
+                page = writer.pages[-1]
+                content = StreamObject()
+                content._data = f"q 200 0 0 200 72 {500 - page_number % 3 * 10} cm /Im0 Do Q".encode()
+                page[NameObject("/Contents")] = writer._add_object(content)
+                page[NameObject("/Resources")] = DictionaryObject({
+                    NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image_ref})
+                })
+        with open(pdf_path, "wb") as f:
+            writer.write(f)
+        return expected_pages
+
+
+@register_renderer
+class PythonRenderer(ExcelRenderer):
+    """
+    Рендерер без Excel: книга читается xlsx_reader, листы выводятся в PDF через sheet_pdf
+    (по одной странице на лист). Работает на Linux; поддерживаются только .xlsx и .xlsm.
+    Параметры: font_path и bold_font_path — файлы шрифтов TrueType с кириллицей
+    (по умолчанию ищутся Arial, DejaVu Sans или Liberation Sans).
+    """
+    name = "python"
+    unavailable_message = "Для рендерера python нужна библиотека reportlab (pip install reportlab)."
+
+    def __init__(self, font_path=None, bold_font_path=None):
+        self.font_path = font_path
+        self.bold_font_path = bold_font_path
+        self.fonts = None
+
+    @classmethod
+    def is_available(cls):
+        return sheet_pdf.is_available()
+
+    def start(self):
+        try:
+            self.fonts = sheet_pdf.load_fonts(self.font_path, self.bold_font_path)
+        except ValueError as e:
+            log(str(e), level="CRITICAL")
+            return False
+        if not self.fonts.unicode:
+            log("Шрифт TrueType с кириллицей не найден (укажите font_path в параметрах рендерера). "
+                "Используется Helvetica: русский текст не будет выведен.", level="WARNING")
+        return True
+
+    def save_as_xlsx(self, source_path, xlsx_path):
+        log(f"Рендерер {self.name} не конвертирует XLSM, которые нельзя преобразовать напрямую: "
+            f"{os.path.basename(source_path)}", level="ERROR")
+        return False
+
+    def export_pdf(self, source_path, pdf_path, exclude_count):
+        filename = os.path.basename(source_path)
+        if not filename.lower().endswith((".xlsx", ".xlsm")):
+            log(f"Рендерер {self.name} не поддерживает формат файла '{filename}' (нужен .xlsx или .xlsm).",
+                level="ERROR")
+            return None
+        try:
+            with xlsx_reader.open_workbook(source_path) as workbook:
+                expected_pages = len(workbook.sheets) - exclude_count
+                if expected_pages <= 0:
+                    return expected_pages
+
+                # Как и ExportAsFixedFormat, выводятся видимые листы; скрытые не печатаются
+                printed = [info for info in workbook.sheets if info.visible][:expected_pages]
+                log(f"Экспорт листов 1-{expected_pages} из '{filename}' в PDF: {os.path.basename(pdf_path)}")
+                with span("sheet_pdf.render_sheets", file=os.path.basename(pdf_path)):
+                    sheet_pdf.render_sheets((workbook.load_sheet(info) for info in printed), pdf_path, self.fonts)
+            return expected_pages
+        except xlsx_reader.XlsxError as e:
+            log(f"Ошибка при чтении книги '{filename}': {e}", level="ERROR")
+            return None
+
+
+def convert_xlsm_to_xlsx(renderer, full_path, base_filename):
+    """
+    Конвертирует файл .xlsm в .xlsx и удаляет исходный .xlsm.
+    При Config.XLSM_DIRECT_CONVERT пакет книги переписывается без Excel (xlsm_convert);
+    рендерер используется, только если прямая конвертация невозможна.
+    """
     temp_xlsx_path = os.path.join(Config.EXCEL_INPUT_DIR, base_filename + ".xlsx")
-    wb = None
     try:
         log(f"Попытка конвертации XLSM: {os.path.basename(full_path)}")
-        wb = _open_excel_workbook(excel_app, full_path)
-        if not wb:
+        converted = False
+        if Config.XLSM_DIRECT_CONVERT:
+            try:
+                with span("xlsm_convert", file=os.path.basename(full_path)):
+                    removed_parts = xlsm_convert.convert_xlsm(full_path, temp_xlsx_path)
+                converted = True
+                log(f"Макросы удалены без Excel (удалено частей пакета: {removed_parts}).", level="DEBUG")
+            except xlsx_reader.XlsxError as e:
+                log(f"Прямая конвертация '{os.path.basename(full_path)}' невозможна: {e}. "
+                    f"Конвертация через рендерер {renderer.name}.", level="WARNING")
+        if not converted and not renderer.save_as_xlsx(full_path, temp_xlsx_path):
             return None
-
-        wb.SaveAs(temp_xlsx_path, FileFormat=51)  # 51 = xlOpenXMLWorkbook (xlsx)
         log(f"Преобразован: {os.path.basename(full_path)} → {os.path.basename(temp_xlsx_path)}")
 
         try:
@@ -230,159 +763,798 @@ def convert_xlsm_to_xlsx(excel_app, full_path, base_filename):
     except Exception as e:
         log(f"❗ Общая ошибка при преобразовании {os.path.basename(full_path)} в XLSX: {e}", level="ERROR")
         return None
-    finally:
-        _close_excel_workbook(wb)
 
 
-def export_excel_to_pdf(excel_app, full_path, base_filename, file_number):
+def export_excel_to_pdf(renderer, full_path, base_filename, file_number, verify=True):
     """
     Экспортирует листы Excel в PDF, исключая указанное количество последних листов.
     Присваивает файлу порядковый номер.
+    При verify=False количество страниц не проверяется (это делает verify_exported_pdf позже)
+    и возвращается ожидаемое количество страниц.
     """
-    wb = None
     pdf_path = None
-    expected_pages = 0
     try:
         log(f"Начинаю экспорт: {os.path.basename(full_path)}")
-        wb = _open_excel_workbook(excel_app, full_path)
-        if not wb:
-            return None, 0
-
-        sheet_count = wb.Sheets.Count
         exclude_count = get_exclude_count(base_filename)
 
-        expected_pages = sheet_count - exclude_count
+        pdf_filename = f"{file_number:03d}_{base_filename}.pdf"
+        pdf_path = os.path.join(Config.SERVICE_DIR, pdf_filename)
+
+        with span("renderer.export_pdf", file=os.path.basename(full_path), renderer=renderer.name):
+            expected_pages = renderer.export_pdf(full_path, pdf_path, exclude_count)
+        if expected_pages is None:
+            return None, 0
 
         if expected_pages <= 0:
             log(f"Пропущен файл '{os.path.basename(full_path)}': после исключения {exclude_count} листов, осталось {expected_pages} листов для экспорта.",
                 level="WARNING")
             return None, 0
 
-        pdf_filename = f"{file_number:03d}_{base_filename}.pdf"
-        pdf_path = os.path.join(Config.SERVICE_DIR, pdf_filename)
-
-        log(f"Экспорт листов 1-{expected_pages} из '{os.path.basename(full_path)}' в PDF: {os.path.basename(pdf_path)}")
-        wb.ExportAsFixedFormat(
-            Type=0,  # xlTypePDF
-            Filename=pdf_path,
-            Quality=0,  # xlQualityStandard
-            IncludeDocProperties=False,
-            IgnorePrintAreas=False,
-            From=1,
-            To=expected_pages
-        )
         log(f"Сохранён: {os.path.basename(pdf_path)}")
+        if not verify:
+            return pdf_path, expected_pages
+        return verify_exported_pdf(pdf_path, expected_pages)
+    except Exception as e:
+        log(f"❗ Общая ошибка при экспорте '{os.path.basename(full_path)}' в PDF: {e}", level="ERROR")
+        return None, 0
 
-        is_valid, actual_pages = is_pdf_valid(pdf_path)
-        if not is_valid:
-            log(f"Созданный PDF '{os.path.basename(pdf_path)}' не прошел валидацию. Возможно, он поврежден или пуст.",
+
+def verify_exported_pdf(pdf_path, expected_pages):
+    """
+    Проверяет экспортированный PDF: файл действителен и содержит expected_pages страниц.
+    Невалидный файл удаляется. Возвращает (pdf_path, количество страниц) или (None, 0).
+    """
+    is_valid, actual_pages = is_pdf_valid(pdf_path)
+    if not is_valid:
+        log(f"Созданный PDF '{os.path.basename(pdf_path)}' не прошел валидацию. Возможно, он поврежден или пуст.",
+            level="ERROR")
+        try:
+            os.remove(pdf_path)
+            log(f"Удален невалидный PDF: {os.path.basename(pdf_path)}")
+        except OSError as e:
+            log(f"Не удалось удалить невалидный PDF '{os.path.basename(pdf_path)}': {e} (Код ошибки: {e.winerror})",
+                level="WARNING")
+        return None, 0
+
+    if actual_pages != expected_pages:
+        log(f"❗ НЕСООТВЕТСТВИЕ СТРАНИЦ в '{os.path.basename(pdf_path)}': Ожидалось {expected_pages}, фактически {actual_pages}.",
+            level="ERROR")
+        try:
+            os.remove(pdf_path)
+            log(f"Удален PDF с несоответствием страниц: {os.path.basename(pdf_path)}")
+        except OSError as e:
+            log(f"Не удалось удалить PDF с несоответствием страниц '{os.path.basename(pdf_path)}': {e} (Код ошибки: {e.winerror})",
+                level="WARNING")
+        return None, 0
+    else:
+        log(f"✅ Проверка страниц: Ожидалось {expected_pages}, фактически {actual_pages}. Совпадает.", level="DEBUG")
+
+    return pdf_path, actual_pages
+
+
+@traced("workbook", path_arg=2)
+def render_workbook(renderer, file_number, filename, verify=True):
+    """
+    Конвертирует (при необходимости) и экспортирует одну книгу из папки Excel.
+    Возвращает словарь с результатом; file_number используется как предварительный номер файла.
+    При verify=False PDF не проверяется: поле "verified" равно False, "pages" — ожидаемое количество страниц.
+    """
+    result = {"file_number": file_number, "filename": filename, "source_path": None, "pdf_path": None, "pages": 0,
+              "verified": verify, "error": False, "log": ""}
+    full_path = os.path.join(Config.EXCEL_INPUT_DIR, filename)
+    base_filename, ext = os.path.splitext(filename)
+    current_file_path = full_path
+
+    if ext.lower() == ".xlsm":
+        converted_path = convert_xlsm_to_xlsx(renderer, full_path, base_filename)
+        if not converted_path:
+            log(f"Пропущен файл '{filename}' из-за ошибки конвертации.", level="ERROR")
+            result["error"] = True
+            return result
+        current_file_path = converted_path
+        ext = ".xlsx"
+
+    if ext.lower() in [".xlsx", ".xls"]:
+        pdf_path, pages_count = export_excel_to_pdf(renderer, current_file_path,
+                                                    os.path.splitext(os.path.basename(current_file_path))[0],
+                                                    file_number, verify)
+        result["source_path"] = current_file_path
+        result["pdf_path"] = pdf_path
+        result["pages"] = pages_count
+        result["error"] = pdf_path is None
+    else:
+        log(f"Пропущен файл с неподдерживаемым расширением: {filename}", level="WARNING")
+
+    return result
+
+
+# --- 2.0. План экспорта без Excel (Export Plan) ---
+
+def _plan_problem(plan_entry, severity, message):
+    plan_entry["problems"].append({"severity": severity, "message": message})
+
+
+def _plan_workbook(filename):
+    """
+    Читает из архива книги список листов (без Excel) и определяет ожидаемое количество страниц.
+    Возвращает запись плана: source, exclude_count, sheets, expected_pages (None — неизвестно),
+    skip (книга заведомо не будет экспортирована) и problems.
+    """
+    base_filename, ext = os.path.splitext(filename)
+    exclude_count = get_exclude_count(base_filename)
+    entry = {"source": filename, "file_number": None, "service_pdf": None, "exclude_count": exclude_count,
+             "sheets": None, "expected_pages": None, "skip": False, "problems": []}
+    if ext.lower() == ".xls":
+        _plan_problem(entry, "warning", "Формат .xls читается только Excel: количество страниц станет известно "
+                                        "при экспорте.")
+        return entry
+
+    try:
+        with xlsx_reader.open_workbook(os.path.join(Config.EXCEL_INPUT_DIR, filename)) as workbook:
+            sheets = workbook.sheets
+            expected_pages = len(sheets) - exclude_count
+            printed = [info for info in sheets if info.visible][:max(expected_pages, 0)]
+            empty = [info.name for info in printed if not workbook.sheet_has_cells(info)]
+    except xlsx_reader.XlsxError as e:
+        _plan_problem(entry, "error", f"Книга не читается: {e}")
+        return entry
+    except Exception as e:
+        # повреждённая книга остаётся проблемой плана, а не прерывает весь запуск
+        _plan_problem(entry, "error", f"Книга не читается ({type(e).__name__}): {e}")
+        return entry
+
+    entry["sheets"] = len(sheets)
+    entry["expected_pages"] = expected_pages
+    if not sheets:
+        entry["skip"] = True
+        _plan_problem(entry, "error", "В книге нет листов.")
+    elif expected_pages <= 0:
+        entry["skip"] = True
+        _plan_problem(entry, "error", f"Нет листов для экспорта: листов {len(sheets)}, исключается {exclude_count}.")
+    else:
+        if len(printed) < expected_pages:
+            hidden = ", ".join(info.name for info in sheets if not info.visible)
+            _plan_problem(entry, "error", f"Видимых листов {len(printed)}, а ожидается страниц {expected_pages} "
+                                          f"(скрытые листы: {hidden}): проверка количества страниц не пройдёт.")
+        if printed and len(empty) == len(printed):
+            _plan_problem(entry, "error", "Книга пуста: на экспортируемых листах нет ни одной ячейки.")
+        elif empty:
+            _plan_problem(entry, "warning", f"Пустые листы: {', '.join(empty)}.")
+    return entry
+
+
+@traced("plan_preprint", path_arg=None)
+def plan_preprint(excel_files):
+    """
+    Составляет план подготовки к печати по архивам книг, не запуская Excel: порядок и номера файлов
+    в Service, исключаемые листы, ожидаемое количество страниц каждой книги и объединений, проблемы.
+    Книги .xls и нечитаемые книги включаются в план с неизвестным количеством страниц.
+    """
+    started = time.perf_counter()
+    # .xlsm при конвертации перезаписывает одноимённый .xlsx
+    xlsm_targets = {os.path.splitext(f)[0] + ".xlsx" for f in excel_files if f.lower().endswith(".xlsm")}
+    documents = []
+    file_number = 0
+    for filename in excel_files:
+        entry = _plan_workbook(filename)
+        if filename in xlsm_targets:
+            _plan_problem(entry, "warning", "Будет перезаписан результатом конвертации одноимённого XLSM.")
+        if not entry["skip"]:
+            file_number += 1
+            entry["file_number"] = file_number
+            entry["service_pdf"] = f"{file_number:03d}_{os.path.splitext(filename)[0]}.pdf"
+        documents.append(entry)
+
+    numbered = [entry for entry in documents if entry["file_number"]]
+    pages_complete = sum(entry["expected_pages"] or 0 for entry in numbered)
+    problems = [problem for entry in documents for problem in entry["problems"]]
+    return {
+        "documents": documents,
+        "total_pages_complete": pages_complete,
+        "total_pages_title": len(numbered),
+        "total_pages_notitle": pages_complete - len(numbered),
+        "totals_exact": all(entry["expected_pages"] is not None for entry in numbered),
+        "errors": sum(1 for problem in problems if problem["severity"] == "error"),
+        "warnings": sum(1 for problem in problems if problem["severity"] == "warning"),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def log_preprint_plan(plan, level="INFO"):
+    """
+    Выводит план в лог: строки плана — с уровнем level, проблемы — с уровнем WARNING
+    (ERROR в GUI открывает диалог на каждую строку, а план только предупреждает).
+    """
+    log("\n--- ПЛАН ПОДГОТОВКИ К ПЕЧАТИ ---", level=level)
+    for entry in plan["documents"]:
+        number = f"{entry['file_number']:03d}" if entry["file_number"] else "---"
+        sheets = "?" if entry["sheets"] is None else entry["sheets"]
+        pages = "?" if entry["expected_pages"] is None else max(entry["expected_pages"], 0)
+        log(f"{number}  {entry['source']}: листов {sheets}, исключается {entry['exclude_count']}, страниц {pages}",
+            level=level)
+        for problem in entry["problems"]:
+            marker = "❗ " if problem["severity"] == "error" else ""
+            log(f"{marker}{entry['source']}: {problem['message']}", level="WARNING")
+    approximate = "" if plan["totals_exact"] else " (без учёта книг с неизвестным количеством страниц)"
+    log(f"Ожидается страниц: complete_merged.pdf — {plan['total_pages_complete']}, "
+        f"title_merged.pdf — {plan['total_pages_title']}, "
+        f"no_title_merged.pdf — {plan['total_pages_notitle']}{approximate}", level=level)
+    log(f"Проблем в плане: ошибок {plan['errors']}, предупреждений {plan['warnings']}. "
+        f"План составлен за {plan['duration_ms']} мс.", level=level)
+
+
+def process_preprint_plan():
+    """
+    Пробный запуск 'Подготовить к печати': выводит план без экспорта и без очистки папок.
+    Возвращает сводку; поле "status": "ok", "errors" (в плане есть ошибки), "failed" или "empty".
+    """
+    summary = {"status": "failed", "dry_run": True, "excel_files_found": 0}
+    if not os.path.isdir(Config.EXCEL_INPUT_DIR):
+        log(f"Папка 'Excel' не найдена: {Config.EXCEL_INPUT_DIR}", level="ERROR")
+        return summary
+
+    excel_files = find_excel_files()
+    summary["excel_files_found"] = len(excel_files)
+    if not excel_files:
+        log("В папке 'Excel' не найдено файлов для обработки (.xlsx, .xlsm, .xls).", level="INFO")
+        summary["status"] = "empty"
+        return summary
+
+    plan = plan_preprint(excel_files)
+    log_preprint_plan(plan)
+    summary.update(plan)
+    summary["status"] = "errors" if plan["errors"] else "ok"
+    return summary
+
+
+# --- 2.1. Пул процессов экспорта (Export Worker Pool) ---
+
+_worker_renderer_spec = None
+_worker_renderer = None
+_worker_renderer_failed = False
+
+
+def _export_worker_init(renderer_name, renderer_options, config_state):
+    """Инициализация рабочего процесса пула: настройки и отложенный запуск собственного рендерера."""
+    global _worker_renderer_spec
+    Config.apply_state(config_state)
+    _worker_renderer_spec = (renderer_name, renderer_options)
+    # Finalize с exitpriority вызывается при штатном завершении процесса пула (close + join)
+    multiprocessing.util.Finalize(None, _export_worker_shutdown, exitpriority=10)
+
+
+def _export_worker_shutdown():
+    """Останавливает рендерер рабочего процесса."""
+    global _worker_renderer
+    if _worker_renderer:
+        _worker_renderer.stop()
+        _worker_renderer = None
+
+
+def _ensure_worker_renderer(retry=False):
+    """
+    Запускает рендерер рабочего процесса, если он ещё не запущен. При retry=True повторяет неудавшийся
+    запуск и перезапускает рендерер, который перестал отвечать (служба рендерера). Возвращает рендерер или None.
+    """
+    global _worker_renderer, _worker_renderer_failed
+    if _worker_renderer is not None and retry and not _worker_renderer.is_healthy():
+        log(f"Рендерер '{_worker_renderer_spec[0]}' не отвечает, перезапуск", level="WARNING")
+        _export_worker_shutdown()
+    if _worker_renderer is None and (retry or not _worker_renderer_failed):
+        renderer_name, renderer_options = _worker_renderer_spec
+        try:
+            renderer = create_renderer(renderer_name, **renderer_options)
+        except (TypeError, ValueError) as e:
+            log(f"Не удалось создать рендерер '{renderer_name}' с параметрами {renderer_options}: {e}",
                 level="ERROR")
+            renderer = None
+        if renderer is not None and renderer.start():
+            _worker_renderer = renderer
+            _worker_renderer_failed = False
+        else:
+            _worker_renderer_failed = True
+    return _worker_renderer
+
+
+def _export_worker_run(job, retry=False):
+    """
+    Выполняет задание в рабочем процессе. Вывод лога перехватывается и возвращается вместе с результатом,
+    чтобы родительский процесс выводил его в исходном порядке файлов.
+    """
+    file_number, filename, verify = job
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), activate(Tracer() if Config.TRACE else None) as tracer:
+        renderer = _ensure_worker_renderer(retry)
+        if renderer is None:
+            log(f"Рендерер '{_worker_renderer_spec[0]}' не запущен, файл пропущен: {filename}", level="ERROR")
+            result = {"file_number": file_number, "filename": filename, "pdf_path": None, "pages": 0,
+                      "error": True}
+        else:
             try:
-                os.remove(pdf_path)
-                log(f"Удален невалидный PDF: {os.path.basename(pdf_path)}")
-            except OSError as e:
-                log(f"Не удалось удалить невалидный PDF '{os.path.basename(pdf_path)}': {e} (Код ошибки: {e.winerror})",
-                    level="WARNING")
-            return None, 0
+                result = render_workbook(renderer, file_number, filename, verify)
+            except Exception as e:
+                log(f"❗ Непредвиденная ошибка при обработке '{filename}': {e}", level="ERROR")
+                result = {"file_number": file_number, "filename": filename, "pdf_path": None, "pages": 0,
+                          "error": True}
+    result["log"] = output.getvalue()
+    result["trace"] = tracer.events if tracer else None
+    return result
 
-        if actual_pages != expected_pages:
-            log(f"❗ НЕСООТВЕТСТВИЕ СТРАНИЦ в '{os.path.basename(pdf_path)}': Ожидалось {expected_pages}, фактически {actual_pages}.",
-                level="ERROR")
+
+_worker_pending_log = []  # лог рабочего процесса службы вне заданий (запуск рендерера) до следующей проверки
+
+
+def _service_worker_init(renderer_name, renderer_options):
+    """Инициализация рабочего процесса службы рендерера: рендерер запускается сразу, а не с первым заданием."""
+    _export_worker_init(renderer_name, renderer_options, Config.export_state())
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        _ensure_worker_renderer()
+    _worker_pending_log.append(output.getvalue())
+
+
+def _service_worker_run(job):
+    """Задание службы рендерера: (настройки запуска клиента, задание экспорта)."""
+    config_state, export_job = job
+    Config.apply_state(config_state)
+    return _export_worker_run(export_job, retry=True)
+
+
+def _service_worker_health(_=None):
+    """
+    Проверка рабочего процесса службы: (pid, рендерер запущен и отвечает, лог вне заданий).
+    Вывод рабочих процессов не попадает в лог службы, поэтому лог запуска рендерера передаётся с проверкой.
+    """
+    pending = "".join(_worker_pending_log)
+    _worker_pending_log.clear()
+    return os.getpid(), _worker_renderer is not None and _worker_renderer.is_healthy(), pending
+
+
+def _renumber_service_pdfs(results):
+    """
+    Присваивает успешно экспортированным файлам сплошную нумерацию NNN_ в порядке исходного списка.
+    Предварительные номера не меньше итоговых, поэтому переименование по возрастанию не создаёт конфликтов.
+    """
+    file_number = 1
+    for result in results:
+        if not result["pdf_path"]:
+            continue
+        current_path = result["pdf_path"]
+        final_path = os.path.join(Config.SERVICE_DIR, f"{file_number:03d}_{os.path.basename(current_path)[4:]}")
+        if final_path != current_path:
+            os.replace(current_path, final_path)
+            log(f"Перенумерован: {os.path.basename(current_path)} → {os.path.basename(final_path)}", level="DEBUG")
+        result["pdf_path"] = final_path
+        file_number += 1
+
+
+def _iter_local_exports(jobs, renderer_name, workers, renderer_options):
+    """Экспорт заданий jobs рендерерами текущего запуска. Возвращает генератор результатов или None."""
+    if workers <= 1 or len(jobs) <= 1:
+        renderer = create_renderer(renderer_name, **renderer_options)
+        if not renderer.start():
+            return None
+
+        def run_sequential():
             try:
-                os.remove(pdf_path)
-                log(f"Удален PDF с несоответствием страниц: {os.path.basename(pdf_path)}")
-            except OSError as e:
-                log(f"Не удалось удалить PDF с несоответствием страниц '{os.path.basename(pdf_path)}': {e} (Код ошибки: {e.winerror})",
-                    level="WARNING")
-            return None, 0
-        else:
-            log(f"✅ Проверка страниц: Ожидалось {expected_pages}, фактически {actual_pages}. Совпадает.", level="INFO")
+                for file_number, filename, job_verify in jobs:
+                    yield render_workbook(renderer, file_number, filename, job_verify)
+            finally:
+                renderer.stop()
+        return run_sequential()
+
+    def run_pool():
+        pool_workers = min(workers, len(jobs))
+        log(f"Экспорт в {pool_workers} процессах (рендерер: {renderer_name})")
+        # spawn: у каждого процесса собственный интерпретатор и собственная COM-апартамента
+        pool = multiprocessing.get_context("spawn").Pool(
+            processes=pool_workers,
+            initializer=_export_worker_init,
+            initargs=(renderer_name, renderer_options, Config.export_state())
+        )
+        try:
+            for result in pool.imap(_export_worker_run, jobs):
+                if result["log"]:
+                    print(result["log"], end="")
+                record_events(result.pop("trace", None))
+                yield result
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return run_pool()
 
-        return pdf_path, actual_pages
-    except Exception as e:
-        log(f"❗ Общая ошибка при экспорте '{os.path.basename(full_path)}' в PDF: {e}", level="ERROR")
-        return None, 0
-    finally:
-        _close_excel_workbook(wb)
+
+def _connect_renderer_service(renderer_name, renderer_options):
+    """Подключается к службе рендерера, если она запущена с тем же рендерером и параметрами."""
+    if Config.RENDERER_SERVICE == "never":
+        return None
+    client = renderer_service.connect()
+    if client is None:
+        return None
+    if client.info.get("renderer") != renderer_name or client.info.get("renderer_options", {}) != renderer_options:
+        log(f"Служба рендерера запущена с другим рендерером ({client.info.get('renderer')}), экспорт без неё",
+            level="DEBUG")
+        client.close()
+        return None
+    return client
+
+
+def iter_export_workbooks(filenames, renderer_name, workers=1, renderer_options=None, verify=True):
+    """
+    Запускает экспорт книг Excel в PDF (папка Service) с помощью workers изолированных рендереров
+    или запущенной службы рендерера (renderer_service). Возвращает генератор результатов в порядке
+    filenames (файлы получают предварительные номера NNN_ по позиции в filenames) или None, если
+    рендерер не удалось запустить. Рендерер останавливается, когда генератор исчерпан или закрыт.
+    """
+    renderer_options = renderer_options or {}
+    jobs = [(file_number, filename, verify) for file_number, filename in enumerate(filenames, start=1)]
+
+    client = _connect_renderer_service(renderer_name, renderer_options)
+    if client is None:
+        return _iter_local_exports(jobs, renderer_name, workers, renderer_options)
+
+    def run_service():
+        log(f"Экспорт через службу рендерера (рендерер: {renderer_name}, "
+            f"процессов: {client.info.get('workers')}, PID {client.info.get('pid')})")
+        done = 0
+        try:
+            for result in client.export(Config.export_state(), jobs):
+                if result["log"]:
+                    print(result["log"], end="")
+                record_events(result.pop("trace", None))
+                done += 1
+                yield result
+            return
+        except (OSError, EOFError) as e:
+            log(f"Служба рендерера недоступна ({type(e).__name__}: {e}), оставшиеся файлы экспортируются без неё",
+                level="WARNING")
+        finally:
+            client.close()
+
+        remaining = jobs[done:]
+        results = _iter_local_exports(remaining, renderer_name, workers, renderer_options)
+        if results is None:
+            log(f"Рендерер '{renderer_name}' не запущен, файлы пропущены: {len(remaining)}", level="ERROR")
+            results = ({"file_number": file_number, "filename": filename, "pdf_path": None, "pages": 0,
+                        "error": True} for file_number, filename, _ in remaining)
+        yield from results
+    return run_service()
+
+
+@traced("export_workbooks", path_arg=None)
+def export_workbooks(filenames, renderer_name, workers=1, renderer_options=None):
+    """
+    Экспортирует книги Excel в PDF (папка Service) с помощью workers изолированных рендереров.
+    Результаты и их лог выдаются в порядке filenames независимо от количества процессов;
+    итоговая нумерация NNN_ совпадает с последовательным экспортом.
+    Возвращает список результатов или None, если рендерер не удалось запустить.
+    """
+    results = iter_export_workbooks(filenames, renderer_name, workers, renderer_options)
+    if results is None:
+        return None
+    results = list(results)
+    _renumber_service_pdfs(results)
+    return results
+
+
+# --- 3. Функции обработки PDF (PDF Processing Functions) ---
+
+MERGE_MODES = ("full", "title", "notitle")
+
+
+def _merge_page_indices(num_pages, mode):
+    """Возвращает индексы страниц исходного файла, которые попадают в объединение данного режима."""
+    if mode == 'full':
+        return range(num_pages)
+    elif mode == 'title':
+        return range(min(1, num_pages))
+    elif mode == 'notitle':
+        return range(1, num_pages)
+    raise ValueError(f"Неизвестный режим объединения PDF: {mode}")
+
+
+# Во сколько раз объекты PyPDF2 в памяти превышают размер исходных файлов (грубая оценка)
+_IN_MEMORY_MERGE_OVERHEAD = 3
+
+
+def _use_streaming_merge(pdf_files, outputs):
+    """Определяет, нужно ли объединять потоково: по настройке или по оценке памяти для PdfWriter."""
+    if Config.MERGE_STREAMING in ("always", "never"):
+        return Config.MERGE_STREAMING == "always"
+    input_bytes = sum(os.path.getsize(f) for f in pdf_files if os.path.exists(f))
+    estimated_mb = input_bytes * len(outputs) * _IN_MEMORY_MERGE_OVERHEAD / (1024 * 1024)
+    return estimated_mb > Config.MERGE_MEMORY_LIMIT_MB
+
+
+# Писатели, которые пишут в файл по мере добавления страниц (и удаляют его при прерывании)
+_STREAMING_WRITERS = (StreamingPdfWriter, ShardedPdfWriter)
+
+
+def _shard_budget(mode):
+    """Бюджет частей объединения режима [страниц, байтов] или None, если оно не делится."""
+    if mode not in Config.MERGE_SHARD_MODES or not (Config.MERGE_SHARD_MAX_PAGES or Config.MERGE_SHARD_MAX_MB):
+        return None
+    return [Config.MERGE_SHARD_MAX_PAGES, Config.MERGE_SHARD_MAX_MB * 1024 * 1024]
+
+
+def _linearize_enabled():
+    """Линеаризация включена настройкой и доступна (установлен pikepdf)."""
+    return Config.LINEARIZE and pdf_linearize.is_available()
+
+
+def _warn_linearize_unavailable():
+    if Config.LINEARIZE and not pdf_linearize.is_available():
+        log("Линеаризация PDF недоступна: не установлен pikepdf. Файлы записываются без линеаризации.",
+            level="WARNING")
+
+
+def linearize_output(path, name=None):
+    """
+    Линеаризует записанный PDF на месте и проверяет таблицы подсказок (см. pdf_linearize).
+    name — имя файла для лога. Возвращает True при успехе; при ошибке файл остаётся нелинеаризованным.
+    """
+    name = name or os.path.basename(path)
+    try:
+        with span("linearize", file=name):
+            params = pdf_linearize.linearize_pdf(path)
+    except (pdf_linearize.LinearizationError, OSError) as e:
+        log(f"❗ Не удалось линеаризовать '{name}', файл оставлен без линеаризации: {e}", level="ERROR")
+        return False
+    log(f"Линеаризован: {name} (первая страница — первые {params['E'] / 1024:.0f} КБ "
+        f"из {params['L'] / 1024:.0f} КБ)", level="DEBUG")
+    return True
 
 
-# --- 3. Функции обработки PDF (PDF Processing Functions) ---
+def _linearize_shard(path, final_path):
+    linearize_output(path, os.path.basename(final_path))
 
-def merge_pdfs(pdf_files, output_file, mode='full'):
-    """Объединяет несколько PDF-файлов в один."""
-    writer = PdfWriter()
-    successful_merges = 0
-    total_expected_pages = 0
 
-    log(f"Начинаю объединение PDF файлов в режиме '{mode}' для '{os.path.basename(output_file)}'...")
+def _log_shard_ready(path, pages):
+    log(f"Часть готова к печати: {os.path.basename(path)} (страниц: {pages})")
 
-    try:
-        for pdf_file in pdf_files:
-            is_valid, num_pages = is_pdf_valid(pdf_file)
-            if not is_valid:
-                log(f"Невалидный PDF файл, пропущен при объединении: {os.path.basename(pdf_file)}", level="WARNING")
-                continue
 
-            try:
-                with open(pdf_file, "rb") as f:
-                    reader = PdfReader(f)
-
-                    pages_to_add = []
-                    current_file_expected_pages = 0
-
-                    if mode == 'full':
-                        pages_to_add = reader.pages
-                        current_file_expected_pages = num_pages
-                    elif mode == 'title':
-                        pages_to_add = [reader.pages[0]] if reader.pages else []
-                        current_file_expected_pages = 1 if num_pages > 0 else 0
-                    elif mode == 'notitle':
-                        pages_to_add = reader.pages[1:]
-                        current_file_expected_pages = max(0, num_pages - 1)
-                    else:
-                        raise ValueError(f"Неизвестный режим объединения PDF: {mode}")
+@traced("merge_pdfs", path_arg=None)
+def merge_pdfs_multi(pdf_files, outputs, stats=None):
+    """
+    Объединяет PDF-файлы сразу в несколько выходных файлов за один проход:
+    каждый исходный файл открывается и разбирается один раз, его страницы
+    распределяются по писателям всех режимов.
+    outputs — словарь {режим: путь к выходному файлу}.
+    Если передан словарь stats, в него записываются режим записи (streaming), пиковая память (peak_memory_mb),
+    результат устранения повторов (duplicate_streams, dedup_bytes_saved) и части объединений (shards).
+    Возвращает словарь {режим: (успех, фактическое количество страниц)}.
+    """
+    for mode in outputs:
+        _merge_page_indices(0, mode)  # проверка режима до начала работы
 
-                    for page in pages_to_add:
-                        writer.add_page(page)
+    streaming = _use_streaming_merge(pdf_files, outputs)
+    results = {mode: (False, 0) for mode in outputs}
+    log(f"Начинаю объединение PDF файлов за один проход ({'потоковая запись' if streaming else 'в памяти'}): "
+        f"{', '.join(os.path.basename(f) for f in outputs.values())}...")
 
-                    log(f"Добавлен файл '{os.path.basename(pdf_file)}' ({mode} режим). Ожидалось страниц: {current_file_expected_pages}")
-                    total_expected_pages += current_file_expected_pages
-                    successful_merges += 1
-            except pypdf_errors.PdfReadError as e:
-                log(f"Ошибка чтения PDF файла '{os.path.basename(pdf_file)}', пропущен: {e}", level="ERROR")
-            except Exception as e:
-                log(f"Непредвиденная ошибка при обработке '{os.path.basename(pdf_file)}', пропущен: {e}", level="ERROR")
+    merge = None
+    with MemoryPeakMonitor() as monitor:
+        try:
+            merge = IncrementalMerge(outputs, streaming)
+            for pdf_file in pdf_files:
+                merge.add(pdf_file)
+            results = merge.finish()
+        except Exception as e:
+            log(f"❗ Общая ошибка при объединении PDF: {e}", level="ERROR")
+            if merge:
+                merge.abort()
+
+    log(f"Пиковая память процесса при объединении: {monitor.peak_mb} МБ (прирост {monitor.growth_mb} МБ)")
+    if stats is not None:
+        dedup_stats = merge.dedup_stats if merge else new_dedup_stats()
+        stats["streaming"] = streaming
+        stats["peak_memory_mb"] = monitor.peak_mb
+        stats["memory_growth_mb"] = monitor.growth_mb
+        stats["duplicate_streams"] = dedup_stats["duplicate_streams"]
+        stats["dedup_bytes_saved"] = dedup_stats["bytes_saved"]
+        stats["shards"] = merge.shards if merge else {}
+    return results
+
+
+class IncrementalMerge:
+    """
+    Объединение PDF сразу в несколько выходных файлов ({режим: путь}), в которое исходные файлы
+    добавляются по одному, по мере готовности (add). finish() записывает выходные файлы и проверяет
+    количество страниц; счётчики устранённых повторов всех выходных файлов суммируются в dedup_stats.
+    Режимы с бюджетом частей (_shard_budget) всегда пишутся потоково частями _partNN; при publish_shards=True
+    заполненная часть получает итоговое имя сразу, иначе — только в finish() (если режим записывается).
+    Имена записанных частей — в shards ({режим: [имена]}).
+    """
 
-        if writer.pages and successful_merges > 0:
-            with open(output_file, "wb") as f:
-                writer.write(f)
+    def __init__(self, outputs, streaming, publish_shards=True):
+        self.outputs = outputs
+        self.streaming = streaming
+        self.shards = {}
+        self.dedup_stats = new_dedup_stats()
+        self.expected_pages = {mode: 0 for mode in outputs}
+        self.successful_merges = 0
+        # PdfWriter запоминает скопированные объекты по id() читателя: если читатель будет удалён сборщиком
+        # мусора, новый читатель может получить тот же id и страницы другого файла получат чужие ресурсы.
+        # Поэтому для записи в памяти читатели хранятся до записи выходных файлов.
+        self._readers_in_use = []
+        self.writers = {}
+        try:
+            for mode, output_file in outputs.items():
+                budget = _shard_budget(mode)
+                if budget:
+                    self.writers[mode] = ShardedPdfWriter(
+                        output_file, *budget, dedup=Config.MERGE_DEDUP, publish=publish_shards,
+                        on_shard=_log_shard_ready, finalize=_linearize_shard if _linearize_enabled() else None)
+                elif streaming:
+                    self.writers[mode] = StreamingPdfWriter(output_file, Config.MERGE_DEDUP)
+                else:
+                    self.writers[mode] = PdfWriter()
+        except Exception:
+            self.abort()
+            raise
+
+    def add(self, pdf_file, fingerprint=False):
+        """
+        Добавляет страницы файла во все выходные файлы. Невалидные файлы пропускаются с записью в лог.
+        При fingerprint=True по тому же разбору файла вычисляет отпечатки страниц для манифеста
+        и возвращает (отпечаток титульной страницы, отпечаток остальных страниц); иначе или при ошибке — (None, None).
+        """
+        reader, num_pages = read_valid_pdf(pdf_file)
+        if reader is None:
+            log(f"Невалидный PDF файл, пропущен при объединении: {os.path.basename(pdf_file)}", level="WARNING")
+            return None, None
+        if not self.streaming:
+            self._readers_in_use.append(reader)
+
+        try:
+            added = {}
+            with span("merge.add_pages", file=os.path.basename(pdf_file)):
+                for mode, writer in self.writers.items():
+                    indices = _merge_page_indices(num_pages, mode)
+                    if isinstance(writer, ShardedPdfWriter):
+                        # бюджет байтов: доля размера исходного файла, приходящаяся на страницы режима
+                        writer.add_pages(reader, indices, os.path.getsize(pdf_file) * len(indices) // max(num_pages, 1))
+                    elif isinstance(writer, StreamingPdfWriter):
+                        writer.add_pages(reader, indices)
+                    else:
+                        for i in indices:
+                            writer.add_page(reader.pages[i])
+                    added[mode] = len(indices)
+
+            for mode, count in added.items():
+                self.expected_pages[mode] += count
+            self.successful_merges += 1
+            log(f"Добавлен файл '{os.path.basename(pdf_file)}'. Ожидалось страниц: "
+                + ", ".join(f"{mode}: {count}" for mode, count in added.items()), level="DEBUG")
+        except pypdf_errors.PdfReadError as e:
+            log(f"Ошибка чтения PDF файла '{os.path.basename(pdf_file)}', пропущен: {e}", level="ERROR")
+        except Exception as e:
+            log(f"Непредвиденная ошибка при обработке '{os.path.basename(pdf_file)}', пропущен: {e}", level="ERROR")
 
-            is_output_valid, actual_output_pages = is_pdf_valid(output_file)
-            if not is_output_valid:
-                log(f"❗ Объединенный PDF '{os.path.basename(output_file)}' не прошел валидацию.", level="ERROR")
-                return False
+        if not fingerprint:
+            return None, None
+        try:
+            return reader_page_fingerprints(reader)
+        except Exception as e:
+            log(f"Не удалось вычислить отпечатки страниц '{os.path.basename(pdf_file)}': {e}", level="WARNING")
+            return None, None
+
+    def finish(self, modes=None):
+        """
+        Записывает выходные файлы режимов modes (по умолчанию — всех); остальные отбрасываются.
+        Возвращает словарь {режим: (успех, фактическое количество страниц)} для записанных режимов.
+        """
+        modes = list(self.outputs) if modes is None else modes
+        results = {}
+        for mode in list(self.writers):
+            writer = self.writers.pop(mode)  # страницы режима освобождаются сразу после записи
+            if mode in modes:
+                results[mode] = _write_merged_pdf(writer, self.outputs[mode], mode, self.expected_pages[mode],
+                                                  self.successful_merges, self.dedup_stats)
+                if isinstance(writer, ShardedPdfWriter):
+                    self.shards[mode] = [os.path.basename(path) for path in writer.shards]
+            elif isinstance(writer, _STREAMING_WRITERS):
+                writer.abort()
+        self._readers_in_use.clear()
+        return results
+
+    def abort(self):
+        """Прерывает объединение; незавершённые выходные файлы удаляются."""
+        for writer in self.writers.values():
+            if isinstance(writer, _STREAMING_WRITERS):
+                writer.abort()
+        self.writers.clear()
+        self._readers_in_use.clear()
+
+
+def _write_merged_pdf(writer, output_file, mode, total_expected_pages, successful_merges, dedup_stats=None):
+    """
+    Записывает объединенный PDF (или все его части), при Config.LINEARIZE линеаризует его
+    и проверяет количество страниц. Возвращает (успех, количество страниц).
+    """
+    try:
+        if writer.pages and successful_merges > 0:
+            with span("merge.write", file=os.path.basename(output_file)):
+                if isinstance(writer, _STREAMING_WRITERS):
+                    writer.close()
+                    writer_dedup_stats = writer.dedup_stats if writer.dedup else None
+                else:
+                    writer_dedup_stats = deduplicate_writer(writer) if Config.MERGE_DEDUP else None
+                    with open(output_file, "wb") as f:
+                        writer.write(f)
+
+            if writer_dedup_stats is not None:
+                log(f"Устранено повторяющихся потоков (шрифты, изображения) в '{os.path.basename(output_file)}': "
+                    f"{writer_dedup_stats['duplicate_streams']}, "
+                    f"сэкономлено {writer_dedup_stats['bytes_saved'] / (1024 * 1024):.1f} МБ")
+                if dedup_stats is not None:
+                    for key, value in writer_dedup_stats.items():
+                        dedup_stats[key] += value
+
+            if isinstance(writer, ShardedPdfWriter):
+                output_files = writer.shards
+                log(f"Объединение '{os.path.basename(output_file)}' записано частями: "
+                    f"{', '.join(os.path.basename(path) for path in output_files)}")
+            else:
+                output_files = [output_file]
+                for name in remove_stale_shards(output_file, keep=output_files):
+                    log(f"Удалена часть прошлого запуска: {name}", level="DEBUG")
+
+            if _linearize_enabled():
+                # части линеаризуются до публикации; здесь повторяется только не удавшаяся линеаризация
+                for path in output_files:
+                    if not pdf_linearize.is_linearized(path) and not linearize_output(path):
+                        return False, 0
+
+            actual_output_pages = 0
+            for path in output_files:
+                is_output_valid, pages = is_pdf_valid(path)
+                if not is_output_valid:
+                    log(f"❗ Объединенный PDF '{os.path.basename(path)}' не прошел валидацию.", level="ERROR")
+                    return False, 0
+                actual_output_pages += pages
 
             if actual_output_pages != total_expected_pages:
                 log(f"❗ НЕСООТВЕТСТВИЕ СТРАНИЦ в объединенном '{os.path.basename(output_file)}': Ожидалось {total_expected_pages}, фактически {actual_output_pages}.",
                     level="ERROR")
-                return False
+                return False, actual_output_pages
             else:
                 log(f"✅ Проверка страниц объединенного файла: Ожидалось {total_expected_pages}, фактически {actual_output_pages}. Совпадает.",
                     level="INFO")
-                log(f"✅ Успешно собран файл: {os.path.basename(output_file)}")
-            return True
+                log(f"✅ Успешно собран файл: {os.path.basename(output_file)} (режим: {mode})")
+            return True, actual_output_pages
         else:
+            if isinstance(writer, _STREAMING_WRITERS):
+                writer.abort()
             log(f"Нечего объединять или все исходные PDF были невалидны. Файл '{os.path.basename(output_file)}' не создан.",
                 level="WARNING")
-            return False
+            return False, 0
 
     except Exception as e:
+        if isinstance(writer, _STREAMING_WRITERS):
+            writer.abort()
         log(f"❗ Общая ошибка при объединении PDF в '{output_file}': {e}", level="ERROR")
-        return False
+        return False, 0
+
+
+def merge_pdfs(pdf_files, output_file, mode='full'):
+    """Объединяет несколько PDF-файлов в один."""
+    success, _ = merge_pdfs_multi(pdf_files, {mode: output_file})[mode]
+    return success
 
 
+@traced("replace_first_page")
 def replace_first_page(source_pdf_path, new_first_page_object, output_pdf_path, original_pages_count):
-    """Заменяет первую страницу PDF-файла новой страницей."""
+    """
+    Заменяет первую страницу PDF-файла новой страницей.
+    При Config.TITLE_REPLACEMENT = "append" исходный файл копируется без изменений и дополняется
+    разделом добавочного обновления; файлы, которые так обновить нельзя, переписываются целиком.
+    При Config.LINEARIZE файл всегда переписывается целиком и линеаризуется (добавочное обновление
+    нарушило бы линеаризацию).
+    """
     try:
         is_valid, num_pages = is_pdf_valid(source_pdf_path)
         if not is_valid:
@@ -390,17 +1562,35 @@ def replace_first_page(source_pdf_path, new_first_page_object, output_pdf_path,
                 level="ERROR")
             return False
 
-        reader = PdfReader(source_pdf_path)
-        writer = PdfWriter()
-
-        writer.add_page(new_first_page_object)
-
-        if len(reader.pages) > 1:
-            for i in range(1, len(reader.pages)):
-                writer.add_page(reader.pages[i])
+        appended = False
+        linearize = _linearize_enabled()
+        if Config.TITLE_REPLACEMENT == "append" and not linearize:
+            with open(source_pdf_path, "rb") as source:
+                try:
+                    appended_bytes = append_title_page(source_pdf_path, PdfReader(source), new_first_page_object,
+                                                       output_pdf_path)
+                    appended = True
+                    log(f"Титульник '{os.path.basename(output_pdf_path)}' дописан добавочным обновлением "
+                        f"({appended_bytes} байт)", level="DEBUG")
+                except IncrementalUpdateError as e:
+                    log(f"Добавочное обновление '{os.path.basename(source_pdf_path)}' невозможно ({e}), "
+                        f"файл будет переписан целиком", level="DEBUG")
+
+        if not appended:
+            reader = PdfReader(source_pdf_path)
+            writer = PdfWriter()
+
+            writer.add_page(new_first_page_object)
+
+            if len(reader.pages) > 1:
+                for i in range(1, len(reader.pages)):
+                    writer.add_page(reader.pages[i])
+
+            with open(output_pdf_path, 'wb') as f:
+                writer.write(f)
 
-        with open(output_pdf_path, 'wb') as f:
-            writer.write(f)
+        if linearize and not linearize_output(output_pdf_path):
+            return False
 
         is_output_valid, actual_output_pages = is_pdf_valid(output_pdf_path)
         if not is_output_valid:
@@ -416,7 +1606,7 @@ def replace_first_page(source_pdf_path, new_first_page_object, output_pdf_path,
             return False
         else:
             log(f"✅ Проверка страниц после замены титульника: Ожидалось {expected_output_pages}, фактически {actual_output_pages}. Совпадает.",
-                level="INFO")
+                level="DEBUG")
             log(f"✅ Обновлён файл: {os.path.basename(output_pdf_path)}")
         return True
     except pypdf_errors.PdfReadError as e:
@@ -428,8 +1618,138 @@ def replace_first_page(source_pdf_path, new_first_page_object, output_pdf_path,
         return False
 
 
+# --- 3.1. Пул процессов замены титульников (Title Replacement Worker Pool) ---
+
+_worker_scan_readers = {}
+
+
+@traced("postprint.file", path_arg=2)
+def replace_title_page(scan_pages, index, filename):
+    """
+    Заменяет титульник файла filename из папки Service страницей scan_pages[index]
+    (index None — страницы сканов для файла нет) и записывает результат в папку Final.
+    Возвращает словарь с полями index, filename и outcome: "ok", "invalid_original", "no_scan_page" или "error".
+    """
+    input_path = os.path.join(Config.SERVICE_DIR, filename)
+    result = {"index": index, "filename": filename, "outcome": "error"}
+
+    is_original_valid, original_pages_count = is_pdf_valid(input_path)
+    if not is_original_valid:
+        log(f"Исходный PDF '{os.path.basename(input_path)}' невалиден, пропущен при замене титульника.",
+            level="ERROR")
+        result["outcome"] = "invalid_original"
+        return result
+
+    if index is None or index >= len(scan_pages):
+        log(f"⚠️ Для файла '{filename}' отсутствует соответствующая страница в файлах сканов титульников. Пропущен.",
+            level="WARNING")
+        result["outcome"] = "no_scan_page"
+        return result
+
+    output_path = os.path.join(Config.FINAL_OUTPUT_DIR, filename[4:])
+    if replace_first_page(input_path, scan_pages[index], output_path, original_pages_count):
+        result["outcome"] = "ok"
+    return result
+
+
+def _run_title_job(job, readers):
+    """Выполняет задание (файл, файл сканов, номер страницы); файлы сканов открываются один раз в readers."""
+    filename, scan_path, index = job
+    if scan_path is None:
+        return replace_title_page([], None, filename)
+    if scan_path not in readers:
+        readers[scan_path] = PdfReader(scan_path)
+    return replace_title_page(readers[scan_path].pages, index, filename)
+
+
+def _postprint_worker_init(config_state):
+    """Инициализация рабочего процесса: настройки; файлы сканов открываются при первом обращении."""
+    Config.apply_state(config_state)
+    _worker_scan_readers.clear()
+
+
+def _postprint_worker_run(job):
+    """Выполняет замену титульника в рабочем процессе; лог перехватывается и возвращается вместе с результатом."""
+    filename, _, index = job
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), activate(Tracer() if Config.TRACE else None) as tracer:
+        try:
+            result = _run_title_job(job, _worker_scan_readers)
+        except Exception as e:
+            log(f"❗ Общая ошибка при замене первой страницы в '{filename}': {e}", level="ERROR")
+            result = {"index": index, "filename": filename, "outcome": "error"}
+    result["log"] = output.getvalue()
+    result["trace"] = tracer.events if tracer else None
+    return result
+
+
+def replace_title_pages(jobs, workers=1):
+    """
+    Выполняет задания замены титульников (файл Service, файл сканов, номер страницы сканов) с помощью
+    workers процессов; файл сканов None — страницы для файла нет. Каждый процесс открывает файлы сканов сам.
+    Результаты и их лог выдаются в порядке jobs независимо от количества процессов.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        readers = {}
+        return [_run_title_job(job, readers) for job in jobs]
+
+    workers = min(workers, len(jobs))
+    log(f"Замена титульников в {workers} процессах")
+    results = []
+    pool = multiprocessing.get_context("spawn").Pool(
+        processes=workers,
+        initializer=_postprint_worker_init,
+        initargs=(Config.export_state(),)
+    )
+    try:
+        for result in pool.imap(_postprint_worker_run, jobs):
+            if result["log"]:
+                print(result["log"], end="")
+            record_events(result.pop("trace", None))
+            results.append(result)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
 # --- 4. Основные рабочие процессы (Core Workflow Functions) ---
 
+def _run_traced(process_name, process_func):
+    """
+    Выполняет процесс; при Config.TRACE записывает интервалы этапов, добавляет в сводку таблицу "stages"
+    ({этап: {"count", "wall_sec", "cpu_sec"}}) и сохраняет trace_<process_name>.json в папке Service.
+    """
+    if not Config.TRACE:
+        return process_func()
+
+    tracer = Tracer()
+    with activate(tracer):
+        with span(process_name):
+            summary = process_func()
+
+    summary["stages"] = tracer.stage_table()
+    trace_path = os.path.join(Config.SERVICE_DIR, f"trace_{process_name}.json")
+    try:
+        os.makedirs(Config.SERVICE_DIR, exist_ok=True)
+        tracer.write_chrome_trace(trace_path)
+        summary["trace_file"] = trace_path
+    except OSError as e:
+        log(f"Не удалось записать файл трассировки '{trace_path}': {e}", level="WARNING")
+
+    log("\n--- ВРЕМЯ ПО ЭТАПАМ ---")
+    log(f"{'Этап':<28}{'Вызовов':>9}{'Время, с':>12}{'ЦП, с':>10}")
+    for name, row in summary["stages"].items():
+        log(f"{name:<28}{row['count']:>9}{row['wall_sec']:>12.3f}{row['cpu_sec']:>10.3f}")
+    if "trace_file" in summary:
+        log(f"Трассировка сохранена: {trace_path}")
+    log("--- КОНЕЦ ТАБЛИЦЫ ЭТАПОВ ---")
+    return summary
+
+
 def process_preprint_task():
     """Задача предварительной обработки для запуска в отдельном потоке."""
     try:
@@ -452,11 +1772,141 @@ def process_postprint_task():
         log_queue.put("PROCESS_COMPLETE")
 
 
+def _plan_incremental_export(excel_files, manifest):
+    """
+    Сравнивает файлы Excel с манифестом предыдущего запуска.
+    Возвращает (файлы для экспорта, {файл: документ для повторного использования}, устаревшие записи манифеста).
+    Книга используется повторно, если не изменились её содержимое и количество исключаемых листов,
+    а созданный ранее PDF на месте и содержит то же количество страниц.
+    """
+    previous = manifest["documents"]
+    # .xlsm при конвертации перезаписывает одноимённый .xlsx, поэтому такой .xlsx не экспортируется отдельно
+    xlsm_targets = {os.path.splitext(f)[0] + ".xlsx" for f in excel_files if f.lower().endswith(".xlsm")}
+    to_export = []
+    reused = {}
+
+    for filename in excel_files:
+        if filename in xlsm_targets:
+            log(f"Файл '{filename}' будет заменён результатом конвертации одноимённого XLSM.", level="WARNING")
+            continue
+        entry = previous.get(filename)
+        if entry is None:
+            to_export.append(filename)
+            continue
+
+        base_filename = os.path.splitext(filename)[0]
+        sha256 = file_sha256(os.path.join(Config.EXCEL_INPUT_DIR, filename))
+        pdf_path = os.path.join(Config.SERVICE_DIR, entry["service_pdf"])
+        if (sha256 != entry["sha256"] or entry["exclude_count"] != get_exclude_count(base_filename)
+                or not os.path.exists(pdf_path)):
+            to_export.append(filename)
+            continue
+
+        is_valid, pages = is_pdf_valid(pdf_path)
+        if not is_valid or pages != entry["pages"]:
+            to_export.append(filename)
+            continue
+
+        reused[filename] = {"source": filename, "sha256": sha256, "exclude_count": entry["exclude_count"],
+                            "pdf_path": pdf_path, "pages": pages,
+                            "title_hash": entry["title_hash"], "body_hash": entry["body_hash"]}
+
+    stale_entries = [entry for name, entry in previous.items() if name not in reused]
+    return to_export, reused, stale_entries
+
+
+def _remove_stale_outputs(stale_entries):
+    """Удаляет PDF устаревших записей манифеста из Service и NotSignedExport."""
+    for entry in stale_entries:
+        for path in (os.path.join(Config.SERVICE_DIR, entry["service_pdf"]),
+                     os.path.join(Config.EXPORT_DIR, entry["service_pdf"][4:])):
+            if os.path.exists(path):
+                os.remove(path)
+                log(f"Удален устаревший файл: {os.path.basename(path)}", level="DEBUG")
+
+
+def _merged_output_pages(paths):
+    """Суммарное количество страниц объединения из файлов paths или None, если файл отсутствует или невалиден."""
+    total = 0
+    for path in paths:
+        is_valid, pages = is_pdf_valid(path) if os.path.exists(path) else (False, 0)
+        if not is_valid:
+            return None
+        total += pages
+    return total
+
+
+def _exported_document(result):
+    """
+    Формирует описание документа для манифеста по результату экспорта. Отпечатки страниц заполняются
+    при добавлении PDF в объединения (IncrementalMerge.add), чтобы файл не разбирался ещё раз.
+    """
+    source_path = result["source_path"]
+    source = os.path.basename(source_path)
+    return {"source": source, "sha256": file_sha256(source_path),
+            "exclude_count": get_exclude_count(os.path.splitext(source)[0]),
+            "pdf_path": result["pdf_path"], "pages": result["pages"],
+            "title_hash": None, "body_hash": None}
+
+
+def _apply_service_numbering(documents):
+    """
+    Присваивает PDF документов в Service сплошную нумерацию NNN_ в порядке documents.
+    Переименование выполняется в два этапа, чтобы старые и новые имена не пересекались.
+    """
+    moves = []
+    for file_number, doc in enumerate(documents, start=1):
+        current_path = doc["pdf_path"]
+        final_path = os.path.join(Config.SERVICE_DIR, f"{file_number:03d}_{os.path.basename(current_path)[4:]}")
+        if final_path != current_path:
+            temp_path = current_path + ".renumber"
+            os.replace(current_path, temp_path)
+            moves.append((doc, current_path, temp_path, final_path))
+    for doc, current_path, temp_path, final_path in moves:
+        os.replace(temp_path, final_path)
+        doc["pdf_path"] = final_path
+        log(f"Перенумерован: {os.path.basename(current_path)} → {os.path.basename(final_path)}", level="DEBUG")
+
+
 def process_preprint():
+    """Этап 'Подготовить к печати' (см. _process_preprint) с трассировкой этапов при Config.TRACE."""
+    return _run_traced("preprint", _process_preprint)
+
+
+def _process_preprint():
     """
     Основная логика предварительной обработки:
     конвертация XLSM в XLSX, экспорт XLSX в PDF и объединение PDF.
+    При Config.INCREMENTAL экспортируются только новые и изменённые книги (по манифесту
+    предыдущего запуска) и пересобираются только затронутые объединения.
+    Возвращает словарь сводки; поле "status": "ok", "errors", "failed" или "empty" (нет файлов).
     """
+    summary = {
+        "status": "failed",
+        "incremental": False,
+        "excel_files_found": 0,
+        "excel_files_processed_to_pdf": 0,
+        "excel_files_reused": 0,
+        "stale_outputs_removed": 0,
+        "total_excel_pages_expected": 0,
+        "total_pdf_exported_pages": 0,
+        "pdf_export_errors": 0,
+        "plan_errors": 0,
+        "plan_warnings": 0,
+        "merge_success_complete": False,
+        "merge_success_title": False,
+        "merge_success_notitle": False,
+        "merges_reused": 0,
+        "merge_streaming": False,
+        "merge_peak_memory_mb": 0,
+        "merge_dedup_bytes_saved": 0,
+        "merge_shards": {},
+        "linearized": False,
+        "total_merged_pages_complete": 0,
+        "total_merged_pages_title": 0,
+        "total_merged_pages_notitle": 0,
+    }
+
     # Инициализация директорий
     # Папка EXCEL_INPUT_DIR не должна очищаться
     dirs_to_create_and_clear = [
@@ -472,144 +1922,254 @@ def process_preprint():
             os.makedirs(Config.EXCEL_INPUT_DIR)
         except Exception as e:
             log(f"Ошибка при создании папки Excel: {e}. Процесс остановлен.", level="CRITICAL")
-            return
+            return summary
+
+    manifest_path = os.path.join(Config.SERVICE_DIR, Config.MANIFEST_FILE)
+    manifest = None
+    if Config.INCREMENTAL:
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            log("Манифест предыдущего запуска не найден или повреждён. Выполняется полная обработка.", level="WARNING")
+        elif manifest["renderer"] != Config.RENDERER:
+            log(f"Рендерер изменился ({manifest['renderer']} → {Config.RENDERER}). Выполняется полная обработка.",
+                level="WARNING")
+            manifest = None
+        elif manifest.get("renderer_options", {}) != Config.RENDERER_OPTIONS:
+            log("Параметры рендерера изменились. Выполняется полная обработка.", level="WARNING")
+            manifest = None
+    summary["incremental"] = manifest is not None
+    _warn_linearize_unavailable()
+    summary["linearized"] = _linearize_enabled()
 
     for d in dirs_to_create_and_clear:
         try:
-            ensure_and_clear_folder(d)
+            if manifest is not None:
+                os.makedirs(d, exist_ok=True)
+            else:
+                ensure_and_clear_folder(d)
         except Exception:
             log(f"Ошибка при подготовке папки {os.path.basename(d)}. Процесс остановлен.", level="CRITICAL")
-            return
+            return summary
 
-    excel_app = None
-    summary = {
-        "excel_files_found": 0,
-        "excel_files_processed_to_pdf": 0,
-        "total_excel_pages_expected": 0,
-        "total_pdf_exported_pages": 0,
-        "pdf_export_errors": 0,
-        "merge_success_complete": False,
-        "merge_success_title": False,
-        "merge_success_notitle": False,
-        "total_merged_pages_complete": 0,
-        "total_merged_pages_title": 0,
-        "total_merged_pages_notitle": 0,
-    }
+    pdf_index = get_pdf_index()
+    if pdf_index:
+        try:
+            pdf_index.forget_missing()
+        except sqlite3.Error as e:
+            log(f"Ошибка очистки индекса PDF: {e}", level="WARNING")
 
     try:
-        pythoncom.CoInitialize()
-
-        if not is_excel_installed():
-            log("Microsoft Excel не установлен или не найден. Установите Excel и попробуйте снова.", level="CRITICAL")
-            return
-
-        excel_app = win32com.client.Dispatch("Excel.Application")
-        excel_app.DisplayAlerts = False
-        excel_app.Visible = False
-
-        excel_files_to_process = sorted([
-            f for f in os.listdir(Config.EXCEL_INPUT_DIR)
-            if f.lower().endswith((".xlsx", ".xlsm", ".xls"))
-        ])
+        excel_files_to_process = find_excel_files()
         summary["excel_files_found"] = len(excel_files_to_process)
 
         if not excel_files_to_process:
             log("В папке 'Excel' не найдено файлов для обработки.", level="INFO")
-            return
-
-        processed_pdf_paths = []
-        pdf_pages_info = {}
-        file_counter = 1
-
-        log("\n--- Начало экспорта Excel в PDF ---")
-        for filename in excel_files_to_process:
-            full_path = os.path.join(Config.EXCEL_INPUT_DIR, filename)
-            base_filename, ext = os.path.splitext(filename)
-            current_file_path = full_path
-
-            if ext.lower() == ".xlsm":
-                converted_path = convert_xlsm_to_xlsx(excel_app, full_path, base_filename)
-                if converted_path:
-                    current_file_path = converted_path
-                    ext = ".xlsx"
-                else:
-                    log(f"Пропущен файл '{filename}' из-за ошибки конвертации.", level="ERROR")
+            summary["status"] = "empty"
+            return summary
+
+        # План по архивам книг: проблемы видны до запуска Excel, заведомо пустые книги не открываются
+        plan = plan_preprint(excel_files_to_process)
+        log_preprint_plan(plan, level="DEBUG")
+        summary["plan_errors"] = plan["errors"]
+        summary["plan_warnings"] = plan["warnings"]
+        skipped = {entry["source"] for entry in plan["documents"] if entry["skip"]}
+
+        reused_documents = {}
+        files_to_export = excel_files_to_process
+        if manifest is not None:
+            log("\n--- Сравнение с предыдущим запуском ---")
+            files_to_export, reused_documents, stale_entries = _plan_incremental_export(excel_files_to_process,
+                                                                                       manifest)
+            summary["excel_files_reused"] = len(reused_documents)
+            summary["stale_outputs_removed"] = len(stale_entries)
+            log(f"Без изменений: {len(reused_documents)}, к экспорту: {len(files_to_export)}, "
+                f"устаревших результатов: {len(stale_entries)}")
+            _remove_stale_outputs(stale_entries)
+
+        if skipped:
+            for filename in files_to_export:
+                if filename in skipped:
+                    log(f"Пропущен файл '{filename}': по плану нет листов для экспорта.", level="WARNING")
                     summary["pdf_export_errors"] += 1
-                    continue
-
-            if ext.lower() in [".xlsx", ".xls"]:
-                pdf_path, pages_count = export_excel_to_pdf(excel_app, current_file_path,
-                                                            os.path.splitext(os.path.basename(current_file_path))[0],
-                                                            file_counter)
-
-                if pdf_path:
-                    processed_pdf_paths.append(pdf_path)
-                    pdf_pages_info[pdf_path] = pages_count
-                    summary["total_excel_pages_expected"] += pages_count
-                    summary["total_pdf_exported_pages"] += pages_count
-                    summary["excel_files_processed_to_pdf"] += 1
-                    file_counter += 1
-
+            files_to_export = [filename for filename in files_to_export if filename not in skipped]
+
+        if files_to_export:
+            renderer_cls = RENDERERS.get(Config.RENDERER)
+            if renderer_cls is None:
+                log(f"Неизвестный рендерер: {Config.RENDERER}. Доступны: {', '.join(sorted(RENDERERS))}",
+                    level="CRITICAL")
+                return summary
+            if not renderer_cls.is_available():
+                log(renderer_cls.unavailable_message, level="CRITICAL")
+                return summary
+
+        merge_outputs = {
+            "full": os.path.join(Config.PRINT_DIR, "complete_merged.pdf"),
+            "title": os.path.join(Config.PRINT_DIR, "title_merged.pdf"),
+            "notitle": os.path.join(Config.PRINT_DIR, "no_title_merged.pdf"),
+        }
+
+        with contextlib.ExitStack() as merge_stack:
+            # Объединения собираются по мере экспорта. Если экспортировать нечего, они могут не измениться,
+            # и решение принимается после сравнения отпечатков (ниже).
+            merge = None
+            merge_monitor = None
+            exports = None
+            if files_to_export:
+                merge_monitor = merge_stack.enter_context(MemoryPeakMonitor())
+                # При сравнении с манифестом часть объединений может не понадобиться: их части
+                # не должны заменять файлы прошлого запуска до решения о пересборке
+                merge = IncrementalMerge(merge_outputs, streaming=Config.MERGE_STREAMING != "never",
+                                         publish_shards=manifest is None)
+                merge_stack.callback(merge.abort)  # после finish() прерывать уже нечего
+
+                log("\n--- Начало экспорта Excel в PDF ---")
+                exports = iter_export_workbooks(files_to_export, Config.RENDERER, Config.EXPORT_WORKERS,
+                                                Config.RENDERER_OPTIONS, verify=False)
+                if exports is None:
+                    log("Не удалось запустить рендерер. Процесс остановлен.", level="CRITICAL")
+                    return summary
+                merge_stack.callback(exports.close)
+
+            def pipeline_items():
+                """Документы в порядке файлов Excel: используемые повторно и результаты экспорта."""
+                export_set = set(files_to_export)
+                for filename in excel_files_to_process:
+                    if filename in reused_documents:
+                        yield "reused", reused_documents[filename]
+                    elif filename in export_set:
+                        yield "exported", next(exports)
+
+            def verify_stage(item):
+                """Проверка экспортированного PDF и описание документа для манифеста."""
+                kind, value = item
+                if kind == "reused":
+                    return value
+                if value["pdf_path"] and not value["verified"]:
+                    pdf_path, pages = verify_exported_pdf(value["pdf_path"], value["pages"])
+                    value.update(pdf_path=pdf_path, pages=pages, verified=True, error=pdf_path is None)
+                if not value["pdf_path"]:
+                    if value["error"]:
+                        summary["pdf_export_errors"] += 1
+                    return None
+                summary["excel_files_processed_to_pdf"] += 1
+                return _exported_document(value)
+
+            def deliver_stage(doc):
+                """Копирование в NotSignedExport и добавление в объединения (с отпечатками страниц для манифеста)."""
+                if doc["source"] not in reused_documents:
+                    pdf_path = doc["pdf_path"]
                     try:
                         dest_filename = os.path.basename(pdf_path)[4:]
                         shutil.copy(pdf_path, os.path.join(Config.EXPORT_DIR, dest_filename))
-                        log(f"Скопирован в NotSignedExport: {dest_filename}")
+                        log(f"Скопирован в NotSignedExport: {dest_filename}", level="DEBUG")
                     except Exception as e:
-                        log(f"Ошибка копирования '{os.path.basename(pdf_path)}' в NotSignedExport: {e}", level="ERROR")
-                else:
-                    summary["pdf_export_errors"] += 1
-            else:
-                log(f"Пропущен файл с неподдерживаемым расширением: {filename}", level="WARNING")
+                        log(f"Ошибка копирования '{os.path.basename(pdf_path)}' в NotSignedExport: {e}",
+                            level="ERROR")
+                if merge:
+                    fingerprints = merge.add(doc["pdf_path"], fingerprint=doc["source"] not in reused_documents)
+                    if doc["source"] not in reused_documents:
+                        doc["title_hash"], doc["body_hash"] = fingerprints
+                return doc
+
+            # Итоговый порядок документов совпадает с порядком файлов Excel, как при полном экспорте
+            documents = run_pipeline(pipeline_items(), [verify_stage, deliver_stage],
+                                     queue_size=Config.PIPELINE_QUEUE_SIZE, threaded=Config.PREPRINT_PIPELINE)
+            _apply_service_numbering(documents)
+
+            for doc in documents:
+                summary["total_excel_pages_expected"] += doc["pages"]
+                summary["total_pdf_exported_pages"] += doc["pages"]
+
+            if not documents:
+                log("Нет успешно обработанных PDF файлов для объединения.", level="WARNING")
+                return summary
+
+            service_pdfs_full_paths = [doc["pdf_path"] for doc in documents]
+
+            total_pages_for_full_merge = sum(doc["pages"] for doc in documents)
+            total_pages_for_title_merge = len(documents)
+            total_pages_for_notitle_merge = total_pages_for_full_merge - total_pages_for_title_merge
+            expected_merge_pages = {"full": total_pages_for_full_merge, "title": total_pages_for_title_merge,
+                                    "notitle": total_pages_for_notitle_merge}
+
+            fingerprinted = all(doc["title_hash"] and doc["body_hash"] for doc in documents)
+            signatures = merge_signatures(documents) if fingerprinted else {}
+            previous_merges = manifest["merges"] if manifest is not None else {}
+
+            merge_results = {}
+            outputs_to_build = {}
+            for mode, output_file in merge_outputs.items():
+                previous_merge = previous_merges.get(mode)
+                if (previous_merge and signatures and previous_merge["signature"] == signatures[mode]
+                        and previous_merge.get("shard_budget") == _shard_budget(mode)
+                        and previous_merge.get("linearized", False) == _linearize_enabled()):
+                    previous_files = previous_merge.get("shards") or [os.path.basename(output_file)]
+                    merged_pages = _merged_output_pages([os.path.join(Config.PRINT_DIR, name)
+                                                         for name in previous_files])
+                    if merged_pages == expected_merge_pages[mode]:
+                        log(f"Объединение не изменилось, пересборка не требуется: {', '.join(previous_files)}")
+                        merge_results[mode] = (True, merged_pages)
+                        if previous_merge.get("shards"):
+                            summary["merge_shards"][mode] = previous_merge["shards"]
+                        summary["merges_reused"] += 1
+                        continue
+                outputs_to_build[mode] = output_file
+
+            if outputs_to_build:
+                log(f"\n--- Объединение: complete_merged.pdf (ожидается страниц: {total_pages_for_full_merge}), "
+                    f"title_merged.pdf (ожидается страниц: {total_pages_for_title_merge}), "
+                    f"no_title_merged.pdf (ожидается страниц: {total_pages_for_notitle_merge}) ---")
+            if merge:
+                merge_results.update(merge.finish(outputs_to_build))
+                summary["merge_shards"].update(merge.shards)
+                merge_stack.close()
+                log(f"Пиковая память процесса при подготовке и объединении: {merge_monitor.peak_mb} МБ "
+                    f"(прирост {merge_monitor.growth_mb} МБ)")
+                summary["merge_streaming"] = merge.streaming
+                summary["merge_peak_memory_mb"] = merge_monitor.peak_mb
+                summary["merge_dedup_bytes_saved"] = merge.dedup_stats["bytes_saved"]
+            elif outputs_to_build:
+                merge_stats = {}
+                merge_results.update(merge_pdfs_multi(service_pdfs_full_paths, outputs_to_build, merge_stats))
+                summary["merge_streaming"] = merge_stats.get("streaming", False)
+                summary["merge_peak_memory_mb"] = merge_stats.get("peak_memory_mb", 0)
+                summary["merge_dedup_bytes_saved"] = merge_stats.get("dedup_bytes_saved", 0)
+                summary["merge_shards"].update(merge_stats.get("shards", {}))
+
+        manifest_merges = {}
+        for mode, summary_suffix in (("full", "complete"), ("title", "title"), ("notitle", "notitle")):
+            success, merged_pages = merge_results[mode]
+            if success:
+                summary[f"merge_success_{summary_suffix}"] = True
+                summary[f"total_merged_pages_{summary_suffix}"] = merged_pages
+                if signatures:
+                    manifest_merges[mode] = {"signature": signatures[mode],
+                                             "output": os.path.basename(merge_outputs[mode]),
+                                             "pages": merged_pages,
+                                             "shard_budget": _shard_budget(mode),
+                                             "shards": summary["merge_shards"].get(mode),
+                                             "linearized": _linearize_enabled()}
 
-        if not processed_pdf_paths:
-            log("Нет успешно обработанных PDF файлов для объединения.", level="WARNING")
-            return
+        try:
+            save_manifest(manifest_path, Config.RENDERER, Config.RENDERER_OPTIONS, documents, manifest_merges)
+        except OSError as e:
+            log(f"Не удалось сохранить манифест запуска: {e}", level="WARNING")
 
-        service_pdfs = sorted(
-            [f for f in os.listdir(Config.SERVICE_DIR) if f.lower().endswith(".pdf") and f[:3].isdigit()],
-            key=lambda x: int(x[:3])
-        )
-        service_pdfs_full_paths = [os.path.join(Config.SERVICE_DIR, f) for f in service_pdfs]
-
-        log("\nНачинаю объединение PDF файлов...")
-
-        total_pages_for_full_merge = sum(pdf_pages_info.values())
-        total_pages_for_title_merge = len(processed_pdf_paths)
-        total_pages_for_notitle_merge = total_pages_for_full_merge - total_pages_for_title_merge
-
-        if service_pdfs_full_paths:
-            log(f"\n--- Объединение: complete_merged.pdf (ожидается страниц: {total_pages_for_full_merge}) ---")
-            if merge_pdfs(service_pdfs_full_paths, os.path.join(Config.PRINT_DIR, "complete_merged.pdf"), mode='full'):
-                summary["merge_success_complete"] = True
-                _, summary["total_merged_pages_complete"] = is_pdf_valid(
-                    os.path.join(Config.PRINT_DIR, "complete_merged.pdf"))
-
-            log(f"\n--- Объединение: title_merged.pdf (ожидается страниц: {total_pages_for_title_merge}) ---")
-            if merge_pdfs(service_pdfs_full_paths, os.path.join(Config.PRINT_DIR, "title_merged.pdf"), mode='title'):
-                summary["merge_success_title"] = True
-                _, summary["total_merged_pages_title"] = is_pdf_valid(
-                    os.path.join(Config.PRINT_DIR, "title_merged.pdf"))
-
-            log(f"\n--- Объединение: no_title_merged.pdf (ожидается страниц: {total_pages_for_notitle_merge}) ---")
-            if merge_pdfs(service_pdfs_full_paths, os.path.join(Config.PRINT_DIR, "no_title_merged.pdf"),
-                          mode='notitle'):
-                summary["merge_success_notitle"] = True
-                _, summary["total_merged_pages_notitle"] = is_pdf_valid(
-                    os.path.join(Config.PRINT_DIR, "no_title_merged.pdf"))
-        else:
-            log("Нет валидных PDF файлов в папке Service для объединения.", level="WARNING")
+        all_merged = (summary["merge_success_complete"] and summary["merge_success_title"]
+                      and summary["merge_success_notitle"])
+        summary["status"] = "ok" if all_merged and summary["pdf_export_errors"] == 0 else "errors"
 
-    except pythoncom.com_error as e:
-        log(f"Ошибка COM-объекта (возможно, Excel не установлен или не отвечает): {e}", level="CRITICAL")
     except Exception as e:
         log(f"❗ Общая ошибка в process_preprint: {e}", level="CRITICAL")
     finally:
-        close_excel_app(excel_app)
-
         # --- Сводка по завершении процесса ---
         log("\n--- СВОДКА ПРОЦЕССА 'ПОДГОТОВИТЬ К ПЕЧАТИ' ---")
         log(f"Найдено Excel файлов: {summary['excel_files_found']}")
         log(f"Успешно преобразовано и экспортировано в PDF: {summary['excel_files_processed_to_pdf']} файлов")
+        if summary["incremental"]:
+            log(f"Использовано без повторного экспорта: {summary['excel_files_reused']} файлов")
+            log(f"Удалено устаревших результатов: {summary['stale_outputs_removed']}")
         log(f"Ошибок при экспорте Excel в PDF: {summary['pdf_export_errors']}")
         log(f"Общее ожидаемое кол-во страниц из Excel: {summary['total_excel_pages_expected']}")
         log(f"Общее кол-во страниц в экспортированных PDF (Service): {summary['total_pdf_exported_pages']}")
@@ -618,117 +2178,401 @@ def process_preprint():
         log(f"  complete_merged.pdf: {'✅ Успешно' if summary['merge_success_complete'] else '❌ Ошибка'}. Страниц: {summary['total_merged_pages_complete']}/{total_pages_for_full_merge if 'total_pages_for_full_merge' in locals() else 'N/A'} (фактически/ожидалось)")
         log(f"  title_merged.pdf: {'✅ Успешно' if summary['merge_success_title'] else '❌ Ошибка'}. Страниц: {summary['total_merged_pages_title']}/{total_pages_for_title_merge if 'total_pages_for_title_merge' in locals() else 'N/A'} (фактически/ожидалось)")
         log(f"  no_title_merged.pdf: {'✅ Успешно' if summary['merge_success_notitle'] else '❌ Ошибка'}. Страниц: {summary['total_merged_pages_notitle']}/{total_pages_for_notitle_merge if 'total_pages_for_notitle_merge' in locals() else 'N/A'} (фактически/ожидалось)")
+        if summary["merges_reused"]:
+            log(f"  Объединений без изменений (не пересобирались): {summary['merges_reused']}")
+        for mode, shards in summary["merge_shards"].items():
+            log(f"  Части {os.path.basename(merge_outputs[mode])}: {', '.join(shards)}")
+        if summary["linearized"]:
+            log("  Объединённые PDF записаны линеаризованными (быстрый просмотр в сети).")
+        if summary["merge_peak_memory_mb"]:
+            log(f"  Режим записи: {'потоковый' if summary['merge_streaming'] else 'в памяти'}. "
+                f"Пиковая память процесса: {summary['merge_peak_memory_mb']} МБ")
+        if Config.MERGE_DEDUP:
+            log(f"  Сэкономлено устранением повторяющихся шрифтов и изображений: "
+                f"{summary['merge_dedup_bytes_saved'] / (1024 * 1024):.1f} МБ")
         log("--- КОНЕЦ СВОДКИ ---")
 
+    return summary
+
+
+_TITLE_SCAN_NUMBERS = re.compile(r"(\d+)(?:-(\d+))?")
+
+
+def find_title_scan_files():
+    """
+    Возвращает файлы сканов титульников от старых к новым: Config.TITLE_SCAN_PDF и файлы <имя>_*.pdf
+    рядом с ним (title_scan_001-020.pdf, title_scan_wave2.pdf). Подписанные титульники приходят частями;
+    если титульник есть в нескольких файлах, используется страница из более нового.
+    """
+    directory = os.path.dirname(Config.TITLE_SCAN_PDF)
+    main_name = os.path.basename(Config.TITLE_SCAN_PDF)
+    prefix = os.path.splitext(main_name)[0].lower() + "_"
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    paths = [os.path.join(directory, name) for name in names
+             if name == main_name or (name.lower().startswith(prefix) and name.lower().endswith(".pdf"))]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), os.path.basename(path)))
+
+
+def title_scan_documents(scan_path, numbered_pdfs):
+    """
+    Возвращает файлы Service, титульники которых содержит файл сканов scan_path, и способ сопоставления:
+    - Config.TITLE_SCAN_PDF — все файлы по порядку страниц ("positional");
+    - <имя>_<номера>.pdf — файлы с этими номерами по порядку страниц ("positional"): title_scan_001-020.pdf,
+      title_scan_003_007.pdf, title_scan_001-005,009.pdf;
+    - другое имя (title_scan_wave2.pdf) — любые из файлов, только по изображению титульников ("image").
+    """
+    if os.path.abspath(scan_path) == os.path.abspath(Config.TITLE_SCAN_PDF):
+        return numbered_pdfs, "positional"
+    prefix_length = len(os.path.splitext(os.path.basename(Config.TITLE_SCAN_PDF))[0]) + 1
+    numbers = set()
+    for token in re.split(r"[_,]", os.path.splitext(os.path.basename(scan_path))[0][prefix_length:]):
+        match = _TITLE_SCAN_NUMBERS.fullmatch(token)
+        if not match:
+            return numbered_pdfs, "image"
+        first = int(match.group(1))
+        numbers.update(range(first, int(match.group(2) or first) + 1))
+    return [f for f in numbered_pdfs if int(f[:3]) in numbers], "positional"
+
+
+def _prepare_title_scan(scan_path, summary):
+    """
+    Возвращает путь к файлу сканов для замены титульников. При Config.SCAN_OPTIMIZE один раз пережимает
+    изображения файла сканов в копию в папке Service; при ошибке используется исходный файл.
+    """
+    scan_name = os.path.basename(scan_path)
+    if not Config.SCAN_OPTIMIZE:
+        return scan_path
+    if not scan_optimizer.is_available():
+        log(f"Пережатие сканов недоступно: не установлен Pillow. Используется исходный '{scan_name}'.",
+            level="WARNING")
+        return scan_path
+
+    optimized_path = os.path.join(Config.SERVICE_DIR,
+                                  os.path.splitext(scan_name)[0] + Config.SCAN_OPTIMIZED_SUFFIX + ".pdf")
+    log(f"Пережатие сканов '{scan_name}': {Config.SCAN_TARGET_DPI} dpi, режим цвета '{Config.SCAN_COLOR_MODE}'...")
+    try:
+        with span("optimize_title_scan"):
+            stats = scan_optimizer.optimize_title_scan(scan_path, optimized_path, Config.SCAN_TARGET_DPI,
+                                                       Config.SCAN_COLOR_MODE, Config.SCAN_JPEG_QUALITY)
+    except Exception as e:
+        log(f"Не удалось пережать '{scan_name}', используется исходный файл: {e}", level="WARNING")
+        return scan_path
+
+    summary["scan_optimized"] = True
+    summary["scan_bytes_before"] += stats["bytes_before"]
+    summary["scan_bytes_after"] += stats["bytes_after"]
+    log(f"Пережато изображений: {stats['images_recompressed']}. Размер сканов: "
+        f"{stats['bytes_before'] / (1024 * 1024):.1f} МБ → {stats['bytes_after'] / (1024 * 1024):.1f} МБ")
+    return optimized_path
+
 
 def process_postprint():
+    """Этап 'Заменить титульники' (см. _process_postprint) с трассировкой этапов при Config.TRACE."""
+    return _run_traced("postprint", _process_postprint)
+
+
+def _match_title_scans(scan_path, numbered_pdfs, method, scan_pages_count, summary):
+    """
+    Сопоставляет страницы файла сканов scan_path с файлами numbered_pdfs (method — см. title_scan_documents)
+    и выводит отчёт о перестановках до записи в папку Final. По изображению титульников сопоставляет
+    при Config.TITLE_MATCHING = "auto", иначе по порядку страниц; файл "image" без сопоставления по
+    изображению не используется. Возвращает номер страницы сканов для каждого файла (None — страницы нет).
+    """
+    scan_name = os.path.basename(scan_path)
+    positional = [index if index < scan_pages_count else None for index in range(len(numbered_pdfs))]
+    if Config.TITLE_MATCHING != "auto" or not title_match.is_available():
+        reason = ("не установлены NumPy и PyMuPDF" if Config.TITLE_MATCHING == "auto"
+                  else "отключено (--title-matching positional)")
+        if method == "image":
+            log(f"❗ Файл сканов '{scan_name}' без номеров файлов в имени сопоставляется только по изображению, "
+                f"а оно {reason}. Файл пропущен.", level="WARNING")
+            return [None] * len(numbered_pdfs)
+        if Config.TITLE_MATCHING == "auto":
+            log(f"Сопоставление сканов по изображению недоступно ({reason}): "
+                f"титульники из '{scan_name}' заменяются по порядку страниц.", level="WARNING")
+        return positional
+
+    started = time.perf_counter()
+    try:
+        with span("title_match"):
+            result = title_match.match_titles([os.path.join(Config.SERVICE_DIR, f) for f in numbered_pdfs], scan_path,
+                                              positional=method == "positional")
+    except Exception as e:
+        log(f"Не удалось сопоставить сканы '{scan_name}' по изображению: {e}", level="WARNING")
+        return positional if method == "positional" else [None] * len(numbered_pdfs)
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def described(entry):
+        return {"file": numbered_pdfs[entry["document"]], "scan_page": entry["scan_page"] + 1,
+                "distance": entry["distance"], "gain": entry["gain"]}
+
+    scan_indices = result["scan_indices"]
+    # Для файла "image" отсутствие страницы — обычное дело: в нём только часть титульников
+    missing = ([numbered_pdfs[i] for i, scan in enumerate(scan_indices) if scan is None]
+               if method == "positional" else [])
+    summary["title_matching"][scan_name] = {
+        "method": result["method"] if method == "positional" else "image",
+        "reordered": [described(entry) for entry in result["reordered"]],
+        "uncertain": [described(entry) for entry in result["uncertain"]],
+        "files_without_scan": missing,
+        "unused_scan_pages": [page + 1 for page in result["unused_scan_pages"]],
+        "duration_ms": duration_ms,
+    }
+
+    log(f"\n--- СОПОСТАВЛЕНИЕ ТИТУЛЬНИКОВ: {scan_name} ---")
+    if result["method"] == "hash":
+        log(f"Сканы сопоставлены с файлами по изображению титульников за {duration_ms} мс.")
+    else:
+        log("Порядок сканов не удалось уверенно подтвердить по изображению: титульники заменяются по порядку страниц.",
+            level="WARNING")
+    for entry in result["reordered"]:
+        positional_page = (f"страница {entry['document'] + 1}" if entry["document"] < scan_pages_count
+                           else "страницы нет")
+        log(f"Страница сканов {entry['scan_page'] + 1} → '{numbered_pdfs[entry['document']]}' "
+            f"(по порядку — {positional_page})", level="WARNING")
+    for entry in result["uncertain"]:
+        log(f"❗ Сомнительная пара: страница сканов {entry['scan_page'] + 1} → '{numbered_pdfs[entry['document']]}' "
+            f"(различие {entry['distance']:.0%}). Проверьте титульник.", level="WARNING")
+    for filename in missing:
+        log(f"Для файла '{filename}' нет страницы сканов.", level="WARNING")
+    for page in result["unused_scan_pages"]:
+        log(f"Страница сканов {page + 1} не подошла ни к одному файлу.", level="WARNING")
+    if not (result["reordered"] or result["uncertain"] or missing or result["unused_scan_pages"]):
+        log("Все страницы сканов сопоставлены с файлами.")
+    log("--- КОНЕЦ СОПОСТАВЛЕНИЯ ---")
+    return scan_indices
+
+
+def _confirm_title_count(scan_name, scan_pages_count, files_count):
+    """
+    Спрашивает, продолжать ли при несовпадении количества страниц сканов и файлов
+    (в GUI — диалогом, иначе по Config.TITLE_MISMATCH_POLICY). Возвращает True, если продолжать.
+    """
+    msg = (
+        f"Количество отсканированных титульных страниц в '{scan_name}' ({scan_pages_count}) "
+        f"не соответствует количеству файлов для замены ({files_count}).\n\n"
+        "Вы хотите продолжить? (Несоответствующие файлы будут пропущены)"
+    )
+    log(f"ПРЕДУПРЕЖДЕНИЕ: {msg.replace('\n', ' ')}", level="WARNING")
+
+    if Config.TITLE_MISMATCH_POLICY == "ask":
+        log_queue.put({"type": "ask_user_yn", "title": "Несоответствие количества титульников", "message": msg})
+        user_response_str = gui_response_queue.get()
+    else:
+        log(f"Решение по несоответствию без запроса пользователю: {Config.TITLE_MISMATCH_POLICY}")
+        user_response_str = "ok" if Config.TITLE_MISMATCH_POLICY == "continue" else "cancel"
+    return user_response_str == "ok"
+
+
+def _remove_stale_final_files(previous_documents, numbered_pdfs):
+    """Удаляет из папки Final файлы, собранные из PDF, которых больше нет в папке Service."""
+    current = {f[4:] for f in numbered_pdfs}
+    for filename, entry in previous_documents.items():
+        final_path = os.path.join(Config.FINAL_OUTPUT_DIR, entry["final_pdf"])
+        if filename not in numbered_pdfs and entry["final_pdf"] not in current and os.path.exists(final_path):
+            os.remove(final_path)
+            log(f"Удалён устаревший файл Final: {entry['final_pdf']}")
+
+
+def _process_postprint():
     """
     Основная логика постобработки:
     замена титульных страниц в PDF-файлах отсканированными титульниками.
+    Сканы могут приходить частями (см. find_title_scan_files). При Config.INCREMENTAL по записи
+    предыдущего запуска пересобираются только файлы с новым или изменённым титульником или PDF в Service.
+    Возвращает словарь сводки; поле "status": "ok", "errors", "failed" или "cancelled".
     """
     log("Начало этапа 'Заменить титульники'.")
 
     summary = {
+        "status": "failed",
         "title_scan_pages": 0,
+        "scan_files": [],
         "numbered_pdfs_found": 0,
+        "incremental": False,
         "files_processed_successfully": 0,
+        "files_up_to_date": 0,
+        "files_awaiting_scan": 0,
         "files_skipped_no_scan_page": 0,
         "files_skipped_invalid_original": 0,
-        "total_errors_during_replacement": 0
+        "scan_files_invalid": 0,
+        "total_errors_during_replacement": 0,
+        "scan_optimized": False,
+        "scan_bytes_before": 0,
+        "scan_bytes_after": 0,
+        "linearized": False,
+        "title_matching": {}
     }
+    _warn_linearize_unavailable()
+    summary["linearized"] = _linearize_enabled()
 
-    is_scan_valid, num_scanned_pages = is_pdf_valid(Config.TITLE_SCAN_PDF)
-    summary["title_scan_pages"] = num_scanned_pages
-
-    if not is_scan_valid:
-        log(f"❗ Файл 'title_scan.pdf' не найден или невалиден в папке '{Config.PRINT_DIR}'. Пожалуйста, отсканируйте и положите его туда.",
-            level="ERROR")
+    scan_files = find_title_scan_files()
+    if not scan_files:
+        log(f"❗ Файл 'title_scan.pdf' не найден в папке '{Config.PRINT_DIR}'. Пожалуйста, отсканируйте и положите его туда "
+            "(сканы, пришедшие частями, — в файлы title_scan_<номера файлов>.pdf).", level="ERROR")
         log_queue.put(
-            f"ERROR: Файл 'title_scan.pdf' не найден или невалиден в папке '{Config.PRINT_DIR}'. Пожалуйста, отсканируйте и положите его туда.")
-        return
+            f"ERROR: Файл 'title_scan.pdf' не найден в папке '{Config.PRINT_DIR}'. Пожалуйста, отсканируйте и положите его туда.")
+        return summary
 
-    title_scan_file_handle = None
     try:
-        title_scan_file_handle = open(Config.TITLE_SCAN_PDF, "rb")
-        title_reader = PdfReader(title_scan_file_handle)
-        scanned_pages_objects = title_reader.pages
-        log(f"Загружен 'title_scan.pdf', количество страниц: {num_scanned_pages}")
-
-        ensure_and_clear_folder(Config.FINAL_OUTPUT_DIR, is_output_folder=True)
-
-        numbered_pdfs = sorted([
-            f for f in os.listdir(Config.SERVICE_DIR)
-            if f.lower().endswith(".pdf") and f[:3].isdigit() and "_" in f
-        ], key=lambda x: int(x[:3]))
-        summary["numbered_pdfs_found"] = len(numbered_pdfs)
-
-        if not numbered_pdfs:
-            log("В папке 'Service' не найдено пронумерованных PDF файлов для обработки. Запустите 'Подготовить к печати' сначала.",
-                level="WARNING")
-            log_queue.put(
-                "WARNING: В папке 'Service' не найдено пронумерованных PDF файлов для обработки. Запустите 'Подготовить к печати' сначала.")
-            return
-
-        if num_scanned_pages != len(numbered_pdfs):
-            msg = (
-                f"Количество отсканированных титульных страниц ({num_scanned_pages}) "
-                f"не соответствует количеству файлов для замены ({len(numbered_pdfs)}).\n\n"
-                "Вы хотите продолжить? (Несоответствующие файлы будут пропущены)"
-            )
-            log(f"ПРЕДУПРЕЖДЕНИЕ: {msg.replace('\n', ' ')}", level="WARNING")
-
-            log_queue.put({"type": "ask_user_yn", "title": "Несоответствие количества титульников", "message": msg})
-
-            user_response_str = gui_response_queue.get()
-
-            if user_response_str != "ok":
-                log("Пользователь отменил операцию из-за несоответствия количества.", level="INFO")
-                return
+        with contextlib.ExitStack() as scan_handles:
+            numbered_pdfs = sorted([
+                f for f in os.listdir(Config.SERVICE_DIR)
+                if f.lower().endswith(".pdf") and f[:3].isdigit() and "_" in f
+            ], key=lambda x: int(x[:3]))
+            summary["numbered_pdfs_found"] = len(numbered_pdfs)
+
+            if not numbered_pdfs:
+                log("В папке 'Service' не найдено пронумерованных PDF файлов для обработки. Запустите 'Подготовить к печати' сначала.",
+                    level="WARNING")
+                log_queue.put(
+                    "WARNING: В папке 'Service' не найдено пронумерованных PDF файлов для обработки. Запустите 'Подготовить к печати' сначала.")
+                return summary
+
+            record_path = os.path.join(Config.SERVICE_DIR, Config.POSTPRINT_RECORD_FILE)
+            record = None
+            if Config.INCREMENTAL:
+                record = load_manifest(record_path)
+                if record is None:
+                    log("Запись предыдущей замены титульников не найдена или повреждена. Выполняется полная обработка.",
+                        level="WARNING")
+            summary["incremental"] = record is not None
+            previous_documents = record["documents"] if record else {}
+            previous_scan_files = record["scan_files"] if record else {}
+
+            # Страница сканов для каждого файла; более новые файлы сканов перекрывают более старые
+            assignments = {}
+            covered = set()  # файлы, страница для которых должна была найтись в файле сканов по номерам
+            scan_records = {}
+            for scan_path in scan_files:
+                scan_name = os.path.basename(scan_path)
+                is_scan_valid, scan_pages_count = is_pdf_valid(scan_path)
+                if not is_scan_valid:
+                    log(f"❗ Файл сканов '{scan_name}' невалиден, пропущен.", level="ERROR")
+                    summary["scan_files_invalid"] += 1
+                    continue
+                summary["scan_files"].append(scan_name)
+                summary["title_scan_pages"] += scan_pages_count
+                log(f"Загружен '{scan_name}', количество страниц: {scan_pages_count}")
+
+                documents, method = title_scan_documents(scan_path, numbered_pdfs)
+                if not documents:
+                    log(f"В папке 'Service' нет файлов с номерами из имени '{scan_name}'. Файл сканов пропущен.",
+                        level="WARNING")
+                    continue
+                if (method == "positional" and scan_pages_count != len(documents)
+                        and not _confirm_title_count(scan_name, scan_pages_count, len(documents))):
+                    log("Пользователь отменил операцию из-за несоответствия количества.", level="INFO")
+                    summary["status"] = "cancelled"
+                    return summary
+
+                sha256 = file_sha256(scan_path)
+                previous = previous_scan_files.get(scan_name)
+                if previous and previous["sha256"] == sha256 and previous["documents"] == documents:
+                    scan_indices = previous["scan_indices"]
+                    log(f"Файл сканов '{scan_name}' не изменился: используется прежнее сопоставление.", level="DEBUG")
+                else:
+                    scan_indices = _match_title_scans(scan_path, documents, method, scan_pages_count, summary)
+                scan_records[scan_name] = {"sha256": sha256, "documents": documents, "scan_indices": scan_indices}
+                for filename, index in zip(documents, scan_indices):
+                    if index is not None:
+                        assignments[filename] = (scan_path, index)
+                    if method == "positional":
+                        covered.add(filename)
+
+            # Файл пересобирается, если изменились PDF в Service, файл или страница сканов либо нет файла в Final
+            jobs = []
+            entries = {}
+            scan_readers = {}
+            for filename in numbered_pdfs:
+                if filename not in assignments:
+                    if filename in covered:
+                        jobs.append((filename, None, None))
+                    else:
+                        summary["files_awaiting_scan"] += 1
+                    continue
+                scan_path, index = assignments[filename]
+                if scan_path not in scan_readers:
+                    scan_readers[scan_path] = PdfReader(scan_handles.enter_context(open(scan_path, "rb")))
+                entry = {
+                    "service_sha256": file_sha256(os.path.join(Config.SERVICE_DIR, filename)),
+                    "final_pdf": filename[4:],
+                    "scan_file": os.path.basename(scan_path),
+                    "scan_page": index,
+                    "scan_hash": page_fingerprint(scan_readers[scan_path].pages[index]),
+                }
+                if _linearize_enabled():
+                    entry["linearized"] = True
+                entries[filename] = entry
+                if (previous_documents.get(filename) == entry
+                        and os.path.exists(os.path.join(Config.FINAL_OUTPUT_DIR, entry["final_pdf"]))):
+                    summary["files_up_to_date"] += 1
+                else:
+                    jobs.append((filename, scan_path, index))
 
-        log("\n--- Начало замены титульников ---")
+            if record is not None:
+                os.makedirs(Config.FINAL_OUTPUT_DIR, exist_ok=True)
+                _remove_stale_final_files(previous_documents, numbered_pdfs)
+            else:
+                ensure_and_clear_folder(Config.FINAL_OUTPUT_DIR, is_output_folder=True)
 
-        for i, filename in enumerate(numbered_pdfs):
-            input_path = os.path.join(Config.SERVICE_DIR, filename)
+            prepared_scans = {path: _prepare_title_scan(path, summary)
+                              for path in dict.fromkeys(path for _, path, _ in jobs if path)}
+            jobs = [(filename, prepared_scans.get(path), index) for filename, path, index in jobs]
 
-            is_original_valid, original_pages_count = is_pdf_valid(input_path)
-            if not is_original_valid:
-                log(f"Исходный PDF '{os.path.basename(input_path)}' невалиден, пропущен при замене титульника.",
-                    level="ERROR")
-                summary["files_skipped_invalid_original"] += 1
-                summary["total_errors_during_replacement"] += 1
-                continue
+            built = {filename: entry for filename, entry in entries.items()
+                     if filename not in {job[0] for job in jobs}}
+            if jobs:
+                log(f"\n--- Начало замены титульников (файлов: {len(jobs)}, актуальных: {summary['files_up_to_date']}) ---")
+            else:
+                log("Все файлы в папке Final актуальны: замена титульников не требуется.")
 
-            if i >= num_scanned_pages:
-                log(f"⚠️ Для файла '{filename}' отсутствует соответствующая страница в сканированном 'title_scan.pdf'. Пропущен.",
-                    level="WARNING")
-                summary["files_skipped_no_scan_page"] += 1
+            for result in replace_title_pages(jobs, Config.POSTPRINT_WORKERS):
+                if result["outcome"] == "ok":
+                    summary["files_processed_successfully"] += 1
+                    built[result["filename"]] = entries[result["filename"]]
+                    continue
+                if result["outcome"] == "invalid_original":
+                    summary["files_skipped_invalid_original"] += 1
+                elif result["outcome"] == "no_scan_page":
+                    summary["files_skipped_no_scan_page"] += 1
                 summary["total_errors_during_replacement"] += 1
-                continue
 
-            new_name = filename[4:]
-            output_path = os.path.join(Config.FINAL_OUTPUT_DIR, new_name)
+            try:
+                save_postprint_record(record_path, built, scan_records)
+            except OSError as e:
+                log(f"Не удалось сохранить запись замены титульников: {e}", level="WARNING")
 
-            if replace_first_page(input_path, scanned_pages_objects[i], output_path, original_pages_count):
-                summary["files_processed_successfully"] += 1
-            else:
-                summary["total_errors_during_replacement"] += 1
+            summary["total_errors_during_replacement"] += summary["scan_files_invalid"]
+            summary["status"] = "ok" if summary["total_errors_during_replacement"] == 0 else "errors"
 
     except pypdf_errors.PdfReadError as e:
-        log(f"Ошибка чтения файла 'title_scan.pdf': {e}", level="ERROR")
+        log(f"Ошибка чтения файла сканов титульников: {e}", level="ERROR")
     except Exception as e:
         log(f"Непредвиденная ошибка в process_postprint: {e}", level="CRITICAL")
-    finally:
-        if title_scan_file_handle:
-            title_scan_file_handle.close()
-            log("Файл 'title_scan.pdf' закрыт.")
 
     log("\n--- СВОДКА ПРОЦЕССА 'ЗАМЕНИТЬ ТИТУЛЬНИКИ' ---")
-    log(f"Отсканировано страниц титульников (title_scan.pdf): {summary['title_scan_pages']}")
+    log(f"Файлы сканов: {', '.join(summary['scan_files']) or 'нет'}")
+    log(f"Отсканировано страниц титульников: {summary['title_scan_pages']}")
     log(f"Найдено PDF файлов в Service для обработки: {summary['numbered_pdfs_found']}")
     log(f"Успешно заменено титульников: {summary['files_processed_successfully']}")
+    if summary["incremental"]:
+        log(f"Файлов Final без изменений: {summary['files_up_to_date']}")
+    if summary["files_awaiting_scan"]:
+        log(f"Файлов, для которых сканы ещё не поступили: {summary['files_awaiting_scan']}")
     log(f"Пропущено файлов (нет соответствующей сканированной страницы): {summary['files_skipped_no_scan_page']}")
     log(f"Пропущено файлов (оригинальный PDF невалиден): {summary['files_skipped_invalid_original']}")
+    if summary["scan_files_invalid"]:
+        log(f"Невалидных файлов сканов: {summary['scan_files_invalid']}")
     log(f"Всего ошибок/пропусков во время замены: {summary['total_errors_during_replacement']}")
+    if summary["linearized"]:
+        log("Файлы Final записаны линеаризованными (быстрый просмотр в сети).")
+    if summary["scan_optimized"]:
+        log(f"Размер сканов после пережатия: {summary['scan_bytes_after'] / (1024 * 1024):.1f} МБ "
+            f"(было {summary['scan_bytes_before'] / (1024 * 1024):.1f} МБ)")
 
     if summary["total_errors_during_replacement"] == 0:
         log("✅ Замена титульников завершена без ошибок.", level="INFO")
@@ -736,6 +2580,118 @@ def process_postprint():
         log("❗ Замена титульников завершена с ошибками. Проверьте лог.", level="ERROR")
     log("--- КОНЕЦ СВОДКИ ---")
 
+    return summary
+
+
+# --- 4.1. Режим наблюдения (Watch Mode) ---
+
+def _watch_state():
+    """Снимок отслеживаемых файлов: (книги в папке Excel, файлы сканов титульников)."""
+    scan_files = {}
+    for path in find_title_scan_files():
+        state = folder_watch.file_state(path)
+        if state is not None:
+            scan_files[os.path.basename(path)] = state
+    return folder_watch.snapshot(Config.EXCEL_INPUT_DIR, EXCEL_EXTENSIONS), scan_files
+
+
+def _changed_files(before, after):
+    """Возвращает имена добавленных, изменённых и удалённых файлов."""
+    return sorted(name for name in before.keys() | after.keys() if before.get(name) != after.get(name))
+
+
+def _wait_for_settled_state(watcher, state, baseline):
+    """
+    Ждёт окончания копирования: Config.WATCH_DEBOUNCE_SEC секунд без событий, снимок за это время
+    не изменился, а изменённые файлы открываются на чтение. Возвращает установившийся снимок.
+    """
+    while True:
+        deadline = time.monotonic() + Config.WATCH_DEBOUNCE_SEC
+        while (remaining := deadline - time.monotonic()) > 0:
+            # inotify: каждое событие откладывает запуск; при опросе изменения видны по снимку
+            if watcher.wait(remaining) and watcher.mode == "inotify":
+                deadline = time.monotonic() + Config.WATCH_DEBOUNCE_SEC
+        current = _watch_state()
+        scan_directory = os.path.dirname(Config.TITLE_SCAN_PDF)
+        changed_paths = ([os.path.join(Config.EXCEL_INPUT_DIR, name)
+                          for name in _changed_files(baseline[0], current[0]) if name in current[0]]
+                         + [os.path.join(scan_directory, name)
+                            for name in _changed_files(baseline[1], current[1]) if name in current[1]])
+        if current == state and all(folder_watch.is_readable(path) for path in changed_paths):
+            return current
+        state = current
+
+
+def _absorb_conversions(trigger_files, current_files):
+    """
+    Снимок папки Excel, с которым сравниваются следующие изменения: файлы, вызвавшие запуск,
+    с учётом конвертации (.xlsm заменён одноимённым .xlsx) — собственные изменения запуска
+    не должны вызывать новый запуск, а файлы, скопированные во время запуска, должны.
+    """
+    baseline = dict(trigger_files)
+    for name in trigger_files:
+        xlsx_name = os.path.splitext(name)[0] + ".xlsx"
+        if name.lower().endswith(".xlsm") and name not in current_files and xlsx_name in current_files:
+            del baseline[name]
+            baseline[xlsx_name] = current_files[xlsx_name]
+    return baseline
+
+
+def process_watch(max_runs=0, stop_event=None):
+    """
+    Режим наблюдения: ждёт изменений в папке Excel и файлов сканов и запускает обработку сам.
+    Изменение книг запускает подготовку к печати, новый или изменённый файл сканов (title_scan.pdf,
+    title_scan_*.pdf) — замену титульников; оба процесса инкрементальные.
+    Запуск выполняется после того, как файлы перестали меняться (Config.WATCH_DEBOUNCE_SEC).
+    Работает до Ctrl+C, установки stop_event или выполнения max_runs запусков (0 — без ограничения).
+    Возвращает сводку: "status" ("ok" или "errors", если хотя бы один запуск неуспешен),
+    "watch_mode" ("inotify" или "polling") и "runs" — процесс, причина и статус каждого запуска.
+    """
+    summary = {"status": "ok", "watch_mode": None, "runs": []}
+    Config.INCREMENTAL = True
+    for directory in (Config.EXCEL_INPUT_DIR, os.path.dirname(Config.TITLE_SCAN_PDF)):
+        os.makedirs(directory, exist_ok=True)
+
+    watcher = folder_watch.FolderWatcher([Config.EXCEL_INPUT_DIR, os.path.dirname(Config.TITLE_SCAN_PDF)],
+                                         Config.WATCH_POLL_INTERVAL)
+    summary["watch_mode"] = watcher.mode
+    scan_pattern = os.path.splitext(Config.TITLE_SCAN_PDF)[0] + "*.pdf"
+    log(f"Наблюдение за папкой {Config.EXCEL_INPUT_DIR} и файлами {scan_pattern} "
+        f"(способ: {watcher.mode}). Для остановки нажмите Ctrl+C.")
+    baseline = _watch_state()
+    try:
+        while not (stop_event and stop_event.is_set()) and not (max_runs and len(summary["runs"]) >= max_runs):
+            watcher.wait(Config.WATCH_POLL_INTERVAL)
+            state = _watch_state()
+            if state == baseline:
+                continue
+            state = _wait_for_settled_state(watcher, state, baseline)
+            excel_files, scan_files = state
+
+            changed = _changed_files(baseline[0], excel_files)
+            if changed:
+                log(f"\n▶ Изменились книги ({len(changed)}): {', '.join(changed)}. Запуск подготовки к печати.")
+                result = process_preprint()
+                summary["runs"].append({"process": "preprint", "trigger": changed, "status": result["status"]})
+                log(f"Подготовка к печати завершена: {result['status']}.")
+            new_scans = [name for name in _changed_files(baseline[1], scan_files) if name in scan_files]
+            if new_scans:
+                log(f"\n▶ Обновлены файлы сканов: {', '.join(new_scans)}. Запуск замены титульников.")
+                result = process_postprint()
+                summary["runs"].append({"process": "postprint", "trigger": new_scans, "status": result["status"]})
+                log(f"Замена титульников завершена: {result['status']}.")
+
+            baseline = (_absorb_conversions(excel_files, _watch_state()[0]), scan_files)
+            log("Ожидание изменений...")
+    except KeyboardInterrupt:
+        log("Наблюдение остановлено.")
+    finally:
+        watcher.close()
+
+    if any(run["status"] not in ("ok", "empty") for run in summary["runs"]):
+        summary["status"] = "errors"
+    return summary
+
 
 # --- 5. Функции GUI (GUI Callbacks & Setup) ---
 
@@ -750,72 +2706,55 @@ def start_process_thread(process_func):
     thread.daemon = True
     thread.start()
 
-    if root:
-        root.after(100, update_log_display)
-
 
 def handle_messagebox_response(response):
     """Колбэк функция, которая вызывается после закрытия messagebox."""
     gui_response_queue.put(response)
 
 
+def _flush_log_text(chunks):
+    """Добавляет накопленный текст в виджет лога одной вставкой и оставляет в нём последние строки."""
+    if not chunks or not log_output:
+        return
+    log_output.insert(tk.END, "".join(chunks))
+    line_count = int(log_output.index("end-1c").split(".")[0])
+    excess = line_count - Config.GUI_LOG_MAX_LINES
+    if excess > 0:
+        log_output.delete("1.0", f"{excess + 1}.0")
+    log_output.see(tk.END)
+    chunks.clear()
+
+
 def update_log_display():
-    """Периодически проверяет очередь сообщений и обновляет виджет лога."""
-    while True:
-        try:
-            message = log_queue.get(block=False, timeout=0.01)
+    """
+    Периодически забирает из очереди до Config.GUI_LOG_BATCH сообщений и выводит их в виджет лога.
+    Ошибки классифицируются в RedirectText, в потоке обработки; здесь только показываются диалоги.
+    """
+    chunks = []
+    try:
+        for _ in range(Config.GUI_LOG_BATCH):
+            try:
+                message = log_queue.get_nowait()
+            except queue.Empty:
+                break
 
             if message == "PROCESS_COMPLETE":
                 toggle_buttons_state(tk.NORMAL)
-                if root:
-                    root.after(100, update_log_display)
-                return
-
-            if isinstance(message, dict) and message.get("type") == "ask_user_yn":
-                title = message["title"]
-                msg = message["message"]
+                continue
 
-                root.after(0, lambda t=title, m=msg:
-                handle_messagebox_response(messagebox.showwarning(t, m, type=messagebox.OKCANCEL)))
+            if isinstance(message, dict):
+                _flush_log_text(chunks)
+                if message.get("type") == "ask_user_yn":
+                    root.after(0, lambda t=message["title"], m=message["message"]:
+                    handle_messagebox_response(messagebox.showwarning(t, m, type=messagebox.OKCANCEL)))
+                elif message.get("type") == "show_error":
+                    root.after(0, lambda t=message["title"], m=message["message"]: messagebox.showerror(t, m))
                 continue
 
-            if log_output:
-                log_output.insert(tk.END, message)
-                log_output.see(tk.END)
-
-            # Использование f-строк для более чистого определения ошибок
-            error_patterns = {
-                "Ошибка Excel: Открытие файла": "Не удалось открыть файл Excel",
-                "Ошибка Excel: Конвертация": "Не удалось преобразовать",
-                "Ошибка Excel: Экспорт в PDF": "Не удалось экспортировать",
-                "Ошибка PDF: Объединение": "Не удалось объединить PDF",
-                "Ошибка PDF: Чтение": "Не удалось прочитать PDF файл",
-                "Ошибка PDF: Замена титульника": "Не удалось заменить первую страницу",
-                "Ошибка файловой системы: Директория": "Не удалось создать директорию",
-                "Ошибка файловой системы: Удаление": "Ошибка при удалении",
-                "Ошибка: Excel не найден": "Microsoft Excel не установлен",
-                "Ошибка (CRITICAL)": "Критическая ошибка"
-            }
-
-            match = re.match(r'\[\d{2}:\d{2}:\d{2}\]\s\[(ERROR|CRITICAL)\]\s(.+)', message)
-            if match:
-                level = match.group(1)
-                error_msg_content = match.group(2).strip()
-
-                detected_title = f"Ошибка ({level})"
-                for title_key, pattern in error_patterns.items():
-                    if pattern in error_msg_content:
-                        detected_title = title_key
-                        break
-
-                if root:
-                    root.after(0, lambda t=detected_title, m=error_msg_content: messagebox.showerror(t, m))
-
-        except queue.Empty:
-            break
-        except Exception as e:
-            _original_stdout.write(f"[{time.strftime('%H:%M:%S')}] [CRITICAL] Ошибка в update_log_display: {e}\n")
-            break
+            chunks.append(message)
+        _flush_log_text(chunks)
+    except Exception as e:
+        _original_stdout.write(f"[{time.strftime('%H:%M:%S')}] [CRITICAL] Ошибка в update_log_display: {e}\n")
 
     if root:
         root.after(100, update_log_display)
@@ -846,11 +2785,13 @@ def check_files_in_excel():
         log("В папке 'Excel' нет файлов.", level="INFO")  # После создания, папка пуста
         return
 
-    files = [f for f in os.listdir(Config.EXCEL_INPUT_DIR) if f.lower().endswith((".xlsx", ".xlsm", ".xls"))]
+    files = find_excel_files()
     if files:
         log("Найдены файлы Excel в папке 'Excel':")
-        for f in sorted(files):
+        for f in files:
             log(f"- {f}")
+        # План читается из архивов книг без Excel и занимает доли секунды
+        log_preprint_plan(plan_preprint(files))
     else:
         log("В папке 'Excel' не найдено файлов для обработки (.xlsx, .xlsm, .xls).", level="INFO")
 
@@ -869,50 +2810,55 @@ def run_postprint_threaded():
 
 # --- 6. Настройка и запуск GUI (GUI Setup & Execution) ---
 
-root = tk.Tk()
-root.title("Утилита для подготовки документов")
-root.geometry("800x600")
-root.minsize(700, 500)
-root.config(bg="#f0f0f0")
-root.grid_rowconfigure(1, weight=1)
-root.grid_columnconfigure(0, weight=1)
-root.grid_columnconfigure(1, weight=1)
-
-top_frame = tk.Frame(root, bg="#f0f0f0")
-top_frame.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=10, pady=10)
-top_frame.grid_columnconfigure(0, weight=0)
-top_frame.grid_columnconfigure(1, weight=1)
-top_frame.grid_rowconfigure(0, weight=1)
-
-button_frame = tk.Frame(top_frame, bg="#f0f0f0")
-button_frame.grid(row=0, column=0, sticky="n", pady=(40, 0), padx=(0, 20))
-
-btn_check_excel = tk.Button(button_frame, text="Проверить файлы Excel", command=check_files_in_excel,
-                            bg="#2196F3", fg="white", width=30, height=2,
-                            font=("Arial", 10, "bold"))
-btn_check_excel.grid(row=0, column=0, pady=(0, 15), sticky="w")
-
-btn_preprint = tk.Button(button_frame, text="Подготовить к печати", command=run_preprint_threaded,
-                         bg="#FF9800", fg="white", width=30, height=2,
-                         font=("Arial", 10, "bold"))
-btn_preprint.grid(row=1, column=0, pady=15, sticky="w")
-
-btn_postprint = tk.Button(button_frame, text="Заменить титульники", command=run_postprint_threaded,
-                          bg="#FF5722", fg="white", width=30, height=2,
-                          font=("Arial", 10, "bold"))
-btn_postprint.grid(row=2, column=0, pady=15, sticky="w")
-
-instruction_frame = tk.Frame(top_frame, bg="#f0f0f0", bd=2, relief="groove")
-instruction_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 10), pady=(0, 10))
-instruction_label = tk.Label(instruction_frame, text="Инструкция:", bg="#f0f0f0", font=("Arial", 11, "bold"))
-instruction_label.grid(row=0, column=0, sticky="w", padx=5, pady=5)
-instruction_text = tk.Text(instruction_frame, height=12, wrap="word", bg="#fff", font=("Arial", 10), bd=1,
-                           relief="solid")
-instruction_text.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
-instruction_text.insert(tk.END, """
+def main():
+    """Строит окно приложения и запускает главный цикл Tk."""
+    global root, log_output, btn_check_excel, btn_preprint, btn_postprint
+
+    root = tk.Tk()
+    root.title("Утилита для подготовки документов")
+    root.geometry("800x600")
+    root.minsize(700, 500)
+    root.config(bg="#f0f0f0")
+    root.grid_rowconfigure(1, weight=1)
+    root.grid_columnconfigure(0, weight=1)
+    root.grid_columnconfigure(1, weight=1)
+
+    top_frame = tk.Frame(root, bg="#f0f0f0")
+    top_frame.grid(row=0, column=0, columnspan=2, sticky="nsew", padx=10, pady=10)
+    top_frame.grid_columnconfigure(0, weight=0)
+    top_frame.grid_columnconfigure(1, weight=1)
+    top_frame.grid_rowconfigure(0, weight=1)
+
+    button_frame = tk.Frame(top_frame, bg="#f0f0f0")
+    button_frame.grid(row=0, column=0, sticky="n", pady=(40, 0), padx=(0, 20))
+
+    btn_check_excel = tk.Button(button_frame, text="Проверить файлы Excel", command=check_files_in_excel,
+                                bg="#2196F3", fg="white", width=30, height=2,
+                                font=("Arial", 10, "bold"))
+    btn_check_excel.grid(row=0, column=0, pady=(0, 15), sticky="w")
+
+    btn_preprint = tk.Button(button_frame, text="Подготовить к печати", command=run_preprint_threaded,
+                             bg="#FF9800", fg="white", width=30, height=2,
+                             font=("Arial", 10, "bold"))
+    btn_preprint.grid(row=1, column=0, pady=15, sticky="w")
+
+    btn_postprint = tk.Button(button_frame, text="Заменить титульники", command=run_postprint_threaded,
+                              bg="#FF5722", fg="white", width=30, height=2,
+                              font=("Arial", 10, "bold"))
+    btn_postprint.grid(row=2, column=0, pady=15, sticky="w")
+
+    instruction_frame = tk.Frame(top_frame, bg="#f0f0f0", bd=2, relief="groove")
+    instruction_frame.grid(row=0, column=1, sticky="nsew", padx=(10, 10), pady=(0, 10))
+    instruction_label = tk.Label(instruction_frame, text="Инструкция:", bg="#f0f0f0", font=("Arial", 11, "bold"))
+    instruction_label.grid(row=0, column=0, sticky="w", padx=5, pady=5)
+    instruction_text = tk.Text(instruction_frame, height=12, wrap="word", bg="#fff", font=("Arial", 10), bd=1,
+                               relief="solid")
+    instruction_text.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+    instruction_text.insert(tk.END, """
 1. Загрузите excel-файлы в папку "Excel".
 
-2. Нажмите кнопку "Проверить файлы Excel" и убедитесь что все необходимые файлы найдены.
+2. Нажмите кнопку "Проверить файлы Excel" и убедитесь что все необходимые файлы найдены,
+    а в плане (номера файлов и ожидаемое количество страниц) нет предупреждений.
 
 3. Нажмите кнопку "Подготовить к печати".
     - программа создаст папку Print, в которой будут лежать PDF
@@ -932,32 +2878,48 @@ instruction_text.insert(tk.END, """
 
     ====!ВАЖНО!========!ВАЖНО!========!ВАЖНО!====
     - Название файла со сканами СТРОГО "title_scan"
+    - если подписанные титульники приходят частями, называйте файлы "title_scan_<номера файлов>",
+      например "title_scan_001-020" или "title_scan_021-025,031"
     
 7. Нажмите кнопку "Заменить титульники". Программа поместит результат в папку "Final".  
 """)
-instruction_text.config(state='disabled')
-instruction_frame.grid_rowconfigure(1, weight=1)
-instruction_frame.grid_columnconfigure(0, weight=1)
+    instruction_text.config(state='disabled')
+    instruction_frame.grid_rowconfigure(1, weight=1)
+    instruction_frame.grid_columnconfigure(0, weight=1)
+
+    log_output = scrolledtext.ScrolledText(root, wrap=tk.WORD, bg="#ffffff", fg="#000000", font=("Consolas", 10), bd=2,
+                                           relief="sunken")
+    log_output.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10, pady=(0, 10))
+
+    log_file_writer = None
+    if Config.LOG_FILE:
+        log_file_writer = LogFileWriter(Config.LOG_FILE, Config.LOG_MAX_BYTES, Config.LOG_BACKUP_COUNT,
+                                        Config.LOG_JSON)
+    sys.stdout = RedirectText(log_queue, _original_stdout, log_file_writer)
 
-log_output = scrolledtext.ScrolledText(root, wrap=tk.WORD, bg="#ffffff", fg="#000000", font=("Consolas", 10), bd=2,
-                                       relief="sunken")
-log_output.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10, pady=(0, 10))
+    # Инициализация путей при старте приложения
+    Config.initialize_paths()
 
-sys.stdout = RedirectText(log_queue, _original_stdout)
+    # Первичная проверка и создание папки Excel, если её нет.
+    # Используем ensure_and_clear_folder, но только для создания, не для очистки при первом запуске.
+    if not os.path.exists(Config.EXCEL_INPUT_DIR):
+        try:
+            os.makedirs(Config.EXCEL_INPUT_DIR)
+            log("Папка 'Excel' создана.", level="INFO")
+        except OSError as e:
+            log(f"Не удалось создать папку 'Excel': {e}", level="ERROR")
+            messagebox.showerror("Ошибка создания папки", f"Не удалось создать папку 'Excel': {e}")
 
-# Инициализация путей при старте приложения
-Config.initialize_paths()
+    root.after(100, update_log_display)
 
-# Первичная проверка и создание папки Excel, если её нет.
-# Используем ensure_and_clear_folder, но только для создания, не для очистки при первом запуске.
-if not os.path.exists(Config.EXCEL_INPUT_DIR):
     try:
-        os.makedirs(Config.EXCEL_INPUT_DIR)
-        log("Папка 'Excel' создана.", level="INFO")
-    except OSError as e:
-        log(f"Не удалось создать папку 'Excel': {e}", level="ERROR")
-        messagebox.showerror("Ошибка создания папки", f"Не удалось создать папку 'Excel': {e}")
+        root.mainloop()
+    finally:
+        sys.stdout = _original_stdout
+        if log_file_writer:
+            log_file_writer.close()
 
-root.after(100, update_log_display)
 
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
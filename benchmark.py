@@ -0,0 +1,292 @@
+"""
+Нагрузочные замеры обработки PDF на синтетических данных (без Excel).
+
+    python -m benchmark --scales 10 100 1000 --pages 1-8 --image-kb 50 --scan-kb 300
+
+Для каждого масштаба (количества документов) создаётся рабочая папка с книгами-заглушками;
+'Подготовить к печати' выполняется рендерером fake, который строит PDF с заданным разбросом
+количества страниц и весом изображений. Затем отдельно замеряются проверка PDF (is_pdf_valid)
+без индекса и с индексом, объединение в памяти и потоковое, и 'Заменить титульники' по
+синтетическому title_scan.pdf.
+
+Для каждого сценария записываются время, производительность, пиковая память процесса и размер
+результатов; строки добавляются в файл результатов (JSON Lines), чтобы сравнивать версии.
+Пиковая память измеряется в текущем процессе: при --workers > 1 память рабочих процессов не учитывается.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import DictionaryObject, NameObject, NumberObject, StreamObject
+
+import TechDocExporter
+from TechDocExporter import Config
+from memory_monitor import MemoryPeakMonitor
+
+SCENARIOS = ("preprint", "validate", "merge", "postprint")
+
+
+def _code_version():
+    """Возвращает короткий хэш коммита рабочей копии или "unknown"."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return result.stdout.strip() or "unknown"
+
+
+def _folder_bytes(folder, suffix=".pdf"):
+    if not os.path.isdir(folder):
+        return 0
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+               if name.lower().endswith(suffix))
+
+
+def make_workbooks(excel_dir, count):
+    """Создаёт count книг-заглушек для рендерера fake (содержимое уникально, чтобы различались хэши)."""
+    os.makedirs(excel_dir, exist_ok=True)
+    for i in range(1, count + 1):
+        with open(os.path.join(excel_dir, f"doc_{i:04d}.xlsx"), "wb") as f:
+            f.write(f"synthetic workbook {i}\n".encode())
+
+
+def make_title_scan(path, pages, scan_kb, seed=0):
+    """Создаёт title_scan.pdf из pages страниц с несжимаемым изображением scan_kb КБ на каждой."""
+    rng = random.Random(seed)
+    side = max(1, int((scan_kb * 1024) ** 0.5))
+    writer = PdfWriter()
+    for _ in range(pages):
+        image = StreamObject()
+        image._data = zlib.compress(rng.randbytes(side * side), 1)
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(side),
+            NameObject("/Height"): NumberObject(side),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+        })
+        image_ref = writer._add_object(image)
+        writer.add_blank_page(width=595, height=842)
+        page = writer.pages[-1]
+        content = StreamObject()
+        content._data = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image_ref})
+        })
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+@contextlib.contextmanager
+def _measure(record):
+    """Замеряет время и пиковую память блока и дописывает их в record."""
+    started = time.perf_counter()
+    with MemoryPeakMonitor() as monitor:
+        yield
+    record["wall_sec"] = round(time.perf_counter() - started, 3)
+    record["peak_memory_mb"] = monitor.peak_mb
+    record["memory_growth_mb"] = monitor.growth_mb
+
+
+def _throughput(record, key, count):
+    record[key] = round(count / record["wall_sec"], 2) if record["wall_sec"] else None
+
+
+def _service_pdfs():
+    return sorted(os.path.join(Config.SERVICE_DIR, name) for name in os.listdir(Config.SERVICE_DIR)
+                  if name.lower().endswith(".pdf") and name[:3].isdigit())
+
+
+def bench_preprint(args, scale):
+    record = {"scenario": "preprint"}
+    with _measure(record):
+        summary = TechDocExporter.process_preprint()
+    record.update({
+        "status": summary["status"],
+        "documents": summary["excel_files_processed_to_pdf"],
+        "pages": summary["total_pdf_exported_pages"],
+        "output_bytes": _folder_bytes(Config.PRINT_DIR),
+    })
+    _throughput(record, "documents_per_sec", scale)
+    _throughput(record, "pages_per_sec", summary["total_pdf_exported_pages"])
+    return [record]
+
+
+def bench_validate(args, scale):
+    pdf_files = _service_pdfs()
+    records = []
+    index_path = os.path.join(Config.SERVICE_DIR, Config.PDF_INDEX_FILE)
+    for variant, index_enabled in (("no_index", False), ("index_cold", True), ("index_warm", True)):
+        Config.PDF_INDEX_ENABLED = index_enabled
+        if variant == "index_cold":
+            TechDocExporter.get_pdf_index().close()
+            TechDocExporter._pdf_indexes.clear()
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                if os.path.exists(index_path + suffix):
+                    os.remove(index_path + suffix)
+        record = {"scenario": f"validate[{variant}]"}
+        with _measure(record):
+            valid = sum(1 for pdf_file in pdf_files if TechDocExporter.is_pdf_valid(pdf_file)[0])
+        record.update({"status": "ok" if valid == len(pdf_files) else "errors", "documents": len(pdf_files)})
+        _throughput(record, "documents_per_sec", len(pdf_files))
+        records.append(record)
+    Config.PDF_INDEX_ENABLED = True
+    return records
+
+
+def bench_merge(args, scale):
+    pdf_files = _service_pdfs()
+    output_dir = os.path.join(Config.BASE_DIR, "BenchMerge")
+    os.makedirs(output_dir, exist_ok=True)
+    records = []
+    for variant in ("never", "always"):
+        Config.MERGE_STREAMING = variant
+        outputs = {mode: os.path.join(output_dir, f"{mode}.pdf") for mode in TechDocExporter.MERGE_MODES}
+        record = {"scenario": f"merge[{'streaming' if variant == 'always' else 'memory'}]"}
+        with _measure(record):
+            results = TechDocExporter.merge_pdfs_multi(pdf_files, outputs)
+        pages = sum(pages for _, pages in results.values())
+        record.update({
+            "status": "ok" if all(success for success, _ in results.values()) else "errors",
+            "documents": len(pdf_files),
+            "pages": pages,
+            "output_bytes": _folder_bytes(output_dir),
+        })
+        _throughput(record, "pages_per_sec", pages)
+        records.append(record)
+    Config.MERGE_STREAMING = "auto"
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return records
+
+
+def bench_postprint(args, scale):
+    documents = len(_service_pdfs())
+    make_title_scan(Config.TITLE_SCAN_PDF, documents, args.scan_kb)
+    record = {"scenario": "postprint", "scan_bytes": os.path.getsize(Config.TITLE_SCAN_PDF)}
+    with _measure(record):
+        summary = TechDocExporter.process_postprint()
+    record.update({
+        "status": summary["status"],
+        "documents": summary["files_processed_successfully"],
+        "output_bytes": _folder_bytes(Config.FINAL_OUTPUT_DIR),
+    })
+    _throughput(record, "documents_per_sec", summary["files_processed_successfully"])
+    return [record]
+
+
+BENCHMARKS = {
+    "preprint": bench_preprint,
+    "validate": bench_validate,
+    "merge": bench_merge,
+    "postprint": bench_postprint,
+}
+
+
+def run_scale(args, scale, base_dir):
+    """Готовит данные для масштаба scale и выполняет выбранные сценарии. Возвращает список записей."""
+    Config.initialize_paths(base_dir)
+    Config.RENDERER = "fake"
+    Config.RENDERER_OPTIONS = {"sheet_count": args.pages[0], "sheet_count_max": args.pages[1],
+                               "image_kb": args.image_kb}
+    Config.EXPORT_WORKERS = args.workers
+    Config.POSTPRINT_WORKERS = args.workers
+    Config.TITLE_MISMATCH_POLICY = "continue"
+    Config.LOG_LEVEL = "WARNING"
+    make_workbooks(Config.EXCEL_INPUT_DIR, scale)
+
+    records = []
+    log_path = os.path.join(base_dir, "benchmark.log")
+    with open(log_path, "w", encoding="utf-8") as log_file, contextlib.redirect_stdout(log_file):
+        # Остальным сценариям нужны PDF в папке Service, поэтому подготовка выполняется всегда
+        preprint_records = bench_preprint(args, scale)
+        if "preprint" in args.scenarios:
+            records.extend(preprint_records)
+        for scenario in SCENARIOS[1:]:
+            if scenario in args.scenarios:
+                records.extend(BENCHMARKS[scenario](args, scale))
+    return records
+
+
+def _page_range(value):
+    try:
+        low, _, high = value.partition("-")
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидается число или диапазон вида 1-8")
+    if low < 1 or high < low:
+        raise argparse.ArgumentTypeError("некорректный диапазон страниц")
+    return low, high
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Замеры обработки PDF на синтетических данных.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Количество документов (по умолчанию: %(default)s)")
+    parser.add_argument("--pages", type=_page_range, default=(1, 8),
+                        help="Количество страниц документа, число или диапазон (по умолчанию: 1-8)")
+    parser.add_argument("--image-kb", type=int, default=50,
+                        help="Вес изображения на страницах документа, КБ; 0 — без изображений (по умолчанию: %(default)s)")
+    parser.add_argument("--scan-kb", type=int, default=300,
+                        help="Вес изображения на странице title_scan.pdf, КБ (по умолчанию: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="Процессов экспорта и замены титульников")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Сценарии (по умолчанию: все)")
+    parser.add_argument("--results", default="benchmark_results.jsonl",
+                        help="Файл результатов JSON Lines, дописывается (по умолчанию: %(default)s)")
+    parser.add_argument("--work-dir", help="Папка для данных (по умолчанию — временная)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять данные после замеров")
+    parser.add_argument("--label", help="Метка версии в результатах (по умолчанию — хэш коммита)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="techdoc_bench_")
+    common = {
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "version": args.label or _code_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pages_range": list(args.pages),
+        "image_kb": args.image_kb,
+        "workers": args.workers,
+    }
+
+    all_records = []
+    try:
+        for scale in args.scales:
+            base_dir = os.path.join(work_dir, f"scale_{scale}")
+            shutil.rmtree(base_dir, ignore_errors=True)
+            for record in run_scale(args, scale, base_dir):
+                record = dict(common, scale=scale, **record)
+                all_records.append(record)
+                print(f"{scale:>6} {record['scenario']:<22} {record['wall_sec']:>9.3f} с "
+                      f"{record['peak_memory_mb']:>8.1f} МБ  {record['status']}", file=sys.stderr)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.results, "a", encoding="utf-8") as f:
+        for record in all_records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"Результаты записаны: {os.path.abspath(args.results)}", file=sys.stderr)
+    return 0 if all(record["status"] in ("ok", "empty") for record in all_records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
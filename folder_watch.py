@@ -0,0 +1,123 @@
+"""
+Ожидание изменений файлов для режима наблюдения (python -m techdoc watch).
+
+Изменения определяются сравнением снимков {файл: (размер, время изменения)}; FolderWatcher только
+сообщает, когда снимок стоит сделать заново. На Linux используется inotify (через ctypes, без
+сторонних библиотек) — процесс просыпается сразу после записи файла; на других системах и при
+ошибке inotify папки периодически опрашиваются.
+
+    watcher = FolderWatcher([excel_dir, print_dir], poll_interval=1.0)
+    while True:
+        watcher.wait(timeout=5)
+        state = snapshot(excel_dir, (".xlsx", ".xlsm"))
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+# IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_WATCH_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+_READ_SIZE = 64 * 1024
+
+
+def file_state(path):
+    """Возвращает (размер, время изменения в нс) файла или None, если файла нет."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def snapshot(directory, suffixes):
+    """
+    Снимок папки: {имя файла: (размер, время изменения)} для файлов с расширениями suffixes.
+    Файлы блокировки Office (~$имя) пропускаются.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    result = {}
+    for name in names:
+        if name.startswith("~$") or not name.lower().endswith(suffixes):
+            continue
+        state = file_state(os.path.join(directory, name))
+        if state is not None:
+            result[name] = state
+    return result
+
+
+def is_readable(path):
+    """Проверяет, что файл можно открыть на чтение (в Windows копируемый файл заблокирован)."""
+    try:
+        with open(path, "rb"):
+            return True
+    except OSError:
+        return False
+
+
+class _Inotify:
+    """Дескриптор inotify с наблюдением за папками."""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        try:
+            for directory in directories:
+                if libc.inotify_add_watch(self._fd, os.fsencode(directory), ctypes.c_uint32(_WATCH_MASK)) < 0:
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch: {directory}")
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        while True:
+            try:
+                if not os.read(self._fd, _READ_SIZE):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class FolderWatcher:
+    """Ожидание изменений в папках directories: inotify на Linux, иначе опрос раз в poll_interval секунд."""
+
+    def __init__(self, directories, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(directories)
+            except (OSError, AttributeError):
+                self._inotify = None
+        self.mode = "inotify" if self._inotify else "polling"
+
+    def wait(self, timeout):
+        """
+        Ждёт изменения не дольше timeout секунд. Возвращает True, если в папках что-то изменилось
+        (в режиме опроса — всегда True: изменения определяются сравнением снимков).
+        """
+        if self._inotify:
+            return self._inotify.wait(timeout)
+        time.sleep(min(timeout, self.poll_interval))
+        return True
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,121 @@
+"""
+Фоновая запись лога в файл.
+
+Сообщения, выведенные через log(), попадают в очередь без ожидания диска; фоновый поток
+забирает их пачками, записывает одной операцией и держит файл открытым. Когда файл превышает
+max_bytes, он переименовывается в <имя>.1 (старые копии сдвигаются до backup_count),
+и запись продолжается в новый файл. В режиме json_lines каждое сообщение лога записывается
+как JSON-объект {"time", "level", "message"}: time — дата и время в формате ISO 8601 на момент
+вызова write(), строки многострочного сообщения остаются в одном объекте.
+"""
+import datetime
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+# Формат строки, которую выводит log(): "[ЧЧ:ММ:СС] [УРОВЕНЬ] сообщение"
+_LINE_PATTERN = re.compile(r'\[(\d{2}:\d{2}:\d{2})\]\s\[([A-Z]+)\]\s(.*)')
+
+_STOP = object()
+
+
+class LogFileWriter:
+    """Буферизованная запись лога в файл path из фонового потока."""
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3, json_lines=False, flush_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.json_lines = json_lines
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._error_reported = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        """Ставит текст в очередь записи (с временем вызова) и сразу возвращает управление."""
+        if text:
+            self._queue.put((datetime.datetime.now().astimezone().isoformat(timespec="milliseconds"), text))
+
+    def close(self):
+        """Дописывает накопленные сообщения и останавливает фоновый поток."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                chunks = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    chunks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in chunks:
+                stopping = True
+                chunks = [chunk for chunk in chunks if chunk is not _STOP]
+            self._write_batch("".join(self._format(timestamp, text) for timestamp, text in chunks))
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _format(self, timestamp, text):
+        """
+        Преобразует фрагмент, записанный одним вызовом write(), в записи JSON Lines. Новая запись
+        начинается со строки "[ЧЧ:ММ:СС] [УРОВЕНЬ]"; следующие строки без такого префикса — продолжение
+        сообщения (фрагмент рабочего процесса может содержать несколько сообщений).
+        """
+        if not self.json_lines:
+            return text
+        records = []
+        for line in text.splitlines():
+            match = _LINE_PATTERN.match(line)
+            if match:
+                records.append({"time": timestamp, "level": match.group(2), "message": match.group(3)})
+            elif records:
+                records[-1]["message"] += "\n" + line
+            elif line.strip():
+                records.append({"time": timestamp, "level": "INFO", "message": line})
+        for record in records:
+            record["message"] = record["message"].rstrip("\n")  # пустая строка после сообщения из log()
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def _write_batch(self, data):
+        if not data:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            size = self._file.tell()
+            if self.max_bytes and size and size + len(data.encode("utf-8")) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            if not self._error_reported and sys.__stderr__:
+                self._error_reported = True
+                sys.__stderr__.write(f"[{time.strftime('%H:%M:%S')}] [ERROR] Ошибка записи в файл лога: {e}\n")
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                older = f"{self.path}.{i}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.path}.{i + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
@@ -0,0 +1,96 @@
+"""
+Измерение пикового потребления памяти процессом (рабочий набор / RSS) на отрезке работы.
+
+Фоновый поток периодически опрашивает текущий размер памяти процесса; это почти не замедляет
+измеряемый код, в отличие от tracemalloc.
+"""
+import os
+import sys
+import threading
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    class _ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    _GetCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+    _GetCurrentProcess.restype = wintypes.HANDLE
+    _GetProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+    _GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(_ProcessMemoryCounters), wintypes.DWORD]
+
+    def current_rss():
+        """Возвращает текущий рабочий набор процесса в байтах."""
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if not _GetProcessMemoryInfo(_GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return 0
+        return counters.WorkingSetSize
+else:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def current_rss():
+        """Возвращает текущий RSS процесса в байтах (0, если платформа не поддерживается)."""
+        try:
+            with open("/proc/self/statm", "rb") as f:
+                return int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            return 0
+
+
+class MemoryPeakMonitor:
+    """
+    Контекстный менеджер: фиксирует пиковый RSS процесса за время выполнения блока.
+
+        with MemoryPeakMonitor() as monitor:
+            ...
+        monitor.peak_mb
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        self.peak_bytes = max(self.peak_bytes, current_rss())
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start_bytes = current_rss()
+        self.peak_bytes = self.start_bytes
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_bytes / (1024 * 1024), 1)
+
+    @property
+    def growth_mb(self):
+        """Прирост пикового RSS относительно начала измерения."""
+        return round((self.peak_bytes - self.start_bytes) / (1024 * 1024), 1)
@@ -0,0 +1,95 @@
+"""
+Устранение одинаковых потоковых объектов (шрифтов, изображений, XObject) в объединённых PDF.
+
+Каждая книга, экспортированная из Excel, содержит собственные копии одних и тех же шрифтов,
+логотипов и штампов; при объединении все копии попадают в выходной файл. Потоки с одинаковым
+словарём и одинаковыми (закодированными) данными достаточно записать один раз и сослаться на них
+со всех страниц.
+
+Сравниваются только «листовые» потоки — без косвенных ссылок в словаре: их содержимое полностью
+определяется собственными байтами. К ним относятся файлы шрифтов, большинство изображений и
+потоки содержимого страниц.
+"""
+import hashlib
+import io
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NullObject, StreamObject
+
+
+def new_dedup_stats():
+    """Возвращает пустые счётчики: найдено повторов потоков и сэкономлено байт."""
+    return {"duplicate_streams": 0, "bytes_saved": 0}
+
+
+def _has_references(obj):
+    if isinstance(obj, IndirectObject):
+        return True
+    if isinstance(obj, DictionaryObject):
+        return any(_has_references(value) for value in obj.values())
+    if isinstance(obj, ArrayObject):
+        return any(_has_references(value) for value in obj)
+    return False
+
+
+def stream_fingerprint(obj):
+    """
+    Возвращает отпечаток листового потока (SHA-256 словаря без /Length и данных)
+    или None, если объект не является потоком или ссылается на другие объекты.
+    """
+    if not isinstance(obj, StreamObject):
+        return None
+    entries = {key: value for key, value in obj.items() if key != "/Length"}
+    if any(_has_references(value) for value in entries.values()):
+        return None
+    digest = hashlib.sha256()
+    for key in sorted(entries):
+        buffer = io.BytesIO()
+        entries[key].write_to_stream(buffer, None)
+        digest.update(key.encode() + b"\0" + buffer.getvalue() + b"\0")
+    digest.update(obj._data)
+    return digest.hexdigest()
+
+
+def _replace_references(obj, replacements, writer):
+    """Заменяет в obj ссылки на объекты-повторы ссылками на сохранённые экземпляры."""
+    if isinstance(obj, DictionaryObject):
+        items = obj.items()
+    elif isinstance(obj, ArrayObject):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in list(items):
+        if isinstance(value, IndirectObject):
+            target = replacements.get(value.idnum)
+            if target is not None:
+                obj[key] = IndirectObject(target, 0, writer)
+        else:
+            _replace_references(value, replacements, writer)
+
+
+def deduplicate_writer(writer):
+    """
+    Устраняет одинаковые листовые потоки в PdfWriter перед записью.
+    Повторы заменяются на null, ссылки на них перенаправляются на первый экземпляр.
+    Возвращает счётчики new_dedup_stats().
+    """
+    stats = new_dedup_stats()
+    seen = {}
+    replacements = {}
+    for idnum, obj in enumerate(writer._objects, start=1):
+        fingerprint = stream_fingerprint(obj)
+        if fingerprint is None:
+            continue
+        original = seen.setdefault(fingerprint, idnum)
+        if original != idnum:
+            replacements[idnum] = original
+            stats["duplicate_streams"] += 1
+            stats["bytes_saved"] += len(obj._data)
+
+    if replacements:
+        for idnum, obj in enumerate(writer._objects, start=1):
+            if idnum in replacements:
+                writer._objects[idnum - 1] = NullObject()
+            elif obj is not None:
+                _replace_references(obj, replacements, writer)
+    return stats
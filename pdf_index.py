@@ -0,0 +1,83 @@
+"""
+Постоянный индекс сведений о PDF-файлах (валидность, количество и размеры страниц).
+
+Запись действительна, пока у файла не изменились размер, время изменения и inode;
+в противном случае файл разбирается заново. Если файл проверялся только быстрым чтением
+количества страниц, размеры страниц не записываются (page_sizes равен None).
+Индекс хранится в SQLite, поэтому им могут одновременно пользоваться несколько процессов экспорта.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_info (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    num_pages INTEGER NOT NULL,
+    page_sizes TEXT NOT NULL,
+    problem_level TEXT,
+    problem TEXT
+)
+"""
+
+
+def _index_key(file_path):
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+class PdfIndex:
+    """Индекс сведений о PDF, привязанный к файлу базы данных db_path."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute(_SCHEMA)
+
+    def get(self, file_path, stat_result=None):
+        """
+        Возвращает сохранённые сведения о файле или None, если записи нет
+        или файл изменился после её создания.
+        """
+        stat_result = stat_result or os.stat(file_path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, valid, num_pages, page_sizes, problem_level, problem "
+                "FROM pdf_info WHERE path = ?", (_index_key(file_path),)).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, inode, valid, num_pages, page_sizes, problem_level, problem = row
+        if (size, mtime_ns, inode) != (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+            return None
+        return {
+            "valid": bool(valid),
+            "num_pages": num_pages,
+            "page_sizes": json.loads(page_sizes),
+            "problem": (problem_level, problem) if problem else None,
+        }
+
+    def put(self, file_path, stat_result, info):
+        """Сохраняет сведения о файле; stat_result должен быть получен до разбора файла."""
+        problem_level, problem = info["problem"] or (None, None)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pdf_info VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_index_key(file_path), stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino,
+                 int(info["valid"]), info["num_pages"], json.dumps(info["page_sizes"]), problem_level, problem))
+
+    def forget_missing(self):
+        """Удаляет записи о файлах, которых больше нет на диске. Возвращает количество удалённых записей."""
+        with self._lock:
+            paths = [row[0] for row in self._connection.execute("SELECT path FROM pdf_info")]
+            missing = [(path,) for path in paths if not os.path.exists(path)]
+            self._connection.executemany("DELETE FROM pdf_info WHERE path = ?", missing)
+        return len(missing)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,107 @@
+"""
+Линеаризация PDF («быстрый просмотр в сети»).
+
+В линеаризованном файле сначала идут словарь /Linearized, первая страница со всеми её объектами и
+таблицы подсказок (hint tables) со смещениями остальных страниц и общих объектов. Программа просмотра,
+открывающая файл с общей папки или по HTTP, показывает первую страницу после чтения небольшого начала
+файла (/E байт) и дочитывает остальные страницы по смещениям из таблиц подсказок, не загружая весь файл.
+
+Файл записывается библиотекой pikepdf (qpdf) во временный файл и заменяет исходный, только если
+проверка линеаризации qpdf (check_linearization) подтвердила, что словарь /Linearized и таблицы
+подсказок страниц и общих объектов соответствуют фактическому расположению объектов.
+
+Без pikepdf is_available() возвращает False. Добавочное обновление (см. pdf_update) нарушает
+линеаризацию, поэтому линеаризуемые файлы переписываются целиком.
+"""
+import os
+import re
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+_HEADER_SIZE = 1024  # словарь /Linearized должен целиком находиться в первых 1024 байтах файла
+_LINEARIZED_DICT = re.compile(rb"\d+\s+\d+\s+obj\s*<<(.*?/Linearized.*?)>>", re.DOTALL)
+_NUMBER_KEYS = ("L", "O", "E", "N", "T")
+
+
+class LinearizationError(Exception):
+    """Файл не удалось линеаризовать или линеаризованный файл не прошёл проверку."""
+
+
+def is_available():
+    """Проверяет, установлен ли pikepdf."""
+    return pikepdf is not None
+
+
+def linearization_params(path):
+    """
+    Возвращает параметры словаря /Linearized из начала файла: {"L": длина файла, "O": объект первой
+    страницы, "E": конец первой страницы, "N": страниц, "T": смещение основной таблицы ссылок,
+    "H": [смещение и длина потоков подсказок]} или None, если файл не линеаризован. Не требует pikepdf.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_SIZE)
+    except OSError:
+        return None
+    match = _LINEARIZED_DICT.search(header)
+    if match is None:
+        return None
+    body = match.group(1)
+    params = {}
+    for key in _NUMBER_KEYS:
+        value = re.search(rb"/" + key.encode() + rb"\s+(\d+)", body)
+        if value is None:
+            return None
+        params[key] = int(value.group(1))
+    hints = re.search(rb"/H\s*\[([\d\s]+)\]", body)
+    if hints is None:
+        return None
+    params["H"] = [int(number) for number in hints.group(1).split()]
+    return params
+
+
+def is_linearized(path):
+    """
+    Быстрая проверка без pikepdf: в начале файла есть словарь /Linearized, и его длина /L совпадает
+    с размером файла (после добавочного обновления линеаризация недействительна).
+    """
+    params = linearization_params(path)
+    return params is not None and params["L"] == os.path.getsize(path)
+
+
+def check_linearization(path):
+    """Полная проверка линеаризации qpdf, включая таблицы подсказок. Возвращает True, если ошибок нет."""
+    try:
+        with pikepdf.open(path) as pdf:
+            return pdf.is_linearized and pdf.check_linearization()
+    except pikepdf.PdfError:
+        return False
+
+
+def linearize_pdf(path, output_path=None):
+    """
+    Записывает линеаризованную копию path в output_path (по умолчанию заменяет path) и проверяет её.
+    Возвращает параметры словаря /Linearized (см. linearization_params). При ошибке вызывает
+    LinearizationError; исходный файл при этом не изменяется.
+    """
+    output_path = output_path or path
+    temp_path = output_path + ".lin"
+    try:
+        try:
+            with pikepdf.open(path) as pdf:
+                pdf.save(temp_path, linearize=True)
+        except pikepdf.PdfError as e:
+            raise LinearizationError(f"qpdf: {e}") from None
+        if not check_linearization(temp_path):
+            raise LinearizationError("таблицы подсказок не соответствуют расположению объектов (проверка qpdf)")
+        params = linearization_params(temp_path)
+        if params is None or params["L"] != os.path.getsize(temp_path):
+            raise LinearizationError("словарь /Linearized не соответствует записанному файлу")
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return params
@@ -0,0 +1,357 @@
+"""
+Быстрое определение количества страниц PDF без полного разбора.
+
+probe_page_count() отображает файл в память, находит последний startxref, по цепочке таблиц
+перекрёстных ссылок (классических и потоковых, с добавочными обновлениями через /Prev и
+гибридными файлами с /XRefStm) находит каталог /Root → /Pages и читает /Count корня дерева
+страниц. Разбираются только эти несколько объектов, поэтому время не зависит от количества
+страниц. Если что-то в файле не соответствует ожиданиям (повреждённая таблица, неизвестный
+фильтр, зашифрованный поток объектов), функция возвращает None и вызывающий код разбирает
+файл полностью.
+"""
+import mmap
+import re
+import zlib
+
+_TAIL_SIZE = 2048  # startxref ищется в конце файла
+_HEADER_SIZE = 1024  # заголовок %PDF- может быть смещён мусором в начале файла
+_MAX_SECTIONS = 1000  # защита от зацикленной цепочки /Prev
+
+_WHITESPACE = frozenset(b" \t\r\n\f\0")
+_NAME_END = _WHITESPACE | frozenset(b"()<>[]{}/%")
+_NUMBER = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)")
+_REFERENCE = re.compile(rb"(\d+)\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])")
+_OBJECT_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+_SUBSECTION = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)")
+
+
+class _ProbeError(Exception):
+    """Файл нельзя разобрать быстрым способом."""
+
+
+class _Reference:
+    __slots__ = ("number", "generation")
+
+    def __init__(self, number, generation):
+        self.number = number
+        self.generation = generation
+
+
+class _Parser:
+    """Разбор отдельных объектов PDF из буфера data (bytes или mmap)."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def skip_space(self, pos):
+        data = self.data
+        size = len(data)
+        while pos < size:
+            char = data[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif char == 0x25:  # комментарий до конца строки
+                while pos < size and data[pos] not in (0x0D, 0x0A):
+                    pos += 1
+            else:
+                break
+        return pos
+
+    def parse(self, pos):
+        """Разбирает объект с позиции pos. Возвращает (значение, позиция после объекта)."""
+        data = self.data
+        pos = self.skip_space(pos)
+        head = data[pos:pos + 2]
+        if head == b"<<":
+            result = {}
+            pos += 2
+            while True:
+                pos = self.skip_space(pos)
+                if data[pos:pos + 2] == b">>":
+                    return result, pos + 2
+                key, pos = self.parse(pos)
+                if not isinstance(key, bytes) or not key.startswith(b"/"):
+                    raise _ProbeError("Ключ словаря не является именем")
+                result[key], pos = self.parse(pos)
+        if head[:1] == b"[":
+            result = []
+            pos += 1
+            while True:
+                pos = self.skip_space(pos)
+                if data[pos:pos + 1] == b"]":
+                    return result, pos + 1
+                value, pos = self.parse(pos)
+                result.append(value)
+        if head[:1] == b"/":
+            end = pos + 1
+            while end < len(data) and data[end] not in _NAME_END:
+                end += 1
+            return bytes(data[pos:end]), end
+        if head[:1] == b"(":
+            return None, self._skip_literal_string(pos)
+        if head[:1] == b"<":
+            end = data.find(b">", pos)
+            if end < 0:
+                raise _ProbeError("Незавершённая шестнадцатеричная строка")
+            return None, end + 1
+        reference = _REFERENCE.match(data, pos)
+        if reference:
+            return _Reference(int(reference.group(1)), int(reference.group(2))), reference.end()
+        number = _NUMBER.match(data, pos)
+        if number:
+            text = number.group(0)
+            return (float(text) if b"." in text else int(text)), number.end()
+        for keyword, value in ((b"true", True), (b"false", False), (b"null", None)):
+            if data[pos:pos + len(keyword)] == keyword:
+                return value, pos + len(keyword)
+        raise _ProbeError(f"Неожиданные данные в позиции {pos}")
+
+    def _skip_literal_string(self, pos):
+        data = self.data
+        depth = 0
+        while pos < len(data):
+            char = data[pos:pos + 1]
+            if char == b"\\":
+                pos += 2
+                continue
+            if char == b"(":
+                depth += 1
+            elif char == b")":
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        raise _ProbeError("Незавершённая строка")
+
+    def parse_indirect(self, pos, number=None):
+        """Разбирает косвенный объект "N G obj" с позиции pos. Возвращает (значение, позиция после значения)."""
+        header = _OBJECT_HEADER.match(self.data, pos)
+        if not header or (number is not None and int(header.group(1)) != number):
+            raise _ProbeError(f"По смещению {pos} нет объекта {number}")
+        return self.parse(header.end())
+
+    def stream_data(self, dictionary, pos, resolve):
+        """Возвращает распакованные данные потока, словарь которого закончился в позиции pos."""
+        data = self.data
+        pos = self.skip_space(pos)
+        if data[pos:pos + 6] != b"stream":
+            raise _ProbeError("Ожидался поток")
+        pos += 6
+        if data[pos:pos + 2] == b"\r\n":
+            pos += 2
+        elif data[pos:pos + 1] in (b"\r", b"\n"):
+            pos += 1
+        length = resolve(dictionary.get(b"/Length"))
+        if not isinstance(length, int) or length < 0 or pos + length > len(data):
+            raise _ProbeError("Некорректная длина потока")
+        raw = bytes(data[pos:pos + length])
+        filters = dictionary.get(b"/Filter")
+        params = resolve(dictionary.get(b"/DecodeParms"))
+        if isinstance(filters, list):
+            if len(filters) > 1:
+                raise _ProbeError("Цепочка фильтров не поддерживается")
+            filters = filters[0] if filters else None
+            params = params[0] if isinstance(params, list) and params else params
+        if filters is None:
+            return raw
+        if filters != b"/FlateDecode":
+            raise _ProbeError(f"Фильтр {filters!r} не поддерживается")
+        try:
+            decoded = zlib.decompress(raw)
+        except zlib.error:
+            raise _ProbeError("Повреждённые данные потока") from None
+        if isinstance(params, dict) and params.get(b"/Predictor", 1) > 1:
+            decoded = _undo_png_predictor(decoded, params)
+        return decoded
+
+
+def _undo_png_predictor(data, params):
+    """Снимает PNG-предсказатели строк (None, Sub, Up) потока перекрёстных ссылок."""
+    if params.get(b"/Predictor", 1) < 10:
+        raise _ProbeError("Предсказатель TIFF не поддерживается")
+    width = params.get(b"/Columns", 1) * params.get(b"/Colors", 1) * params.get(b"/BitsPerComponent", 8) // 8
+    if width <= 0 or len(data) % (width + 1):
+        raise _ProbeError("Некорректная длина строк предсказателя")
+    previous = bytes(width)
+    rows = []
+    for start in range(0, len(data), width + 1):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + 1 + width])
+        if kind == 1:
+            for i in range(1, width):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            row = bytearray((a + b) & 0xFF for a, b in zip(row, previous))
+        elif kind != 0:
+            raise _ProbeError(f"Предсказатель PNG {kind} не поддерживается")
+        rows.append(bytes(row))
+        previous = row
+    return b"".join(rows)
+
+
+class _XrefSection:
+    """Один раздел перекрёстных ссылок: классическая таблица или поток."""
+
+    def __init__(self, parser, offset, resolve):
+        self.parser = parser
+        self.table = None  # классическая таблица: [(первый номер, количество, смещение записей)]
+        self.entries = None  # поток: {номер: (тип, поле 2, поле 3)}
+        data = parser.data
+        pos = parser.skip_space(offset)
+        if data[pos:pos + 4] == b"xref":
+            self.table = []
+            pos += 4
+            while True:
+                subsection = _SUBSECTION.match(data, pos)
+                if not subsection:
+                    break
+                first, count = int(subsection.group(1)), int(subsection.group(2))
+                self.table.append((first, count, subsection.end()))
+                pos = subsection.end() + count * 20
+            pos = parser.skip_space(pos)
+            if data[pos:pos + 7] != b"trailer":
+                raise _ProbeError("После таблицы ссылок нет trailer")
+            self.trailer, _ = parser.parse(pos + 7)
+        else:
+            self.trailer, end = parser.parse_indirect(pos)
+            if not isinstance(self.trailer, dict) or self.trailer.get(b"/Type") != b"/XRef":
+                raise _ProbeError("По смещению startxref нет таблицы ссылок")
+            self._read_stream(parser.stream_data(self.trailer, end, resolve))
+
+    def _read_stream(self, data):
+        widths = self.trailer.get(b"/W")
+        size = self.trailer.get(b"/Size")
+        index = self.trailer.get(b"/Index", [0, size])
+        if (not isinstance(widths, list) or len(widths) != 3 or not all(isinstance(w, int) for w in widths)
+                or not isinstance(index, list) or len(index) % 2):
+            raise _ProbeError("Некорректный поток ссылок")
+        row = sum(widths)
+        self.entries = {}
+        pos = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for number in range(first, first + count):
+                if pos + row > len(data):
+                    raise _ProbeError("Поток ссылок короче заявленного")
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos:pos + width], "big") if width else None)
+                    pos += width
+                kind = 1 if fields[0] is None else fields[0]
+                self.entries[number] = (kind, fields[1], fields[2] or 0)
+
+    def lookup(self, number):
+        """Возвращает ("offset", смещение) / ("stream", номер потока, индекс) / ("free",) или None."""
+        if self.entries is not None:
+            entry = self.entries.get(number)
+            if entry is None:
+                return None
+            kind, field2, field3 = entry
+            if kind == 1:
+                return ("offset", field2)
+            if kind == 2:
+                return ("stream", field2, field3)
+            return ("free",)
+        for first, count, start in self.table:
+            if first <= number < first + count:
+                entry = bytes(self.parser.data[start + (number - first) * 20:start + (number - first) * 20 + 18])
+                fields = entry.split()
+                if len(fields) != 3 or fields[2] not in (b"n", b"f"):
+                    raise _ProbeError("Некорректная запись таблицы ссылок")
+                return ("offset", int(fields[0])) if fields[2] == b"n" else ("free",)
+        return None
+
+
+class _Document:
+    def __init__(self, data):
+        self.parser = _Parser(data)
+        self.sections = []
+        self._object_streams = {}
+        tail_start = max(0, len(data) - _TAIL_SIZE)
+        position = data.rfind(b"startxref", tail_start)
+        if position < 0:
+            raise _ProbeError("В конце файла не найден startxref")
+        offset, _ = self.parser.parse(position + len(b"startxref"))
+        visited = set()
+        pending = [offset]
+        while pending:
+            offset = pending.pop(0)
+            if not isinstance(offset, int) or offset in visited or len(visited) >= _MAX_SECTIONS:
+                raise _ProbeError("Некорректная цепочка таблиц ссылок")
+            visited.add(offset)
+            section = _XrefSection(self.parser, offset, self._resolve_direct)
+            self.sections.append(section)
+            # В гибридном файле поток /XRefStm дополняет таблицу того же раздела и просматривается до /Prev
+            follow = [section.trailer.get(b"/XRefStm"), section.trailer.get(b"/Prev")]
+            pending[:0] = [value for value in follow if value is not None]
+        self.trailer = self.sections[0].trailer
+
+    @staticmethod
+    def _resolve_direct(value):
+        if isinstance(value, _Reference):
+            raise _ProbeError("Косвенное значение в словаре таблицы ссылок")
+        return value
+
+    def _lookup(self, number):
+        for section in self.sections:
+            entry = section.lookup(number)
+            if entry is not None:
+                return entry
+        return None
+
+    def resolve(self, value):
+        """Возвращает значение объекта, на который ссылается value (прямые значения — как есть)."""
+        if not isinstance(value, _Reference):
+            return value
+        entry = self._lookup(value.number)
+        if entry is None or entry[0] == "free":
+            return None
+        if entry[0] == "offset":
+            return self.parser.parse_indirect(entry[1], value.number)[0]
+        return self._object_from_stream(entry[1], entry[2], value.number)
+
+    def _object_from_stream(self, stream_number, index, number):
+        if b"/Encrypt" in self.trailer:
+            raise _ProbeError("Потоки объектов зашифрованы")
+        if stream_number not in self._object_streams:
+            entry = self._lookup(stream_number)
+            if entry is None or entry[0] != "offset":
+                raise _ProbeError("Поток объектов не найден")
+            dictionary, end = self.parser.parse_indirect(entry[1], stream_number)
+            data = self.parser.stream_data(dictionary, end, self.resolve)
+            first = self.resolve(dictionary.get(b"/First"))
+            count = self.resolve(dictionary.get(b"/N"))
+            if not isinstance(first, int) or not isinstance(count, int):
+                raise _ProbeError("Некорректный поток объектов")
+            header = data[:first].split()
+            if len(header) < 2 * count:
+                raise _ProbeError("Некорректный заголовок потока объектов")
+            offsets = {int(header[2 * i]): first + int(header[2 * i + 1]) for i in range(count)}
+            self._object_streams[stream_number] = (_Parser(data), offsets)
+        parser, offsets = self._object_streams[stream_number]
+        if number not in offsets:
+            raise _ProbeError(f"Объект {number} не найден в потоке объектов")
+        return parser.parse(offsets[number])[0]
+
+
+def probe_page_count(path):
+    """
+    Возвращает количество страниц PDF по /Count корня дерева страниц или None,
+    если быстрым способом его определить нельзя (тогда файл нужно разобрать полностью).
+    """
+    try:
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b"%PDF-", 0, _HEADER_SIZE) < 0:
+                return None
+            document = _Document(data)
+            catalog = document.resolve(document.trailer.get(b"/Root"))
+            if not isinstance(catalog, dict):
+                return None
+            pages = document.resolve(catalog.get(b"/Pages"))
+            if not isinstance(pages, dict) or pages.get(b"/Type", b"/Pages") != b"/Pages":
+                return None
+            count = document.resolve(pages.get(b"/Count"))
+    except (OSError, ValueError, IndexError, RecursionError, _ProbeError):
+        return None
+    if isinstance(count, int) and count >= 0:
+        return count
+    return None
@@ -0,0 +1,303 @@
+"""
+Потоковая запись PDF для объединения больших пакетов документов.
+
+PdfWriter держит в памяти все добавленные страницы до вызова write(), поэтому память растёт
+вместе с размером всего пакета. StreamingPdfWriter сразу записывает в файл каждую страницу
+и все объекты, на которые она ссылается; в памяти остаются только смещения объектов и таблица
+соответствия номеров для текущего исходного файла. Пиковое потребление памяти определяется
+самым большим исходным файлом, а не всем пакетом.
+
+ShardedPdfWriter делит результат на части (complete_merged_part01.pdf, ...) по бюджету страниц
+или байтов. Часть закрывается на границе документа, как только следующий документ в неё не
+помещается, и сразу готова к печати, пока следующие части ещё записываются.
+"""
+import os
+import re
+
+from pdf_dedup import new_dedup_stats, stream_fingerprint
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject,
+                            StreamObject)
+
+_PAGES_ID = 1  # корень дерева страниц записывается последним, но номер резервируется сразу
+_CATALOG_ID = 2
+
+
+class StreamingPdfWriter:
+    """
+    Записывает PDF в output_path по мере добавления страниц.
+    Файл создаётся под временным именем и переименовывается в close(); abort() удаляет его.
+    При dedup=True одинаковые листовые потоки (шрифты, изображения) записываются один раз
+    для всего файла; счётчики повторов — в dedup_stats.
+    """
+
+    def __init__(self, output_path, dedup=False):
+        self.output_path = output_path
+        self.pages = []  # номера объектов страниц в выходном файле
+        self.dedup = dedup
+        self.dedup_stats = new_dedup_stats()
+        self._stream_ids = {}  # отпечаток потока → номер записанного объекта
+        self._temp_path = output_path + ".part"
+        self._offsets = {}
+        self._next_id = _CATALOG_ID + 1
+        self._file = open(self._temp_path, "wb")
+        self._file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def bytes_written(self):
+        """Размер уже записанной части файла."""
+        return self._file.tell()
+
+    def _allocate_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, obj):
+        offset = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % obj_id)
+        obj.write_to_stream(self._file, None)
+        self._file.write(b"\nendobj\n")
+        self._offsets[obj_id] = offset
+
+    def add_pages(self, reader, page_indices):
+        """
+        Копирует страницы page_indices из reader вместе со связанными объектами.
+        Объекты, общие для нескольких страниц одного файла (шрифты, изображения), записываются один раз.
+        Ссылки на страницы, не вошедшие в набор (например, цели внутренних ссылок), заменяются на null.
+        """
+        mapping = {}
+        pending = []
+        page_ids = []
+        for i in page_indices:
+            page = reader.pages[i]
+            page_id = self._allocate_id()
+            if page.indirect_reference is not None:
+                mapping[(page.indirect_reference.idnum, page.indirect_reference.generation)] = page_id
+            pending.append((page_id, page))
+            page_ids.append(page_id)
+
+        # Объекты извлекаются с конца списка: каждая страница записывается рядом со своим содержимым
+        pending.reverse()
+        try:
+            while pending:
+                obj_id, obj = pending.pop()
+                self._write_object(obj_id, self._translate(obj, mapping, pending))
+        except Exception:
+            # Потоки, так и не записанные из-за ошибки, нельзя использовать для следующих файлов
+            self._stream_ids = {fingerprint: obj_id for fingerprint, obj_id in self._stream_ids.items()
+                                if obj_id in self._offsets}
+            raise
+        # Страницы попадают в дерево только после успешной записи всех их объектов
+        self.pages.extend(page_ids)
+
+    def _translate(self, obj, mapping, pending):
+        """Возвращает копию объекта со ссылками, перенумерованными для выходного файла."""
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            obj_id = mapping.get(key)
+            if obj_id is None:
+                target = obj.get_object()
+                if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                    return NullObject()
+                fingerprint = stream_fingerprint(target) if self.dedup else None
+                if fingerprint is not None and fingerprint in self._stream_ids:
+                    obj_id = self._stream_ids[fingerprint]
+                    mapping[key] = obj_id
+                    self.dedup_stats["duplicate_streams"] += 1
+                    self.dedup_stats["bytes_saved"] += len(target._data)
+                    return IndirectObject(obj_id, 0, None)
+                obj_id = self._allocate_id()
+                if fingerprint is not None:
+                    self._stream_ids[fingerprint] = obj_id
+                mapping[key] = obj_id
+                pending.append((obj_id, target))
+            return IndirectObject(obj_id, 0, None)
+
+        if isinstance(obj, DictionaryObject):
+            is_page = obj.get("/Type") == "/Page"
+            if isinstance(obj, StreamObject):
+                copy = StreamObject()
+                copy._data = obj._data
+            else:
+                copy = DictionaryObject()
+            for key, value in obj.items():
+                if key == "/Length" and isinstance(obj, StreamObject):
+                    continue  # длина потока вычисляется при записи
+                if is_page and key == "/Parent":
+                    copy[NameObject(key)] = IndirectObject(_PAGES_ID, 0, None)
+                else:
+                    copy[NameObject(key)] = self._translate(value, mapping, pending)
+            return copy
+
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._translate(value, mapping, pending) for value in obj)
+
+        return obj
+
+    def close(self):
+        """Записывает дерево страниц, каталог, таблицу перекрёстных ссылок и переименовывает файл."""
+        pages_root = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self.pages),
+            NameObject("/Count"): NumberObject(len(self.pages)),
+        })
+        self._write_object(_PAGES_ID, pages_root)
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(_PAGES_ID, 0, None),
+        })
+        self._write_object(_CATALOG_ID, catalog)
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for obj_id in range(1, size):
+            offset = self._offsets.get(obj_id)
+            self._file.write(b"%010d 00000 n \n" % offset if offset is not None else b"0000000000 65535 f \n")
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(size),
+            NameObject("/Root"): IndirectObject(_CATALOG_ID, 0, None),
+        })
+        self._file.write(b"trailer\n")
+        trailer.write_to_stream(self._file, None)
+        self._file.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+        self._file.close()
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self):
+        """Прерывает запись и удаляет незавершённый файл."""
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def shard_path(output_path, index):
+    """Путь части index (с 1) выходного файла: complete_merged.pdf → complete_merged_part01.pdf."""
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_part{index:02d}{ext}"
+
+
+def existing_shards(output_path):
+    """Пути существующих частей output_path по порядку номеров."""
+    base, ext = os.path.splitext(os.path.basename(output_path))
+    folder = os.path.dirname(output_path)
+    pattern = re.compile(re.escape(base) + r"_part(\d+)" + re.escape(ext) + "$")
+    try:
+        names = os.listdir(folder or ".")
+    except OSError:
+        return []
+    numbered = sorted((int(match.group(1)), name) for name in names for match in [pattern.match(name)] if match)
+    return [os.path.join(folder, name) for _, name in numbered]
+
+
+def remove_stale_shards(output_path, keep=()):
+    """Удаляет части output_path, не входящие в keep, и сам output_path, если он не в keep. Возвращает их имена."""
+    keep = {os.path.abspath(path) for path in keep}
+    removed = []
+    for path in existing_shards(output_path) + [output_path]:
+        if os.path.abspath(path) not in keep and os.path.exists(path):
+            os.remove(path)
+            removed.append(os.path.basename(path))
+    return removed
+
+
+class ShardedPdfWriter:
+    """
+    Записывает выходной файл частями shard_path(output_path, N) потоковыми писателями.
+    Документ (набор страниц одного add_pages) не делится между частями: новая часть начинается,
+    если с ним текущая превысила бы max_pages страниц или max_bytes байтов (0 — без ограничения);
+    документ больше бюджета занимает отдельную часть. При publish=True закрытая часть сразу получает
+    итоговое имя, иначе — в close(). Закрытые части перечислены в shards.
+    """
+
+    def __init__(self, output_path, max_pages=0, max_bytes=0, dedup=False, publish=True, on_shard=None,
+                 finalize=None):
+        self.output_path = output_path
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.dedup = dedup
+        self.publish = publish
+        self.on_shard = on_shard  # вызывается с (путь части, страниц) после её публикации
+        self.finalize = finalize  # вызывается с (путь записанной части, итоговый путь) до публикации
+        self.shards = []
+        self.shard_pages = []
+        self._pending = []  # (временный путь, итоговый путь) закрытых, но не опубликованных частей
+        self._closed_dedup_stats = new_dedup_stats()
+        self._writer = None
+
+    @property
+    def pages(self):
+        """Количество страниц во всех частях (для проверки, что записывать есть что)."""
+        return sum(self.shard_pages) + (len(self._writer.pages) if self._writer else 0)
+
+    @property
+    def dedup_stats(self):
+        stats = dict(self._closed_dedup_stats)
+        if self._writer:
+            for key, value in self._writer.dedup_stats.items():
+                stats[key] += value
+        return stats
+
+    def _fits(self, page_count, estimated_bytes):
+        if self.max_pages and len(self._writer.pages) + page_count > self.max_pages:
+            return False
+        if self.max_bytes and self._writer.bytes_written + estimated_bytes > self.max_bytes:
+            return False
+        return True
+
+    def _close_shard(self):
+        writer, self._writer = self._writer, None
+        final_path = shard_path(self.output_path, len(self.shards) + len(self._pending) + 1)
+        writer.close()
+        if self.finalize:
+            self.finalize(writer.output_path, final_path)
+        for key, value in writer.dedup_stats.items():
+            self._closed_dedup_stats[key] += value
+        self.shard_pages.append(len(writer.pages))
+        if self.publish:
+            os.replace(writer.output_path, final_path)
+            self.shards.append(final_path)
+            if self.on_shard:
+                self.on_shard(final_path, len(writer.pages))
+        else:
+            self._pending.append((writer.output_path, final_path))
+
+    def add_pages(self, reader, page_indices, estimated_bytes=0):
+        """
+        Копирует страницы page_indices одного документа в текущую часть или, если он в неё не помещается,
+        в новую. estimated_bytes — ожидаемый размер страниц в файле (для бюджета байтов).
+        """
+        if not page_indices:
+            return
+        if self._writer and self._writer.pages and not self._fits(len(page_indices), estimated_bytes):
+            self._close_shard()
+        if self._writer is None:
+            index = len(self.shards) + len(self._pending) + 1
+            self._writer = StreamingPdfWriter(shard_path(self.output_path, index) + ".shard", self.dedup)
+        self._writer.add_pages(reader, page_indices)
+
+    def close(self):
+        """Закрывает последнюю часть, публикует отложенные и удаляет части прошлых запусков сверх текущих."""
+        if self._writer is not None:
+            if self._writer.pages:
+                self._close_shard()
+            else:
+                self._writer.abort()
+                self._writer = None
+        for temp_path, final_path in self._pending:
+            os.replace(temp_path, final_path)
+            self.shards.append(final_path)
+            if self.on_shard:
+                self.on_shard(final_path, self.shard_pages[len(self.shards) - 1])
+        self._pending = []
+        remove_stale_shards(self.output_path, keep=self.shards)
+
+    def abort(self):
+        """Прерывает запись: удаляет незавершённую и неопубликованные части (опубликованные остаются)."""
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+        for temp_path, _ in self._pending:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._pending = []
@@ -0,0 +1,222 @@
+"""
+Замена первой страницы PDF добавочным обновлением (incremental update).
+
+Вместо разбора и перезаписи всех страниц документа исходный файл копируется байт в байт, а в конец
+дописывается раздел обновления: объекты новой страницы, переопределённый объект первой страницы
+(с тем же номером, поэтому ссылки закладок и оглавления на неё остаются действительными) и таблица
+перекрёстных ссылок с /Prev на предыдущую. Остальные страницы и дерево страниц не переписываются,
+и время замены определяется размером нового титульника, а не документа.
+
+Если исходный файл заканчивается потоком перекрёстных ссылок (PDF 1.5+), раздел обновления тоже
+записывается потоком. Зашифрованные файлы так не обновляются: append_title_page() вызывает
+IncrementalUpdateError, и файл нужно переписать целиком.
+"""
+import os
+import shutil
+
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject,
+                            StreamObject)
+
+_TAIL_SIZE = 2048  # startxref ищется в конце файла
+_COPY_BUFFER = 1024 * 1024
+
+# Атрибуты, которые страница наследует от дерева страниц: без них новая страница унаследовала бы
+# значения из дерева исходного документа
+_INHERITED_DEFAULTS = {
+    "/Resources": DictionaryObject,
+    "/Rotate": lambda: NumberObject(0),
+}
+
+
+class IncrementalUpdateError(Exception):
+    """Файл нельзя обновить добавочным разделом; его нужно переписать целиком."""
+
+
+def _last_xref_offset(file):
+    """Возвращает смещение последней таблицы перекрёстных ссылок (значение startxref)."""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(max(0, size - _TAIL_SIZE))
+    tail = file.read()
+    position = tail.rfind(b"startxref")
+    if position < 0:
+        raise IncrementalUpdateError("В конце файла не найден startxref")
+    try:
+        return int(tail[position + len(b"startxref"):].split()[0])
+    except (IndexError, ValueError):
+        raise IncrementalUpdateError("Некорректное значение startxref") from None
+
+
+def _next_object_id(reader):
+    """Первый свободный номер объекта исходного файла."""
+    used = [int(reader.trailer.get("/Size", 0))]
+    used.extend(max(ids) + 1 for ids in reader.xref.values() if ids)
+    if reader.xref_objStm:
+        used.append(max(reader.xref_objStm) + 1)
+    return max(used)
+
+
+class _UpdateSection:
+    """Объекты раздела обновления, записываемые после исходных байтов файла."""
+
+    def __init__(self, file, next_id):
+        self.file = file
+        self.entries = {}  # номер объекта → (смещение, поколение)
+        self._next_id = next_id
+
+    def allocate_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    @property
+    def size(self):
+        return self._next_id
+
+    def write_object(self, obj_id, generation, obj):
+        self.entries[obj_id] = (self.file.tell(), generation)
+        self.file.write(b"%d %d obj\n" % (obj_id, generation))
+        obj.write_to_stream(self.file, None)
+        self.file.write(b"\nendobj\n")
+
+    def _subsections(self):
+        """Группирует номера объектов в непрерывные подразделы: [(первый номер, [номера])]."""
+        groups = []
+        for obj_id in sorted(self.entries):
+            if groups and groups[-1][0] + len(groups[-1][1]) == obj_id:
+                groups[-1][1].append(obj_id)
+            else:
+                groups.append((obj_id, [obj_id]))
+        return groups
+
+    def write_xref_table(self, trailer):
+        xref_offset = self.file.tell()
+        self.file.write(b"xref\n")
+        for first, ids in self._subsections():
+            self.file.write(b"%d %d\n" % (first, len(ids)))
+            for obj_id in ids:
+                offset, generation = self.entries[obj_id]
+                self.file.write(b"%010d %05d n \n" % (offset, generation))
+        trailer[NameObject("/Size")] = NumberObject(self.size)
+        self.file.write(b"trailer\n")
+        trailer.write_to_stream(self.file, None)
+        self.file.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+
+    def write_xref_stream(self, trailer):
+        xref_id = self.allocate_id()
+        xref_offset = self.file.tell()
+        self.entries[xref_id] = (xref_offset, 0)
+        offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+        index = ArrayObject()
+        data = bytearray()
+        for first, ids in self._subsections():
+            index.extend((NumberObject(first), NumberObject(len(ids))))
+            for obj_id in ids:
+                offset, generation = self.entries[obj_id]
+                data += b"\x01" + offset.to_bytes(offset_width, "big") + generation.to_bytes(2, "big")
+        stream = StreamObject()
+        stream._data = bytes(data)
+        stream.update(trailer)
+        stream.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(self.size),
+            NameObject("/Index"): index,
+            NameObject("/W"): ArrayObject(NumberObject(width) for width in (1, offset_width, 2)),
+        })
+        self.file.write(b"%d 0 obj\n" % xref_id)
+        stream.write_to_stream(self.file, None)
+        self.file.write(b"\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref_offset)
+
+
+def _translate(obj, mapping, section, pending):
+    """Копия объекта новой страницы со ссылками, перенумерованными для раздела обновления."""
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in mapping:
+            target = obj.get_object()
+            if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                return NullObject()
+            mapping[key] = (section.allocate_id(), 0)
+            pending.append((mapping[key], target))
+        obj_id, generation = mapping[key]
+        return IndirectObject(obj_id, generation, None)
+
+    if isinstance(obj, DictionaryObject):
+        if isinstance(obj, StreamObject):
+            copy = StreamObject()
+            copy._data = obj._data
+        else:
+            copy = DictionaryObject()
+        for key, value in obj.items():
+            if key == "/Length" and isinstance(obj, StreamObject):
+                continue  # длина потока вычисляется при записи
+            copy[NameObject(key)] = _translate(value, mapping, section, pending)
+        return copy
+
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_translate(value, mapping, section, pending) for value in obj)
+
+    return obj
+
+
+def append_title_page(source_path, reader, new_page, output_path):
+    """
+    Записывает в output_path копию source_path (reader — его PdfReader), в которой первая страница
+    заменена страницей new_page другого документа. Возвращает количество дописанных байтов.
+    Если файл нельзя обновить добавочным разделом, вызывает IncrementalUpdateError; output_path
+    при ошибке не создаётся.
+    """
+    if reader.is_encrypted:
+        raise IncrementalUpdateError("Файл зашифрован")
+    old_page = reader.pages[0]
+    page_ref = old_page.indirect_reference
+    parent_ref = old_page.raw_get("/Parent") if "/Parent" in old_page else None
+    if page_ref is None or not isinstance(parent_ref, IndirectObject):
+        raise IncrementalUpdateError("Первая страница не является косвенным объектом дерева страниц")
+
+    page_key = (page_ref.idnum, page_ref.generation)
+    mapping = {}  # ссылки документа new_page → (номер, поколение) в разделе обновления
+    if new_page.indirect_reference is not None:
+        mapping[(new_page.indirect_reference.idnum, new_page.indirect_reference.generation)] = page_key
+
+    temp_path = output_path + ".part"
+    try:
+        with open(source_path, "rb") as source, open(temp_path, "wb") as output:
+            prev_offset = _last_xref_offset(source)
+            source.seek(prev_offset)
+            xref_stream = not source.read(4).startswith(b"xref")
+            source.seek(0)
+            shutil.copyfileobj(source, output, _COPY_BUFFER)
+            source_size = output.tell()
+            source.seek(-1, os.SEEK_END)
+            if source.read(1) not in (b"\n", b"\r"):
+                output.write(b"\n")
+
+            section = _UpdateSection(output, _next_object_id(reader))
+            page = DictionaryObject({NameObject(key): new_page.raw_get(key) for key in new_page if key != "/Parent"})
+            for key, default in _INHERITED_DEFAULTS.items():
+                if key not in page:
+                    page[NameObject(key)] = default()
+            pending = []
+            page = _translate(page, mapping, section, pending)
+            # /Parent указывает в дерево страниц исходного файла
+            page[NameObject("/Parent")] = parent_ref
+            section.write_object(page_ref.idnum, page_ref.generation, page)
+            while pending:
+                (obj_id, generation), obj = pending.pop()
+                section.write_object(obj_id, generation, _translate(obj, mapping, section, pending))
+
+            trailer = DictionaryObject({NameObject("/Prev"): NumberObject(prev_offset)})
+            for key in ("/Root", "/Info", "/ID"):
+                if key in reader.trailer:
+                    trailer[NameObject(key)] = reader.trailer.raw_get(key)
+            if xref_stream:
+                section.write_xref_stream(trailer)
+            else:
+                section.write_xref_table(trailer)
+            appended = output.tell() - source_size
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return appended
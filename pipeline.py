@@ -0,0 +1,79 @@
+"""
+Конвейер обработки с ограниченными очередями между этапами.
+
+    documents = run_pipeline(export_results(), [verify, copy_and_merge], queue_size=2)
+
+Элементы источника (генератор выполняется в вызывающем потоке — там же, где был запущен Excel)
+проходят через функции этапов по порядку; каждый этап работает в собственном потоке, поэтому
+экспорт следующей книги идёт одновременно с проверкой и объединением предыдущих. Очереди между
+этапами ограничены: если этап отстаёт, предыдущий ждёт, а не накапливает элементы в памяти.
+Порядок элементов сохраняется.
+"""
+import queue
+import threading
+
+_DONE = object()
+
+
+def _stage_worker(func, source, target, errors):
+    """Поток этапа: применяет func к элементам source и передаёт результаты в target."""
+    while True:
+        item = source.get()
+        if item is _DONE:
+            break
+        if errors:
+            continue  # после ошибки элементы только вычитываются, чтобы предыдущие этапы не ждали
+        try:
+            result = func(item)
+        except BaseException as e:
+            errors.append(e)
+            continue
+        if result is not None:
+            target.put(result)
+    target.put(_DONE)
+
+
+def run_pipeline(source, stages, queue_size=2, threaded=True):
+    """
+    Пропускает элементы source через функции stages. Функция этапа возвращает элемент для следующего
+    этапа; None — элемент дальше не передаётся. Возвращает список результатов последнего этапа
+    в порядке source. При threaded=False все этапы выполняются в текущем потоке поэлементно.
+    Исключение этапа прекращает обработку следующих элементов и повторно вызывается после остановки потоков.
+    """
+    if not threaded:
+        results = []
+        for item in source:
+            for func in stages:
+                item = func(item)
+                if item is None:
+                    break
+            else:
+                results.append(item)
+        return results
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    results = queue.Queue()
+    errors = []
+    threads = [threading.Thread(target=_stage_worker, args=(func, queues[i], (queues + [results])[i + 1], errors),
+                                name=f"pipeline-{getattr(func, '__name__', i)}", daemon=True)
+               for i, func in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        for item in source:
+            if errors:
+                break
+            queues[0].put(item)
+    finally:
+        queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+    collected = []
+    while True:
+        item = results.get()
+        if item is _DONE:
+            return collected
+        collected.append(item)
@@ -0,0 +1,338 @@
+"""
+Служба рендерера: постоянный процесс с заранее запущенными («тёплыми») рендерерами.
+
+Холодный запуск Excel занимает несколько секунд; служба запускает рендереры один раз и принимает
+задания экспорта от GUI и консольных запусков через локальный канал (именованный канал Windows
+или сокет Unix, с ключом аутентификации). Адрес и ключ записываются в файл службы во временной
+папке пользователя; process_preprint() использует службу, если она запущена с тем же рендерером
+и параметрами, и экспортирует локально, если её нет.
+
+    python -m techdoc renderer-service start --renderer excel --workers 2
+    python -m techdoc renderer-service status
+    python -m techdoc renderer-service stop
+
+Каждый рабочий процесс службы держит собственный рендерер (как пул экспорта) и перед заданием
+проверяет, что он отвечает, перезапуская его при необходимости. Пока заданий нет, служба
+периодически проверяет рабочие процессы; если проверка не укладывается в отведённое время,
+пул пересоздаётся.
+
+Сообщения службы выводятся через log(); фоновая служба (start) пишет их в файл лога рядом с файлом
+службы (service_log_file()). Лог запуска рендереров рабочих процессов передаётся вместе с проверкой.
+"""
+import getpass
+import json
+import multiprocessing
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+PROTOCOL_VERSION = 1
+FAMILY = "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+HEALTH_INTERVAL_SEC = 60.0
+HEALTH_TIMEOUT_SEC = 30.0
+START_TIMEOUT_SEC = 120.0  # запуск рендереров (Excel) в фоновой службе
+
+
+def default_service_file():
+    """Файл службы текущего пользователя во временной папке."""
+    return os.path.join(tempfile.gettempdir(), f"techdoc_renderer_service_{getpass.getuser()}.json")
+
+
+def service_log_file(service_file=None):
+    """Файл лога службы: рядом с файлом службы, с расширением .log."""
+    return os.path.splitext(service_file or default_service_file())[0] + ".log"
+
+
+def _log(message, level="INFO"):
+    import TechDocExporter  # TechDocExporter импортирует этот модуль
+    TechDocExporter.log(message, level=level)
+
+
+def read_service_file(service_file=None):
+    """Возвращает сведения о службе из файла или None, если файла нет или он повреждён."""
+    try:
+        with open(service_file or default_service_file(), encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(info, dict) or info.get("protocol") != PROTOCOL_VERSION:
+        return None
+    return info
+
+
+def _write_service_file(path, info):
+    """Записывает файл службы, доступный только владельцу (в нём ключ аутентификации)."""
+    temp_path = path + ".tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(temp_path, path)
+
+
+class ServiceClient:
+    """Соединение со службой рендерера. Используется из одного потока."""
+
+    def __init__(self, info, connection):
+        self.info = info
+        self._connection = connection
+
+    def _request(self, message):
+        self._connection.send(message)
+        return self._connection.recv()
+
+    def status(self):
+        """Состояние службы: рендерер, количество процессов, результат последней проверки, выполнено заданий."""
+        return self._request({"op": "status"})
+
+    def stop(self):
+        """Останавливает службу после завершения текущих заданий."""
+        return self._request({"op": "stop"})
+
+    def export(self, config_state, jobs):
+        """
+        Отправляет задания экспорта (номер файла, имя файла, проверять PDF) с настройками config_state.
+        Возвращает генератор результатов в порядке jobs; при разрыве соединения вызывает OSError или EOFError.
+        """
+        self._connection.send({"op": "export", "config": config_state, "jobs": jobs})
+        while True:
+            message = self._connection.recv()
+            if "error" in message:
+                raise OSError(message["error"])
+            if message.get("done"):
+                return
+            yield message["result"]
+
+    def close(self):
+        self._connection.close()
+
+
+def connect(service_file=None):
+    """Подключается к запущенной службе. Возвращает ServiceClient или None, если служба не отвечает."""
+    info = read_service_file(service_file)
+    if info is None:
+        return None
+    try:
+        connection = Client(info["address"], family=info["family"], authkey=bytes.fromhex(info["authkey"]))
+    except (OSError, EOFError, AuthenticationError, ValueError, KeyError):
+        return None
+    return ServiceClient(info, connection)
+
+
+class RendererService:
+    """Служба рендерера renderer_name с параметрами renderer_options в workers рабочих процессах."""
+
+    def __init__(self, renderer_name, renderer_options=None, workers=1, service_file=None,
+                 health_interval=HEALTH_INTERVAL_SEC, health_timeout=HEALTH_TIMEOUT_SEC):
+        self.renderer_name = renderer_name
+        self.renderer_options = renderer_options or {}
+        self.workers = workers
+        self.service_file = service_file or default_service_file()
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.jobs_done = 0
+        self.last_health = None
+        self._pool = None
+        self._listener = None
+        self._authkey = None
+        self._lock = threading.Lock()
+        self._active_exports = 0
+        self._stop_event = threading.Event()
+
+    def _create_pool(self):
+        import TechDocExporter
+        return multiprocessing.get_context("spawn").Pool(
+            processes=self.workers,
+            initializer=TechDocExporter._service_worker_init,
+            initargs=(self.renderer_name, self.renderer_options)
+        )
+
+    def check_health(self):
+        """
+        Проверяет рабочие процессы: каждый сообщает, запущен ли его рендерер и отвечает ли он.
+        Возвращает {"ok", "responsive", "workers": [{"pid", "renderer_ok"}], "checked_at"};
+        responsive=False, если проверка не уложилась в health_timeout (пул завис).
+        """
+        import TechDocExporter
+        with self._lock:
+            pool = self._pool
+        try:
+            replies = pool.map_async(TechDocExporter._service_worker_health, range(self.workers),
+                                     chunksize=1).get(self.health_timeout)
+            # задания проверки распределяются пулом, поэтому один процесс может ответить несколько раз
+            workers = {}
+            for pid, renderer_ok, worker_log in replies:
+                if worker_log:
+                    print(worker_log, end="")
+                workers[pid] = renderer_ok
+            workers = [{"pid": pid, "renderer_ok": renderer_ok} for pid, renderer_ok in workers.items()]
+            health = {"ok": all(worker["renderer_ok"] for worker in workers), "responsive": True,
+                      "workers": workers}
+            for worker in workers:
+                if not worker["renderer_ok"]:
+                    _log(f"Рендерер рабочего процесса {worker['pid']} не запущен или не отвечает", level="WARNING")
+        except multiprocessing.TimeoutError:
+            _log(f"Рабочие процессы службы не ответили на проверку за {self.health_timeout} с", level="WARNING")
+            health = {"ok": False, "responsive": False, "workers": []}
+        health["checked_at"] = time.time()
+        self.last_health = health
+        return health
+
+    def _health_loop(self):
+        while not self._stop_event.wait(self.health_interval):
+            with self._lock:
+                if self._active_exports:
+                    continue  # во время экспорта проверка встала бы в очередь за заданиями
+            health = self.check_health()
+            if health["responsive"]:
+                continue
+            with self._lock:
+                if self._active_exports:
+                    continue
+                _log("Рабочие процессы службы не отвечают, пул пересоздаётся.", level="WARNING")
+                stale, self._pool = self._pool, self._create_pool()
+            stale.terminate()
+            stale.join()
+
+    def _export(self, connection, request):
+        import TechDocExporter
+        with self._lock:
+            self._active_exports += 1
+            pool = self._pool
+        try:
+            jobs = [(request["config"], tuple(job)) for job in request["jobs"]]
+            for result in pool.imap(TechDocExporter._service_worker_run, jobs):
+                connection.send({"result": result})
+                with self._lock:
+                    self.jobs_done += 1
+            connection.send({"done": True})
+        finally:
+            with self._lock:
+                self._active_exports -= 1
+
+    def _status(self):
+        with self._lock:
+            active = self._active_exports
+        return {"renderer": self.renderer_name, "renderer_options": self.renderer_options, "workers": self.workers,
+                "pid": os.getpid(), "jobs_done": self.jobs_done, "active_exports": active,
+                "health": self.last_health}
+
+    def _handle_connection(self, connection):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                op = request.get("op") if isinstance(request, dict) else None
+                if op == "export":
+                    self._export(connection, request)
+                elif op == "status":
+                    connection.send(self._status())
+                elif op == "stop":
+                    connection.send({"stopping": True})
+                    self._request_stop()
+                    return
+                else:
+                    connection.send({"error": f"Неизвестная операция: {op}"})
+        except (EOFError, OSError) as e:
+            _log(f"Клиент службы отключился во время ответа: {e}", level="DEBUG")
+        finally:
+            connection.close()
+
+    def _request_stop(self):
+        self._stop_event.set()
+        # accept() не прерывается закрытием слушателя, поэтому основной поток будится пустым подключением
+        try:
+            Client(self._listener.address, family=FAMILY, authkey=self._authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass
+
+    def serve_forever(self):
+        """
+        Запускает рендереры, записывает файл службы и обслуживает подключения до команды stop
+        (или Ctrl+C). Возвращает False, если служба уже запущена.
+        """
+        existing = connect(self.service_file)
+        if existing is not None:
+            existing.close()
+            _log(f"Служба рендерера уже запущена: {self.service_file}", level="ERROR")
+            return False
+
+        self._authkey = secrets.token_bytes(32)
+        self._pool = self._create_pool()
+        _log(f"Запуск рендереров ({self.renderer_name}, процессов: {self.workers})...")
+        health = self.check_health()
+        if not health["ok"]:
+            _log("Не все рендереры запустились; служба повторит запуск при первом задании.", level="WARNING")
+
+        self._listener = Listener(family=FAMILY, authkey=self._authkey)
+        _write_service_file(self.service_file, {
+            "protocol": PROTOCOL_VERSION, "address": self._listener.address, "family": FAMILY,
+            "authkey": self._authkey.hex(), "pid": os.getpid(), "renderer": self.renderer_name,
+            "renderer_options": self.renderer_options, "workers": self.workers,
+        })
+        _log(f"Служба рендерера готова: {self._listener.address} (PID {os.getpid()})")
+        threading.Thread(target=self._health_loop, name="renderer-service-health", daemon=True).start()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    connection = self._listener.accept()
+                except AuthenticationError:
+                    _log("Отклонено подключение к службе с неверным ключом", level="WARNING")
+                    continue
+                except (OSError, EOFError) as e:
+                    _log(f"Ошибка подключения к службе: {e}", level="WARNING")
+                    continue
+                if self._stop_event.is_set():
+                    connection.close()
+                    break
+                threading.Thread(target=self._handle_connection, args=(connection,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop_event.set()
+            info = read_service_file(self.service_file)
+            if info and info.get("pid") == os.getpid():
+                os.remove(self.service_file)
+            self._listener.close()
+            with self._lock:
+                pool, self._pool = self._pool, None
+            pool.close()  # рендереры рабочих процессов останавливаются при штатном завершении
+            pool.join()
+            _log(f"Служба рендерера остановлена. Выполнено заданий: {self.jobs_done}")
+        return True
+
+
+def start_background(arguments, log_file, service_file=None, timeout=START_TIMEOUT_SEC):
+    """
+    Запускает службу отдельным фоновым процессом (python -m techdoc renderer-service run <arguments>)
+    и ждёт её готовности. Лог службы записывается в log_file, туда же попадает stderr процесса
+    (необработанные исключения). Возвращает сведения о службе или None, если она не запустилась
+    за timeout секунд.
+    """
+    command = [sys.executable, "-m", "techdoc", "renderer-service", "run", *arguments,
+               "--quiet", "--log-file", log_file]
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    with open(log_file, "ab") as stderr:
+        options = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": stderr,
+                   "cwd": os.path.dirname(os.path.abspath(__file__))}
+        if sys.platform == "win32":
+            options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            options["start_new_session"] = True
+        process = subprocess.Popen(command, **options)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        client = connect(service_file)
+        if client is not None:
+            client.close()
+            return read_service_file(service_file)
+        if process.poll() is not None:
+            return None
+        time.sleep(0.2)
+    return None
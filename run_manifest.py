@@ -0,0 +1,160 @@
+"""
+Манифест запуска 'Подготовить к печати' для инкрементальной обработки.
+
+Манифест хранит для каждого исходного файла Excel хэш содержимого, количество исключаемых листов,
+имя созданного PDF в папке Service и отпечатки его страниц, а для каждого объединения —
+подпись входных данных. По ним повторный запуск определяет, какие книги нужно экспортировать заново
+и какие объединения пересобрать.
+
+Запись 'Заменить титульники' хранит для каждого файла папки Final, из какого PDF папки Service
+и какой страницы какого файла сканов он собран, — повторный запуск пересобирает только файлы
+с новым или изменённым титульником.
+"""
+import hashlib
+import json
+import os
+
+from PyPDF2 import PdfReader
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Возвращает SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _update_with_page(digest, page):
+    """Добавляет в хэш содержимое страницы: размер, поток содержимого и данные XObject (изображения, формы)."""
+    digest.update(repr([float(v) for v in page.mediabox]).encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if xobjects:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            xobject = xobjects[name].get_object()
+            digest.update(name.encode())
+            if hasattr(xobject, "get_data"):
+                digest.update(xobject.get_data())
+
+
+def pdf_page_fingerprints(pdf_path):
+    """
+    Возвращает (отпечаток титульной страницы, отпечаток остальных страниц) PDF-файла.
+    Отпечатки не зависят от имени файла и метаданных документа, поэтому повторный экспорт
+    неизменной книги даёт те же значения, а перенумерация файлов их не меняет.
+    """
+    return reader_page_fingerprints(PdfReader(pdf_path))
+
+
+def reader_page_fingerprints(reader):
+    """То же, что pdf_page_fingerprints(), для уже открытого PdfReader (без повторного разбора файла)."""
+    title_digest = hashlib.sha256()
+    body_digest = hashlib.sha256()
+    for i, page in enumerate(reader.pages):
+        _update_with_page(title_digest if i == 0 else body_digest, page)
+    return title_digest.hexdigest(), body_digest.hexdigest()
+
+
+def page_fingerprint(page):
+    """
+    Отпечаток отдельной страницы по закодированным данным потоков — без распаковки изображений,
+    поэтому подходит для страниц сканов по несколько мегабайт.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([float(v) for v in page.mediabox]).encode())
+    contents = page.get("/Contents")
+    for stream in _streams(contents):
+        digest.update(stream._data)
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if xobjects:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode())
+            for stream in _streams(xobjects[name]):
+                digest.update(stream._data)
+    return digest.hexdigest()
+
+
+def _streams(value):
+    """Потоки, на которые указывает значение словаря страницы (поток или массив потоков)."""
+    if value is None:
+        return []
+    value = value.get_object()
+    if isinstance(value, list):
+        return [item.get_object() for item in value]
+    return [value] if hasattr(value, "_data") else []
+
+
+def merge_signatures(documents):
+    """
+    Возвращает подписи входных данных объединений {режим: подпись} для упорядоченного списка документов
+    (словарей с ключами title_hash и body_hash).
+    """
+    parts = {
+        "full": [[doc["title_hash"], doc["body_hash"]] for doc in documents],
+        "title": [doc["title_hash"] for doc in documents],
+        "notitle": [doc["body_hash"] for doc in documents],
+    }
+    return {mode: hashlib.sha256(json.dumps(value).encode()).hexdigest() for mode, value in parts.items()}
+
+
+def load_manifest(manifest_path):
+    """Загружает манифест. Возвращает None, если файла нет, он повреждён или создан другой версией."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path, renderer, renderer_options, documents, merges):
+    """
+    Атомарно записывает манифест. renderer и renderer_options — рендерер, которым созданы PDF.
+    documents — упорядоченный список документов, merges — {режим: {"signature", "output", "pages"}}.
+    """
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "renderer": renderer,
+        "renderer_options": renderer_options,
+        "documents": {
+            doc["source"]: {
+                "sha256": doc["sha256"],
+                "exclude_count": doc["exclude_count"],
+                "service_pdf": os.path.basename(doc["pdf_path"]),
+                "pages": doc["pages"],
+                "title_hash": doc["title_hash"],
+                "body_hash": doc["body_hash"],
+            }
+            for doc in documents
+        },
+        "merges": merges,
+    }
+    _write_json(manifest_path, manifest)
+
+
+def save_postprint_record(record_path, documents, scan_files):
+    """
+    Атомарно записывает запись замены титульников (читается load_manifest).
+    documents — {файл Service: {"service_sha256", "final_pdf", "scan_file", "scan_page", "scan_hash"}},
+    scan_files — {файл сканов: {"sha256", "documents", "scan_indices"}}.
+    """
+    _write_json(record_path, {"version": MANIFEST_VERSION, "documents": documents, "scan_files": scan_files})
+
+
+def _write_json(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
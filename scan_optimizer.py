@@ -0,0 +1,215 @@
+"""
+Пережатие отсканированных титульников перед заменой первой страницы.
+
+Сканеры сохраняют страницы изображениями 600 dpi без сжатия, и каждая страница title_scan.pdf
+добавляет в документ Final несколько мегабайт. optimize_title_scan() один раз для всего файла
+уменьшает разрешение изображений до заданного, при возможности переводит их в оттенки серого
+или чёрно-белый режим и кодирует заново (JPEG, CCITT G4 или Flate). Изображение заменяется,
+только если результат меньше исходного.
+
+Используется Pillow; без него is_available() возвращает False и файл сканов используется как есть.
+"""
+import io
+import os
+import zlib
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, NumberObject
+
+try:
+    from PIL import Image, ImageChops, features
+except ImportError:
+    Image = None
+
+COLOR_MODES = ("auto", "color", "gray", "bilevel")
+
+# Режим auto: пиксель считается цветным, если его каналы различаются больше чем на _COLOR_DIFFERENCE;
+# скан переводится в серый, если таких пикселей не больше _COLORED_PIXELS_SHARE
+_COLOR_DIFFERENCE = 40
+_COLORED_PIXELS_SHARE = 0.0005
+_BILEVEL_THRESHOLD = 160
+
+
+def is_available():
+    """Проверяет, установлен ли Pillow."""
+    return Image is not None
+
+
+def _resolved(value):
+    """Значение словаря PDF с разрешённой косвенной ссылкой (DictionaryObject.get её не разрешает)."""
+    return value.get_object() if value is not None else None
+
+
+def _filters(xobject):
+    value = _resolved(xobject.get("/Filter"))
+    if value is None:
+        return []
+    return [_resolved(item) for item in value] if isinstance(value, ArrayObject) else [value]
+
+
+def _color_mode(xobject):
+    """Возвращает режим Pillow ("L" или "RGB") для цветового пространства изображения или None."""
+    color_space = _resolved(xobject.get("/ColorSpace"))
+    if isinstance(color_space, ArrayObject) and color_space and _resolved(color_space[0]) == "/ICCBased":
+        components = _resolved(color_space[1]).get("/N")
+        return {1: "L", 3: "RGB"}.get(_resolved(components))
+    if isinstance(color_space, ArrayObject):
+        return None
+    return {"/DeviceGray": "L", "/DeviceRGB": "RGB"}.get(color_space)
+
+
+def _decode_image(xobject):
+    """Декодирует изображение в объект Pillow. Возвращает None для неподдерживаемых форматов."""
+    if _resolved(xobject.get("/ImageMask")) or "/SMask" in xobject or "/Mask" in xobject:
+        return None
+    filters = _filters(xobject)
+    if filters == ["/DCTDecode"]:
+        image = Image.open(io.BytesIO(xobject._data))
+        image.load()
+        return image if image.mode in ("L", "RGB") else None
+
+    mode = _color_mode(xobject)
+    if filters in ([], ["/FlateDecode"]) and mode and _resolved(xobject.get("/BitsPerComponent")) == 8:
+        size = (int(xobject["/Width"]), int(xobject["/Height"]))
+        return Image.frombytes(mode, size, xobject.get_data())
+    return None
+
+
+def _is_grayish(image):
+    """
+    Проверяет, что цветное изображение фактически серое: доля пикселей с заметно различающимися
+    каналами мала. Небольшие цветные элементы (синяя печать, подпись) оставляют скан цветным.
+    """
+    sample = image.copy()
+    sample.thumbnail((512, 512))
+    red, green, blue = sample.split()
+    difference = ImageChops.lighter(ImageChops.lighter(ImageChops.difference(red, green),
+                                                       ImageChops.difference(green, blue)),
+                                    ImageChops.difference(red, blue))
+    histogram = difference.histogram()
+    colored = sum(histogram[_COLOR_DIFFERENCE:])
+    return colored <= _COLORED_PIXELS_SHARE * sample.width * sample.height
+
+
+def _encode_bilevel(image):
+    """
+    Кодирует изображение в чёрно-белое: CCITT G4 (если Pillow собран с libtiff), иначе Flate.
+    Возвращает (данные, словарь параметров потока).
+    """
+    width, height = image.size
+    gray = image.convert("L")
+    if features.check("libtiff"):
+        # Кодировщик G4 считает нулевые биты белыми, поэтому белые пиксели записываются нулями
+        bilevel = gray.point(lambda v: 0 if v >= _BILEVEL_THRESHOLD else 255, mode="1")
+        buffer = io.BytesIO()
+        bilevel.save(buffer, "TIFF", compression="group4", tiffinfo={278: height})
+        tiff = Image.open(io.BytesIO(buffer.getvalue()))
+        offsets, counts = tiff.tag_v2[273], tiff.tag_v2[279]
+        if len(offsets) == 1:
+            data = buffer.getvalue()[offsets[0]:offsets[0] + counts[0]]
+            params = DictionaryObject({
+                NameObject("/K"): NumberObject(-1),
+                NameObject("/Columns"): NumberObject(width),
+                NameObject("/Rows"): NumberObject(height),
+            })
+            return data, {"/Filter": NameObject("/CCITTFaxDecode"), "/DecodeParms": params}
+    bilevel = gray.point(lambda v: 255 if v >= _BILEVEL_THRESHOLD else 0, mode="1")
+    return zlib.compress(bilevel.tobytes()), {"/Filter": NameObject("/FlateDecode")}
+
+
+def _recompress(xobject, page_size, target_dpi, color_mode, jpeg_quality):
+    """Пережимает изображение на месте. Возвращает количество сэкономленных байт (0, если не заменено)."""
+    image = _decode_image(xobject)
+    if image is None:
+        return 0
+
+    # Скан занимает всю страницу, поэтому разрешение оценивается по размеру страницы
+    page_width_in, page_height_in = page_size[0] / 72, page_size[1] / 72
+    dpi = max(image.width / page_width_in, image.height / page_height_in)
+    if target_dpi and dpi > target_dpi * 1.05:
+        scale = target_dpi / dpi
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS)
+
+    if color_mode == "gray" or (color_mode == "auto" and image.mode == "RGB" and _is_grayish(image)):
+        image = image.convert("L")
+
+    if color_mode == "bilevel":
+        data, stream_keys = _encode_bilevel(image)
+        stream_keys.update({"/ColorSpace": NameObject("/DeviceGray"), "/BitsPerComponent": NumberObject(1)})
+    else:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=jpeg_quality, optimize=True)
+        data = buffer.getvalue()
+        stream_keys = {
+            "/Filter": NameObject("/DCTDecode"),
+            "/ColorSpace": NameObject("/DeviceGray" if image.mode == "L" else "/DeviceRGB"),
+            "/BitsPerComponent": NumberObject(8),
+        }
+
+    saved = len(xobject._data) - len(data)
+    if saved <= 0:
+        return 0
+    for key in ("/DecodeParms", "/Decode", "/Filter"):
+        xobject.pop(key, None)
+    xobject[NameObject("/Width")] = NumberObject(image.width)
+    xobject[NameObject("/Height")] = NumberObject(image.height)
+    for key, value in stream_keys.items():
+        xobject[NameObject(key)] = value
+    xobject._data = data
+    if hasattr(xobject, "decoded_self"):
+        xobject.decoded_self = None
+    return saved
+
+
+def _iter_images(resources, seen):
+    """Перебирает изображения ресурсов страницы, включая вложенные в формы; каждое — один раз."""
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return
+    for reference in xobjects.get_object().values():
+        key = getattr(reference, "idnum", None)
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        xobject = reference.get_object()
+        if xobject.get("/Subtype") == "/Image":
+            yield xobject
+        elif xobject.get("/Subtype") == "/Form":
+            form_resources = xobject.get("/Resources")
+            yield from _iter_images(form_resources.get_object() if form_resources else None, seen)
+
+
+def optimize_title_scan(source_path, output_path, target_dpi=200, color_mode="auto", jpeg_quality=75):
+    """
+    Записывает в output_path копию файла сканов с пережатыми изображениями.
+    color_mode: "auto" (серый, если скан фактически серый), "color", "gray" или "bilevel".
+    Возвращает словарь pages, images_recompressed, bytes_before, bytes_after.
+    """
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Неизвестный режим цвета: {color_mode}")
+    reader = PdfReader(source_path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+
+    recompressed = 0
+    seen = set()
+    for page in writer.pages:
+        page_size = (float(page.mediabox.width), float(page.mediabox.height))
+        resources = page.get("/Resources")
+        for xobject in _iter_images(resources.get_object() if resources else None, seen):
+            if _recompress(xobject, page_size, target_dpi, color_mode, jpeg_quality):
+                recompressed += 1
+
+    temp_path = output_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        writer.write(f)
+    os.replace(temp_path, output_path)
+    return {
+        "pages": len(writer.pages),
+        "images_recompressed": recompressed,
+        "bytes_before": os.path.getsize(source_path),
+        "bytes_after": os.path.getsize(output_path),
+    }
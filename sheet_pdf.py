@@ -0,0 +1,312 @@
+"""
+Вывод листов Excel, прочитанных xlsx_reader, в PDF без Excel.
+
+Каждый лист выводится на одну страницу, как в шаблонах документации: область печати (или
+используемый диапазон) уменьшается до размеров листа бумаги с учётом полей, ориентации и
+масштаба из параметров страницы. Переносятся значения ячеек с числовыми форматами, объединённые
+ячейки, ширина столбцов и высота строк, шрифт (размер, полужирный), выравнивание, поворот текста,
+границы и заливка.
+
+Используется reportlab; без него is_available() возвращает False. Для кириллицы нужен шрифт
+TrueType: по умолчанию ищется Arial (Windows), DejaVu Sans или Liberation Sans (Linux). Шрифты
+в программу не входят и устанавливаются в системе (например, пакеты fonts-dejavu-core или
+fonts-liberation); другой файл шрифта задаётся параметрами рендерера font_path и bold_font_path.
+"""
+import os
+
+try:
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont, TTFError
+    from reportlab.pdfgen import canvas as pdf_canvas
+except ImportError:
+    pdf_canvas = None
+
+# Пары (обычный, полужирный) шрифтов, которые ищутся по порядку, если шрифт не задан явно
+DEFAULT_FONT_FILES = [
+    (r"C:\Windows\Fonts\arial.ttf", r"C:\Windows\Fonts\arialbd.ttf"),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/dejavu/DejaVuSans.ttf", "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/dejavu-sans-fonts/DejaVuSans.ttf", "/usr/share/fonts/dejavu-sans-fonts/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+     "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"),
+    ("/usr/share/fonts/liberation-sans/LiberationSans-Regular.ttf",
+     "/usr/share/fonts/liberation-sans/LiberationSans-Bold.ttf"),
+]
+
+# Размеры бумаги по коду paperSize, в пунктах (книжная ориентация)
+PAPER_SIZES = {
+    1: (612.0, 792.0),  # Letter
+    5: (612.0, 1008.0),  # Legal
+    8: (841.89, 1190.55),  # A3
+    9: (595.28, 841.89),  # A4
+    11: (419.53, 595.28),  # A5
+    66: (1190.55, 1683.78),  # A2
+}
+
+_CELL_PADDING = 2.0
+_LINE_SPACING = 1.2
+_GRID_GRAY = 0.8
+
+
+def is_available():
+    """Проверяет, установлен ли reportlab."""
+    return pdf_canvas is not None
+
+
+class FontSet:
+    """Зарегистрированные в reportlab шрифты: regular, bold и признак поддержки кириллицы (unicode)."""
+
+    def __init__(self, regular, bold, unicode):
+        self.regular = regular
+        self.bold = bold
+        self.unicode = unicode
+
+
+def _register_font(path):
+    name = "TechDoc-" + os.path.splitext(os.path.basename(path))[0]
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, path))
+    return name
+
+
+def load_fonts(font_path=None, bold_font_path=None):
+    """
+    Регистрирует шрифты TrueType. Если font_path не задан, используется первая найденная пара из
+    DEFAULT_FONT_FILES; если не найдено ни одной — Helvetica без кириллицы.
+    Ошибка в явно заданном файле шрифта вызывает ValueError.
+    """
+    if font_path:
+        candidates = [(font_path, bold_font_path)]
+    else:
+        candidates = [pair for pair in DEFAULT_FONT_FILES if os.path.isfile(pair[0])]
+    for regular_path, bold_path in candidates:
+        try:
+            regular = _register_font(regular_path)
+            bold = _register_font(bold_path) if bold_path and os.path.isfile(bold_path) else regular
+        except (TTFError, OSError) as e:
+            if font_path:
+                raise ValueError(f"Не удалось загрузить шрифт '{font_path}': {e}") from e
+            continue
+        return FontSet(regular, bold, True)
+    return FontSet("Helvetica", "Helvetica-Bold", False)
+
+
+def column_points(width):
+    """Переводит ширину столбца Excel (в символах шрифта по умолчанию) в пункты."""
+    pixels = int(((256 * width + int(128 / 7)) / 256) * 7)
+    return pixels * 0.75
+
+
+def _axis_positions(first, last, size_of):
+    positions = [0.0]
+    for index in range(first, last + 1):
+        positions.append(positions[-1] + size_of(index))
+    return positions
+
+
+def _merged_cells(sheet, area):
+    """Возвращает {левая верхняя ячейка: правая нижняя} и множество скрытых объединением ячеек."""
+    row1, col1, row2, col2 = area
+    anchors, covered = {}, set()
+    for top, left, bottom, right in sheet.merged_ranges:
+        if bottom < row1 or top > row2 or right < col1 or left > col2:
+            continue
+        top, left = max(top, row1), max(left, col1)
+        bottom, right = min(bottom, row2), min(right, col2)
+        anchors[(top, left)] = (bottom, right)
+        for row in range(top, bottom + 1):
+            for column in range(left, right + 1):
+                if (row, column) != (top, left):
+                    covered.add((row, column))
+    return anchors, covered
+
+
+def _wrap_lines(text, font, size, width):
+    lines = []
+    for paragraph in text.split("\n"):
+        words = paragraph.split(" ")
+        line = words[0]
+        for word in words[1:]:
+            candidate = f"{line} {word}"
+            if pdfmetrics.stringWidth(candidate, font, size) <= width:
+                line = candidate
+            else:
+                lines.append(line)
+                line = word
+        lines.append(line)
+    return lines
+
+
+def _horizontal_alignment(style, value):
+    if style.horizontal in ("center", "centerContinuous", "distributed"):
+        return "center"
+    if style.horizontal == "right":
+        return "right"
+    if style.horizontal == "general" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return "right"
+    return "left"
+
+
+def _clip_to_cell(canvas, x, top, width, height):
+    path = canvas.beginPath()
+    path.rect(x, top - height, width, height)
+    canvas.clipPath(path, stroke=0, fill=0)
+
+
+def _draw_text(canvas, text, value, style, fonts, x, top, width, height):
+    font = fonts.bold if style.bold else fonts.regular
+    size = style.font_size
+    canvas.setFont(font, size)
+
+    # textRotation: 1–90 — против часовой стрелки, 91–180 — по часовой (90 - значение)
+    rotation = style.rotation if style.rotation <= 90 else 90 - style.rotation if style.rotation <= 180 else 0
+    if rotation:
+        canvas.saveState()
+        _clip_to_cell(canvas, x, top, width, height)
+        canvas.translate(x + width / 2, top - height / 2)
+        canvas.rotate(rotation)
+        canvas.drawCentredString(0, -size * 0.35, text.replace("\n", " "))
+        canvas.restoreState()
+        return
+
+    if style.wrap:
+        lines = _wrap_lines(text, font, size, max(width - 2 * _CELL_PADDING, size))
+    else:
+        lines = [text.replace("\n", " ")]
+    leading = size * _LINE_SPACING
+    block_height = leading * len(lines)
+    if style.vertical == "top":
+        block_top = top - _CELL_PADDING
+    elif style.vertical in ("center", "justify", "distributed"):
+        block_top = top - height / 2 + block_height / 2
+    else:
+        block_top = top - height + _CELL_PADDING + block_height
+
+    # Текст с переносом, как в Excel, не выходит за границы ячейки; однострочный может заходить на соседние
+    canvas.saveState()
+    if style.wrap:
+        _clip_to_cell(canvas, x, top, width, height)
+    alignment = _horizontal_alignment(style, value)
+    is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+    text_width = pdfmetrics.stringWidth(lines[0], font, size)
+    if is_number and text_width > width - 2 * _CELL_PADDING > 0:
+        # Числа не заходят на соседние ячейки; шрифт шире исходного (DejaVu вместо Calibri),
+        # поэтому вместо замены на ### число сжимается по ширине ячейки
+        canvas.translate(x, 0)
+        canvas.scale((width - 2 * _CELL_PADDING) / text_width, 1)
+        x, width = 0, text_width + 2 * _CELL_PADDING
+        alignment = "left"
+    for number, line in enumerate(lines):
+        baseline = block_top - number * leading - size * 0.9
+        if alignment == "center":
+            canvas.drawCentredString(x + width / 2, baseline, line)
+        elif alignment == "right":
+            canvas.drawRightString(x + width - _CELL_PADDING, baseline, line)
+        else:
+            canvas.drawString(x + _CELL_PADDING, baseline, line)
+    canvas.restoreState()
+
+
+def _page_transform(sheet, content_width, content_height):
+    """Возвращает (размер страницы, x и y левого верхнего угла области печати, масштаб)."""
+    setup = sheet.page_setup
+    page_width, page_height = PAPER_SIZES.get(setup.paper_size, PAPER_SIZES[9])
+    if setup.orientation == "landscape":
+        page_width, page_height = page_height, page_width
+    margins = {side: inches * 72 for side, inches in setup.margins.items()}
+    available_width = max(page_width - margins["left"] - margins["right"], 1.0)
+    available_height = max(page_height - margins["top"] - margins["bottom"], 1.0)
+
+    # Лист всегда выводится на одну страницу: область печати уменьшается, если не помещается
+    scale = min(setup.scale / 100 if setup.scale else 1.0,
+                available_width / content_width if content_width else 1.0,
+                available_height / content_height if content_height else 1.0)
+    x = margins["left"]
+    y = page_height - margins["top"]
+    if setup.horizontal_centered:
+        x += (available_width - content_width * scale) / 2
+    if setup.vertical_centered:
+        y -= (available_height - content_height * scale) / 2
+    return (page_width, page_height), x, y, scale
+
+
+def draw_sheet(canvas, sheet, fonts):
+    """Выводит лист на текущую страницу canvas шрифтами FontSet."""
+    area = sheet.print_range()
+    if area is None:
+        page_size, _, _, _ = _page_transform(sheet, 0, 0)
+        canvas.setPageSize(page_size)
+        return
+    row1, col1, row2, col2 = area
+    xs = _axis_positions(col1, col2, lambda column: 0.0 if column in sheet.hidden_columns else column_points(
+        sheet.column_widths.get(column, sheet.default_column_width)))
+    ys = _axis_positions(row1, row2, lambda row: 0.0 if row in sheet.hidden_rows else sheet.row_heights.get(
+        row, sheet.default_row_height))
+
+    page_size, x0, y0, scale = _page_transform(sheet, xs[-1], ys[-1])
+    canvas.setPageSize(page_size)
+    canvas.saveState()
+    canvas.translate(x0, y0)
+    canvas.scale(scale, scale)
+
+    anchors, covered = _merged_cells(sheet, area)
+    cells = [(key, value, style) for key, (value, style) in sorted(sheet.cells.items())
+             if row1 <= key[0] <= row2 and col1 <= key[1] <= col2]
+
+    def box(row, column):
+        bottom, right = anchors.get((row, column), (row, column))
+        left_x, right_x = xs[column - col1], xs[right - col1 + 1]
+        top_y, bottom_y = -ys[row - row1], -ys[bottom - row1 + 1]
+        return left_x, top_y, right_x - left_x, top_y - bottom_y
+
+    for (row, column), value, style in cells:
+        if style.fill and (row, column) not in covered:
+            x, top, width, height = box(row, column)
+            canvas.setFillColorRGB(*style.fill)
+            canvas.rect(x, top - height, width, height, stroke=0, fill=1)
+
+    if sheet.page_setup.grid_lines:
+        canvas.setStrokeGray(_GRID_GRAY)
+        canvas.setLineWidth(0.25)
+        for x in xs:
+            canvas.line(x, 0, x, -ys[-1])
+        for y in ys:
+            canvas.line(0, -y, xs[-1], -y)
+
+    canvas.setFillGray(0)
+    for (row, column), value, style in cells:
+        if (row, column) in covered or value in (None, ""):
+            continue
+        text = sheet.cell_text(row, column)
+        x, top, width, height = box(row, column)
+        if width and height:
+            _draw_text(canvas, text, value, style, fonts, x, top, width, height)
+
+    canvas.setStrokeGray(0)
+    canvas.setLineWidth(0.5)
+    for (row, column), value, style in cells:
+        if not style.borders:
+            continue
+        x, top = xs[column - col1], -ys[row - row1]
+        right, bottom = xs[column - col1 + 1], -ys[row - row1 + 1]
+        if "left" in style.borders:
+            canvas.line(x, top, x, bottom)
+        if "right" in style.borders:
+            canvas.line(right, top, right, bottom)
+        if "top" in style.borders:
+            canvas.line(x, top, right, top)
+        if "bottom" in style.borders:
+            canvas.line(x, bottom, right, bottom)
+    canvas.restoreState()
+
+
+def render_sheets(sheets, pdf_path, fonts):
+    """Выводит листы (итератор xlsx_reader.Sheet) в pdf_path по одной странице на лист. Возвращает число страниц."""
+    canvas = pdf_canvas.Canvas(pdf_path, pageCompression=1)
+    pages = 0
+    for sheet in sheets:
+        draw_sheet(canvas, sheet, fonts)
+        canvas.showPage()
+        pages += 1
+    canvas.save()
+    return pages
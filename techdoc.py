@@ -0,0 +1,396 @@
+"""
+Консольный режим утилиты подготовки документов (без GUI).
+
+    python -m techdoc check --base-dir D:\\Batch01
+    python -m techdoc preprint --base-dir D:\\Batch01 --dry-run
+    python -m techdoc preprint --base-dir D:\\Batch01 --workers 4
+    python -m techdoc preprint --base-dir D:\\Batch01 --shard-pages 500
+    python -m techdoc postprint --base-dir D:\\Batch01 --on-title-mismatch continue --workers 4
+    python -m techdoc watch --base-dir D:\\Batch01 --workers 4 --debounce 5
+    python -m techdoc renderer-service start --workers 4
+
+Лог выводится в stderr, итоговая сводка в формате JSON — в stdout (и, при необходимости, в файл).
+Коды возврата: 0 — успешно, 1 — завершено с ошибками, 2 — неверные аргументы,
+3 — процесс остановлен, 4 — отменено из-за несоответствия количества титульников.
+"""
+import argparse
+import collections
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import TechDocExporter
+from TechDocExporter import Config, RedirectText, log
+from log_writer import LogFileWriter
+import renderer_service
+import scan_optimizer
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+EXIT_CANCELLED = 4
+
+STATUS_EXIT_CODES = {
+    "ok": EXIT_OK,
+    "empty": EXIT_OK,
+    "errors": EXIT_ERRORS,
+    "failed": EXIT_FAILED,
+    "cancelled": EXIT_CANCELLED,
+}
+
+# Аргумент командной строки → атрибут Config
+PATH_OPTIONS = {
+    "excel_dir": "EXCEL_INPUT_DIR",
+    "print_dir": "PRINT_DIR",
+    "export_dir": "EXPORT_DIR",
+    "service_dir": "SERVICE_DIR",
+    "final_dir": "FINAL_OUTPUT_DIR",
+    "title_scan": "TITLE_SCAN_PDF",
+}
+
+
+def configure(args):
+    """Инициализирует Config из аргументов командной строки."""
+    Config.initialize_paths(args.base_dir)
+    for option, attribute in PATH_OPTIONS.items():
+        value = getattr(args, option)
+        if value:
+            setattr(Config, attribute, os.path.abspath(value))
+    if args.print_dir and not args.title_scan:
+        Config.TITLE_SCAN_PDF = os.path.join(Config.PRINT_DIR, "title_scan.pdf")
+    Config.LOG_LEVEL = args.log_level
+    Config.LOG_FILE = os.path.abspath(args.log_file) if args.log_file else None
+    Config.LOG_JSON = args.log_json
+    Config.TRACE = args.trace
+
+    if args.command in ("preprint", "watch"):
+        Config.RENDERER = args.renderer
+        Config.EXPORT_WORKERS = args.workers
+        Config.RENDERER_OPTIONS = args.renderer_options
+        Config.INCREMENTAL = args.command == "watch" or args.incremental
+        Config.XLSM_DIRECT_CONVERT = not args.xlsm_via_renderer
+        Config.MERGE_STREAMING = args.merge_streaming
+        Config.MERGE_MEMORY_LIMIT_MB = args.merge_memory_limit_mb
+        Config.MERGE_DEDUP = args.dedup
+        Config.MERGE_SHARD_MAX_PAGES = args.shard_pages
+        Config.MERGE_SHARD_MAX_MB = args.shard_mb
+        Config.PREPRINT_PIPELINE = not args.no_pipeline
+        Config.RENDERER_SERVICE = "never" if args.no_renderer_service else "auto"
+    if args.command in ("postprint", "watch"):
+        Config.TITLE_MISMATCH_POLICY = args.on_title_mismatch
+        Config.TITLE_MATCHING = args.title_matching
+        Config.TITLE_REPLACEMENT = args.title_replacement
+        if args.command == "postprint":
+            Config.INCREMENTAL = args.incremental
+        Config.POSTPRINT_WORKERS = args.postprint_workers if args.command == "watch" else args.workers
+        Config.SCAN_OPTIMIZE = args.optimize_scan
+        Config.SCAN_TARGET_DPI = args.scan_dpi
+        Config.SCAN_COLOR_MODE = args.scan_color
+        Config.SCAN_JPEG_QUALITY = args.scan_jpeg_quality
+    if args.command in ("preprint", "postprint", "watch"):
+        Config.LINEARIZE = args.linearize
+    if args.command == "watch":
+        Config.WATCH_DEBOUNCE_SEC = args.debounce
+        Config.WATCH_POLL_INTERVAL = args.poll_interval
+
+
+def run_check():
+    """Выводит список файлов Excel без их обработки."""
+    if not os.path.isdir(Config.EXCEL_INPUT_DIR):
+        log(f"Папка 'Excel' не найдена: {Config.EXCEL_INPUT_DIR}", level="ERROR")
+        return {"status": "failed", "excel_files": []}
+
+    files = TechDocExporter.find_excel_files()
+    if files:
+        log("Найдены файлы Excel в папке 'Excel':")
+        for f in files:
+            log(f"- {f}")
+    else:
+        log("В папке 'Excel' не найдено файлов для обработки (.xlsx, .xlsm, .xls).", level="INFO")
+    return {"status": "ok" if files else "empty", "excel_files": files}
+
+
+def _public_service_info(info):
+    """Сведения о службе для сводки (без ключа аутентификации)."""
+    return {key: value for key, value in info.items() if key != "authkey"}
+
+
+def _log_tail(path, lines=20):
+    """Последние строки файла лога (для сообщения об ошибке) или пустая строка, если файл не прочитан."""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return "".join(collections.deque(f, maxlen=lines)).rstrip("\n")
+    except OSError:
+        return ""
+
+
+def run_renderer_service(args):
+    """Управление службой рендерера: run (в текущем процессе), start (в фоне), status, stop."""
+    if args.action == "run":
+        service = renderer_service.RendererService(args.renderer, args.renderer_options, args.workers)
+        try:
+            if not service.serve_forever():
+                return {"status": "failed", "running": True}
+        except Exception as e:
+            log(f"Служба рендерера аварийно завершилась: {e}\n{traceback.format_exc()}", level="CRITICAL")
+            return {"status": "failed", "running": False}
+        return {"status": "ok", "running": False, "jobs_done": service.jobs_done}
+
+    client = renderer_service.connect()
+    if args.action == "start":
+        if client is not None:
+            client.close()
+            log("Служба рендерера уже запущена.", level="WARNING")
+            return {"status": "ok", "running": True, "service": _public_service_info(client.info)}
+        arguments = ["--renderer", args.renderer, "--workers", str(args.workers),
+                     "--renderer-options", json.dumps(args.renderer_options), "--log-level", Config.LOG_LEVEL]
+        if Config.LOG_JSON:
+            arguments.append("--log-json")
+        log_file = Config.LOG_FILE or renderer_service.service_log_file()
+        log(f"Запуск службы рендерера ({args.renderer}, процессов: {args.workers}), лог: {log_file}")
+        info = renderer_service.start_background(arguments, log_file)
+        if info is None:
+            log(f"Служба рендерера не запустилась, подробности в логе службы: {log_file}\n"
+                f"{_log_tail(log_file)}", level="ERROR")
+            return {"status": "failed", "running": False, "log_file": log_file}
+        log(f"Служба рендерера запущена, PID {info['pid']}.")
+        return {"status": "ok", "running": True, "service": _public_service_info(info), "log_file": log_file}
+
+    if client is None:
+        log("Служба рендерера не запущена.", level="INFO")
+        return {"status": "empty", "running": False}
+    try:
+        if args.action == "status":
+            return {"status": "ok", "running": True, "service": client.status()}
+        client.stop()
+        log(f"Служба рендерера (PID {client.info['pid']}) остановлена.")
+        return {"status": "ok", "running": False}
+    except (OSError, EOFError) as e:
+        log(f"Служба рендерера не ответила: {e}", level="ERROR")
+        return {"status": "failed", "running": False}
+    finally:
+        client.close()
+
+
+COMMANDS = {
+    "check": run_check,
+    "preprint": TechDocExporter.process_preprint,
+    "postprint": TechDocExporter.process_postprint,
+    "watch": TechDocExporter.process_watch,
+}
+
+
+def _json_object(value):
+    try:
+        parsed = json.loads(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"некорректный JSON: {e}")
+    if not isinstance(parsed, dict):
+        raise argparse.ArgumentTypeError("ожидается JSON-объект")
+    return parsed
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("значение должно быть не меньше 1")
+    return number
+
+
+def _jpeg_quality(value):
+    number = int(value)
+    if not 1 <= number <= 95:
+        raise argparse.ArgumentTypeError("значение должно быть от 1 до 95")
+    return number
+
+
+def _positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("значение должно быть больше 0")
+    return number
+
+
+def _add_preprint_options(parser):
+    """Параметры подготовки к печати (команды preprint и watch)."""
+    parser.add_argument("--renderer", default=Config.RENDERER,
+                        choices=sorted(TechDocExporter.RENDERERS),
+                        help="Рендерер Excel → PDF (по умолчанию: %(default)s)")
+    parser.add_argument("--workers", type=_positive_int, default=Config.EXPORT_WORKERS,
+                        help="Количество параллельных процессов экспорта (по умолчанию: %(default)s)")
+    parser.add_argument("--renderer-options", type=_json_object, default={},
+                        help="Параметры рендерера в виде JSON-объекта")
+    parser.add_argument("--xlsm-via-renderer", action="store_true",
+                        help="Конвертировать .xlsm в .xlsx рендерером (Excel), а не напрямую")
+    parser.add_argument("--merge-streaming", choices=["auto", "always", "never"],
+                        default=Config.MERGE_STREAMING,
+                        help="Потоковая запись объединённых PDF (по умолчанию: %(default)s — "
+                             "если объединение не помещается в лимит памяти)")
+    parser.add_argument("--merge-memory-limit-mb", type=_positive_int, default=Config.MERGE_MEMORY_LIMIT_MB,
+                        help="Лимит памяти для объединения в режиме auto, МБ (по умолчанию: %(default)s)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Записывать одинаковые шрифты и изображения в объединённые PDF один раз")
+    parser.add_argument("--shard-pages", type=_positive_int, default=Config.MERGE_SHARD_MAX_PAGES,
+                        help="Делить complete_merged.pdf и no_title_merged.pdf на части _part01, _part02, ... "
+                             "не больше указанного количества страниц (по границам документов)")
+    parser.add_argument("--shard-mb", type=_positive_int, default=Config.MERGE_SHARD_MAX_MB,
+                        help="Делить complete_merged.pdf и no_title_merged.pdf на части не больше указанного "
+                             "размера, МБ (по границам документов)")
+    parser.add_argument("--no-pipeline", action="store_true",
+                        help="Проверять, копировать и объединять PDF в том же потоке, что и экспорт "
+                             "(по умолчанию это делается параллельно с экспортом следующих книг)")
+    parser.add_argument("--no-renderer-service", action="store_true",
+                        help="Не использовать запущенную службу рендерера, запускать рендереры заново")
+
+
+def _add_postprint_options(parser, workers_option="--workers"):
+    """Параметры замены титульников (команды postprint и watch)."""
+    parser.add_argument("--on-title-mismatch", choices=["abort", "continue"], default="abort",
+                        help="Действие при несовпадении количества титульников и файлов "
+                             "(по умолчанию: %(default)s)")
+    parser.add_argument("--title-matching", choices=["auto", "positional"], default=Config.TITLE_MATCHING,
+                        help="Сопоставление страниц title_scan.pdf с файлами: auto — по изображению титульников "
+                             "(нужны NumPy и PyMuPDF), positional — по порядку страниц (по умолчанию: %(default)s)")
+    parser.add_argument("--title-replacement", choices=["rewrite", "append"], default=Config.TITLE_REPLACEMENT,
+                        help="Замена титульника: rewrite — файл переписывается целиком, append — исходные байты "
+                             "копируются и дополняются добавочным обновлением с новой страницей "
+                             "(по умолчанию: %(default)s)")
+    parser.add_argument(workers_option, type=_positive_int, default=Config.POSTPRINT_WORKERS,
+                        help="Количество параллельных процессов замены титульников "
+                             "(по умолчанию: %(default)s)")
+    parser.add_argument("--optimize-scan", action="store_true",
+                        help="Пережать изображения title_scan.pdf перед заменой титульников (нужен Pillow)")
+    parser.add_argument("--scan-dpi", type=_positive_int, default=Config.SCAN_TARGET_DPI,
+                        help="Разрешение пережатых сканов (по умолчанию: %(default)s)")
+    parser.add_argument("--scan-color", choices=scan_optimizer.COLOR_MODES, default=Config.SCAN_COLOR_MODE,
+                        help="Режим цвета пережатых сканов (по умолчанию: %(default)s)")
+    parser.add_argument("--scan-jpeg-quality", type=_jpeg_quality, default=Config.SCAN_JPEG_QUALITY,
+                        help="Качество JPEG пережатых сканов, 1–95 (по умолчанию: %(default)s)")
+
+
+def _add_linearize_option(parser):
+    parser.add_argument("--linearize", action="store_true",
+                        help="Записывать объединения Print и файлы Final линеаризованными: первая страница "
+                             "открывается с сетевой папки без загрузки всего файла (нужен pikepdf)")
+
+
+def build_parser():
+    """Создаёт парсер аргументов командной строки."""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--base-dir", help="Рабочая папка (по умолчанию — папка программы)")
+    common.add_argument("--excel-dir", help="Папка с исходными файлами Excel")
+    common.add_argument("--print-dir", help="Папка Print")
+    common.add_argument("--export-dir", help="Папка NotSignedExport")
+    common.add_argument("--service-dir", help="Папка Service")
+    common.add_argument("--final-dir", help="Папка Final")
+    common.add_argument("--title-scan", help="Файл со сканами титульников (по умолчанию Print/title_scan.pdf)")
+    common.add_argument("--summary-file", help="Дополнительно записать JSON-сводку в файл")
+    common.add_argument("--quiet", action="store_true", help="Не выводить лог в stderr")
+    common.add_argument("--log-level", choices=list(TechDocExporter.LOG_LEVELS), default=Config.LOG_LEVEL,
+                        help="Минимальный уровень сообщений лога (по умолчанию: %(default)s)")
+    common.add_argument("--log-file", help="Дополнительно записывать лог в файл (с ротацией по размеру)")
+    common.add_argument("--log-json", action="store_true", help="Записывать файл лога в формате JSON Lines")
+    common.add_argument("--trace", action="store_true",
+                        help="Замерить время этапов: таблица в сводке и trace_<команда>.json в папке Service")
+
+    parser = argparse.ArgumentParser(prog="python -m techdoc",
+                                     description="Подготовка технической документации к печати без GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("check", parents=[common], help="Проверить файлы Excel")
+
+    preprint_parser = subparsers.add_parser("preprint", parents=[common], help="Подготовить к печати")
+    _add_preprint_options(preprint_parser)
+    _add_linearize_option(preprint_parser)
+    preprint_parser.add_argument("--dry-run", action="store_true",
+                                 help="Только вывести план (номера файлов, ожидаемые страницы, проблемы) "
+                                      "по архивам книг, без Excel, экспорта и очистки папок")
+    preprint_parser.add_argument("--incremental", action="store_true",
+                                 help="Экспортировать только новые и изменённые книги и пересобрать только "
+                                      "затронутые объединения")
+
+    postprint_parser = subparsers.add_parser("postprint", parents=[common], help="Заменить титульники")
+    _add_postprint_options(postprint_parser)
+    _add_linearize_option(postprint_parser)
+    postprint_parser.add_argument("--incremental", action="store_true",
+                                  help="Собрать только файлы Final с новым или изменённым титульником "
+                                       "(сканы могут приходить частями: title_scan_<номера>.pdf)")
+
+    watch_parser = subparsers.add_parser("watch", parents=[common],
+                                         help="Следить за папкой Excel и файлом сканов и запускать обработку")
+    _add_preprint_options(watch_parser)
+    _add_postprint_options(watch_parser, workers_option="--postprint-workers")
+    _add_linearize_option(watch_parser)
+    watch_parser.add_argument("--debounce", type=_positive_float, default=Config.WATCH_DEBOUNCE_SEC,
+                              help="Запускать обработку, когда файлы не меняются столько секунд "
+                                   "(по умолчанию: %(default)s)")
+    watch_parser.add_argument("--poll-interval", type=_positive_float, default=Config.WATCH_POLL_INTERVAL,
+                              help="Интервал опроса папок, если inotify недоступен, с (по умолчанию: %(default)s)")
+    watch_parser.add_argument("--max-runs", type=_positive_int, default=0,
+                              help="Завершить наблюдение после указанного количества запусков")
+
+    service_parser = subparsers.add_parser("renderer-service", parents=[common],
+                                           help="Служба с заранее запущенными рендерерами для preprint и watch")
+    service_parser.add_argument("action", choices=["run", "start", "status", "stop"],
+                                help="run — работать в текущем процессе, start — запустить в фоне, "
+                                     "status — состояние, stop — остановить")
+    service_parser.add_argument("--renderer", default=Config.RENDERER, choices=sorted(TechDocExporter.RENDERERS),
+                                help="Рендерер Excel → PDF (по умолчанию: %(default)s)")
+    service_parser.add_argument("--workers", type=_positive_int, default=Config.EXPORT_WORKERS,
+                                help="Количество рабочих процессов с рендерером (по умолчанию: %(default)s)")
+    service_parser.add_argument("--renderer-options", type=_json_object, default={},
+                                help="Параметры рендерера в виде JSON-объекта")
+    return parser
+
+
+def main(argv=None):
+    """Точка входа консольного режима. Возвращает код возврата."""
+    args = build_parser().parse_args(argv)
+    configure(args)
+
+    started = time.time()
+    log_file_writer = None
+    if Config.LOG_FILE:
+        log_file_writer = LogFileWriter(Config.LOG_FILE, Config.LOG_MAX_BYTES, Config.LOG_BACKUP_COUNT,
+                                        Config.LOG_JSON)
+    log_stream = RedirectText(None, None if args.quiet else sys.stderr, log_file_writer)
+    try:
+        with contextlib.redirect_stdout(log_stream):
+            if args.command == "preprint" and args.dry_run:
+                summary = TechDocExporter.process_preprint_plan()
+            elif args.command == "watch":
+                summary = TechDocExporter.process_watch(max_runs=args.max_runs)
+            elif args.command == "renderer-service":
+                summary = run_renderer_service(args)
+            else:
+                summary = COMMANDS[args.command]()
+    finally:
+        if log_file_writer:
+            log_file_writer.close()
+
+    status = summary.get("status", "failed")
+    exit_code = STATUS_EXIT_CODES.get(status, EXIT_FAILED)
+    report = {
+        "command": args.command,
+        "status": status,
+        "exit_code": exit_code,
+        "duration_sec": round(time.time() - started, 3),
+        "base_dir": Config.BASE_DIR,
+        "summary": summary,
+    }
+    report_text = json.dumps(report, indent=2)
+    print(report_text)
+    if args.summary_file:
+        with open(args.summary_file, "w", encoding="utf-8") as f:
+            f.write(report_text + "\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Проверка пула экспорта на рендерере fake (без Excel): несколько процессов spawn, книга с ошибкой
+и сплошная перенумерация NNN_ файлов папки Service в порядке исходного списка.
+
+    python -m pytest -q test_export_pool.py
+"""
+import os
+
+import pytest
+
+import TechDocExporter
+from TechDocExporter import Config
+
+WORKBOOKS = ["001_Пояснительная записка", "002_Ведомость_bad", "003_Спецификация", "004_Чертежи", "005_Расчёт"]
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Настройки Config для запуска в tmp_path; после теста восстанавливаются."""
+    saved = {name: value for name, value in vars(Config).items() if name.isupper()}
+    Config.initialize_paths(str(tmp_path))
+    os.makedirs(Config.EXCEL_INPUT_DIR)
+    for name in WORKBOOKS:
+        with open(os.path.join(Config.EXCEL_INPUT_DIR, name + ".xlsx"), "wb") as f:
+            f.write(name.encode())  # рендерер fake не читает книгу
+    Config.RENDERER = "fake"
+    Config.RENDERER_OPTIONS = {"sheet_count": 2, "fail_on": ["_bad"]}
+    Config.EXPORT_WORKERS = 3
+    Config.RENDERER_SERVICE = "never"
+    Config.LOG_LEVEL = "INFO"
+    yield Config
+    for name, value in saved.items():
+        setattr(Config, name, value)
+
+
+def test_pool_export_keeps_order_and_counts_errors(config, capsys):
+    summary = TechDocExporter.process_preprint()
+
+    assert "Экспорт в 3 процессах (рендерер: fake)" in capsys.readouterr().out
+    assert summary["status"] == "errors"
+    assert summary["pdf_export_errors"] == 1
+    assert summary["excel_files_processed_to_pdf"] == 4
+    assert summary["total_pdf_exported_pages"] == 8
+    # номера сплошные, книга с ошибкой пропущена, порядок — как в исходном списке
+    assert sorted(name for name in os.listdir(Config.SERVICE_DIR) if name.endswith(".pdf")) == [
+        "001_001_Пояснительная записка.pdf",
+        "002_003_Спецификация.pdf",
+        "003_004_Чертежи.pdf",
+        "004_005_Расчёт.pdf",
+    ]
@@ -0,0 +1,285 @@
+"""
+Сопоставление отсканированных титульников с документами по изображению страниц.
+
+Замена титульников по порядку страниц title_scan.pdf ломается от одного переложенного листа:
+все следующие документы получают чужие подписанные титульники. match_titles() растрирует первые
+страницы документов и страницы сканов в маленькие миниатюры, считает перцептивные хеши (DCT
+миниатюры, как в pHash), строит матрицу расстояний Хэмминга между всеми парами одной операцией
+над матрицами и решает задачу о назначениях (венгерский алгоритм).
+
+Назначение, отличающееся от порядка страниц, принимается, только если все перестановки уверенные:
+страница сканов похожа на свой документ и заметно ближе к нему, чем пары по порядку страниц. Иначе
+используется порядок страниц, а сомнительные пары попадают в отчёт. Пропущенный или лишний лист
+сканов сдвигает назначение только у следующих за ним документов.
+
+Нужны NumPy и PyMuPDF; без них is_available() возвращает False и титульники заменяются по порядку.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# Размер стороны растрированной страницы и миниатюры, по которой считается хеш
+RENDER_SIZE = 512
+THUMBNAIL_SIZE = 64
+# Хеш — знаки HASH_SIZE × HASH_SIZE низкочастотных коэффициентов DCT относительно медианы.
+# Титульники одного комплекта различаются только текстом, поэтому хеш длиннее обычных 64 бит
+HASH_SIZE = 24
+HASH_BITS = HASH_SIZE * HASH_SIZE - 1  # без постоянной составляющей
+
+# Яркость бумаги — этот процентиль яркости страницы. «Чернила» — насколько пиксель темнее бумаги
+# сверх _INK_FLOOR: оттенок бумаги, фон сканера и шум JPEG в миниатюру не попадают
+_PAPER_PERCENTILE = 90
+_INK_FLOOR = 48
+# Миниатюра обрезается по содержимому: отбрасываются поля, где лежит эта доля «чернил» с каждой стороны.
+# Граница по массе, а не по первому тёмному пикселю, не зависит от размытия скана и пылинок
+_CROP_SHARE = 0.002
+
+# Пара уверенная, если доля различающихся бит не больше MAX_DISTANCE; перестановка уверенная,
+# если назначенная страница ближе к документу, чем страница на его месте по порядку, хотя бы на MIN_GAIN
+MAX_DISTANCE = 0.35
+MIN_GAIN = 0.03
+
+
+def is_available():
+    """Проверяет, установлены ли NumPy и PyMuPDF."""
+    return numpy is not None and pymupdf is not None
+
+
+def _resize(image, size):
+    """Уменьшает изображение до size × size усреднением по областям (увеличивает — ближайшим соседом)."""
+    for axis in (0, 1):
+        length = image.shape[axis]
+        if length >= size:
+            starts = numpy.arange(size) * length // size
+            counts = numpy.diff(numpy.append(starts, length))
+            image = numpy.add.reduceat(image, starts, axis=axis) / numpy.expand_dims(counts, 1 - axis)
+        else:
+            image = numpy.take(image, numpy.arange(size) * length // size, axis=axis)
+    return image
+
+
+def _content_bounds(profile):
+    """Границы содержимого по профилю «чернил» вдоль одной оси."""
+    cumulative = numpy.cumsum(profile)
+    cumulative /= cumulative[-1]
+    return int(numpy.searchsorted(cumulative, _CROP_SHARE)), int(numpy.searchsorted(cumulative, 1 - _CROP_SHARE)) + 1
+
+
+def page_thumbnail(page):
+    """
+    Миниатюра страницы PyMuPDF THUMBNAIL_SIZE × THUMBNAIL_SIZE: количество «чернил», обрезанное по
+    содержимому, — сдвиг листа в сканере и поля на хеш не влияют.
+    """
+    zoom = RENDER_SIZE / max(page.rect.width, page.rect.height)
+    pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csGRAY, alpha=False)
+    image = numpy.frombuffer(pixmap.samples, dtype=numpy.uint8).reshape(pixmap.height, pixmap.stride)
+    image = image[:, :pixmap.width].astype(numpy.float32)
+    ink = numpy.clip(numpy.percentile(image, _PAPER_PERCENTILE) - _INK_FLOOR - image, 0, None)
+    if ink.any():
+        top, bottom = _content_bounds(ink.sum(axis=1))
+        left, right = _content_bounds(ink.sum(axis=0))
+        ink = ink[top:bottom, left:right]
+    return _resize(ink, THUMBNAIL_SIZE)
+
+
+def first_page_thumbnails(pdf_paths):
+    """Миниатюры первых страниц файлов pdf_paths: массив (файлов, размер, размер)."""
+    thumbnails = []
+    for path in pdf_paths:
+        with pymupdf.open(path) as document:
+            thumbnails.append(page_thumbnail(document[0]))
+    return numpy.stack(thumbnails)
+
+
+def pdf_thumbnails(pdf_path):
+    """Миниатюры всех страниц файла pdf_path: массив (страниц, размер, размер)."""
+    with pymupdf.open(pdf_path) as document:
+        return numpy.stack([page_thumbnail(page) for page in document])
+
+
+def _dct_matrix(size):
+    """Матрица DCT-II размера size × size (ортонормированная)."""
+    k = numpy.arange(size)[:, None]
+    n = numpy.arange(size)[None, :]
+    matrix = numpy.cos(math.pi * (2 * n + 1) * k / (2 * size)) * math.sqrt(2 / size)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+
+def perceptual_hashes(thumbnails):
+    """
+    Перцептивные хеши миниатюр (массив (n, размер, размер)) — булев массив (n, HASH_BITS).
+    DCT считается для всех миниатюр сразу двумя матричными умножениями.
+    """
+    dct = _dct_matrix(thumbnails.shape[1])[:HASH_SIZE]
+    coefficients = numpy.einsum("ij,njk,lk->nil", dct, thumbnails, dct, optimize=True)
+    coefficients = coefficients.reshape(len(thumbnails), -1)[:, 1:]
+    return coefficients > numpy.median(coefficients, axis=1, keepdims=True)
+
+
+def hamming_distances(hashes_a, hashes_b):
+    """Матрица расстояний Хэмминга (len(hashes_a), len(hashes_b)) между булевыми хешами."""
+    a = hashes_a.astype(numpy.float32)
+    b = hashes_b.astype(numpy.float32)
+    return (a @ (1 - b).T + (1 - a) @ b.T).round().astype(numpy.int32)
+
+
+def linear_assignment(cost):
+    """
+    Назначение минимальной суммарной стоимости для матрицы cost (строк не больше, чем столбцов):
+    возвращает массив — столбец для каждой строки. Венгерский алгоритм с потенциалами;
+    просмотр столбцов на каждом шаге выполняется векторно.
+    """
+    rows, columns = cost.shape
+    best = cost.argmin(axis=1)
+    if len(numpy.unique(best)) == rows:
+        return best  # у каждой строки свой минимальный столбец — это и есть оптимум
+
+    cost = cost.astype(numpy.float64)
+    u = numpy.zeros(rows + 1)
+    v = numpy.zeros(columns + 1)
+    owner = numpy.zeros(columns + 1, dtype=numpy.int64)  # строка (с 1) для столбца (с 1); 0 — свободен
+    way = numpy.zeros(columns + 1, dtype=numpy.int64)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        column = 0
+        min_values = numpy.full(columns + 1, numpy.inf)
+        used = numpy.zeros(columns + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = owner[column]
+            free = ~used[1:]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            improved = free & (reduced < min_values[1:])
+            min_values[1:][improved] = reduced[improved]
+            way[1:][improved] = column
+            candidates = numpy.where(free, min_values[1:], numpy.inf)
+            next_column = int(candidates.argmin()) + 1
+            delta = candidates[next_column - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_values[1:][free] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    assignment = numpy.empty(rows, dtype=numpy.int64)
+    assigned_columns = numpy.flatnonzero(owner[1:])
+    assignment[owner[1:][assigned_columns] - 1] = assigned_columns
+    return assignment
+
+
+def _gains(distances, documents, scans):
+    """
+    Выигрыш перестановок: насколько назначенная пара ближе, чем пары по порядку — документ со
+    страницей на его месте и страница со своим документом по порядку (меньшее из двух).
+    """
+    documents_count, scans_count = distances.shape
+    pair_distances = distances[documents, scans].astype(numpy.float64)
+    by_document = numpy.full(len(documents), numpy.inf)
+    has_scan = documents < scans_count
+    by_document[has_scan] = distances[documents[has_scan], documents[has_scan]] - pair_distances[has_scan]
+    by_scan = numpy.full(len(scans), numpy.inf)
+    has_document = scans < documents_count
+    by_scan[has_document] = distances[scans[has_document], scans[has_document]] - pair_distances[has_document]
+    return numpy.minimum(by_document, by_scan)
+
+
+def _margins(distances, documents, scans):
+    """Запас пар: насколько ближайшая чужая пара документа или страницы дальше назначенной."""
+    masked = distances.astype(numpy.float64)
+    masked[documents, scans] = numpy.inf
+    nearest_other = numpy.minimum(masked[documents].min(axis=1), masked[:, scans].min(axis=0))
+    return nearest_other - distances[documents, scans]
+
+
+def match_distances(distances, positional=True):
+    """
+    Сопоставляет документы (строки distances) со страницами сканов (столбцы).
+    positional=False — у страниц нет ожидаемого порядка (файл сканов с частью титульников вразброс):
+    уверенность пары определяется по ближайшей чужой паре, неуверенные пары не назначаются.
+    Возвращает словарь:
+      "method" — "hash" (назначение по изображению) или "positional" (по порядку страниц);
+      "scan_indices" — номер страницы сканов (с 0) для каждого документа или None;
+      "reordered" — принятые перестановки: {"document", "scan_page", "distance", "gain"}
+      (при positional=False перестановок нет, а "gain" — запас до ближайшей чужой пары);
+      "uncertain" — пары того же вида, в которых нельзя быть уверенным: отвергнутые перестановки
+      и пары, в которых страница сканов не похожа на документ ("gain" — None);
+      "unused_scan_pages" — страницы сканов, не назначенные ни одному документу.
+    Расстояния и выигрыш — доли бит хеша; пары упорядочены по документам.
+    """
+    documents_count, scans_count = distances.shape
+    if documents_count <= scans_count:
+        documents = numpy.arange(documents_count)
+        scans = linear_assignment(distances)
+    else:
+        documents = linear_assignment(distances.T)
+        scans = numpy.arange(scans_count)
+
+    def pair(document, scan, gain=None):
+        return {"document": int(document), "scan_page": int(scan),
+                "distance": round(float(distances[document, scan]) / HASH_BITS, 3),
+                "gain": None if gain is None else round(min(float(gain), HASH_BITS) / HASH_BITS, 3)}
+
+    if not positional:
+        order = numpy.argsort(documents, kind="stable")
+        documents, scans = documents[order], scans[order]
+        margins = _margins(distances, documents, scans)
+        confident = (distances[documents, scans] <= MAX_DISTANCE * HASH_BITS) & (margins >= MIN_GAIN * HASH_BITS)
+        scan_indices = [None] * documents_count
+        for document, scan in zip(documents[confident], scans[confident]):
+            scan_indices[int(document)] = int(scan)
+        uncertain = [pair(document, scan, margin) for document, scan, margin, is_confident
+                     in zip(documents, scans, margins, confident) if not is_confident]
+        return {"method": "hash", "scan_indices": scan_indices, "reordered": [], "uncertain": uncertain,
+                "unused_scan_pages": sorted(set(range(scans_count)) - set(scan_indices))}
+
+    moved = numpy.flatnonzero(documents != scans)
+    moved = moved[numpy.argsort(documents[moved], kind="stable")]
+    moved_documents, moved_scans = documents[moved], scans[moved]
+    gains = _gains(distances, moved_documents, moved_scans)
+    confident = ((distances[moved_documents, moved_scans] <= MAX_DISTANCE * HASH_BITS)
+                 & (gains >= MIN_GAIN * HASH_BITS))
+    moves = [pair(document, scan, gain) for document, scan, gain in zip(moved_documents, moved_scans, gains)]
+
+    if confident.all():
+        scan_indices = [None] * documents_count
+        for document, scan in zip(documents, scans):
+            scan_indices[int(document)] = int(scan)
+        method, reordered, uncertain = "hash", moves, []
+    else:
+        # Перестановка не доказана — порядок страниц; в отчёт попадают отвергнутые перестановки
+        scan_indices = [index if index < scans_count else None for index in range(documents_count)]
+        method, reordered = "positional", []
+        uncertain = [move for move, is_confident in zip(moves, confident) if not is_confident]
+
+    reported = {(entry["document"], entry["scan_page"]) for entry in uncertain}
+    for document, scan in enumerate(scan_indices):
+        if (scan is not None and distances[document, scan] > MAX_DISTANCE * HASH_BITS
+                and (document, scan) not in reported):
+            uncertain.append(pair(document, scan))
+    uncertain.sort(key=lambda entry: entry["document"])
+    unused = sorted(set(range(scans_count)) - set(scan_indices))
+    return {"method": method, "scan_indices": scan_indices, "reordered": reordered, "uncertain": uncertain,
+            "unused_scan_pages": unused}
+
+
+def match_titles(original_pdfs, scan_pdf, positional=True):
+    """
+    Сопоставляет первые страницы файлов original_pdfs со страницами scan_pdf (см. match_distances).
+    """
+    original_hashes = perceptual_hashes(first_page_thumbnails(original_pdfs))
+    scan_hashes = perceptual_hashes(pdf_thumbnails(scan_pdf))
+    return match_distances(hamming_distances(original_hashes, scan_hashes), positional)
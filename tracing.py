@@ -0,0 +1,122 @@
+"""
+Трассировка этапов обработки: вложенные интервалы (span) с временем выполнения и процессорным временем.
+
+    tracer = Tracer()
+    with activate(tracer):
+        with span("Workbooks.Open", file="a.xlsx"):
+            ...
+    tracer.write_chrome_trace("trace.json")  # открывается в chrome://tracing или Perfetto
+    tracer.stage_table()                     # {этап: {"count", "wall_sec", "cpu_sec"}}
+
+Пока трассировка не включена, span() и функции с декоратором traced() ничего не записывают.
+Рабочие процессы пула ведут собственный Tracer и передают его события родителю вместе
+с результатом (record_events).
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+_active_tracer = None
+
+
+class Tracer:
+    """Накапливает завершённые интервалы в формате событий Chrome Trace ("ph": "X")."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        start_us = time.time_ns() // 1000
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.thread_time() - start_cpu
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": start_us,
+                "dur": round(wall * 1_000_000),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": dict(args, cpu_ms=round(cpu * 1000, 3)),
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def add_events(self, events):
+        """Добавляет события, записанные в другом процессе."""
+        with self._lock:
+            self.events.extend(events)
+
+    def stage_table(self):
+        """Возвращает суммарное время по этапам: {этап: {"count", "wall_sec", "cpu_sec"}} в порядке первого появления."""
+        table = {}
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e["ts"])
+        for event in events:
+            row = table.setdefault(event["name"], {"count": 0, "wall_sec": 0.0, "cpu_sec": 0.0})
+            row["count"] += 1
+            row["wall_sec"] += event["dur"] / 1_000_000
+            row["cpu_sec"] += event["args"]["cpu_ms"] / 1000
+        for row in table.values():
+            row["wall_sec"] = round(row["wall_sec"], 3)
+            row["cpu_sec"] = round(row["cpu_sec"], 3)
+        return table
+
+    def write_chrome_trace(self, path):
+        """Записывает события в файл формата Chrome Trace Event (JSON)."""
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+@contextlib.contextmanager
+def activate(tracer):
+    """Делает tracer активным на время блока (None — трассировка выключена)."""
+    global _active_tracer
+    previous, _active_tracer = _active_tracer, tracer
+    try:
+        yield tracer
+    finally:
+        _active_tracer = previous
+
+
+def span(name, **args):
+    """Интервал активного трассировщика; если трассировка выключена — пустой контекст."""
+    if _active_tracer is None:
+        return contextlib.nullcontext()
+    return _active_tracer.span(name, **args)
+
+
+def record_events(events):
+    """Добавляет в активный трассировщик события, полученные из рабочего процесса."""
+    if _active_tracer is not None and events:
+        _active_tracer.add_events(events)
+
+
+def traced(name, path_arg=0):
+    """
+    Декоратор: выполняет функцию внутри интервала name. Если path_arg не None, имя файла
+    из позиционного аргумента с этим индексом записывается в параметр интервала file.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active_tracer is None:
+                return func(*args, **kwargs)
+            span_args = {}
+            if path_arg is not None and len(args) > path_arg and args[path_arg]:
+                span_args["file"] = os.path.basename(str(args[path_arg]))
+            with _active_tracer.span(name, **span_args):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
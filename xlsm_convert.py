@@ -0,0 +1,164 @@
+"""
+Преобразование книги .xlsm в .xlsx без Excel.
+
+Книга с макросами отличается от обычной типом содержимого основной части и проектом VBA
+(xl/vbaProject.bin с подписями). convert_xlsm() копирует пакет Office Open XML по одной записи
+архива, не распаковывая книгу целиком и не пересчитывая формулы: части проекта VBA и их связи
+удаляются, [Content_Types].xml и связи книги исправляются. Результат проверяется повторным
+чтением: количество листов должно совпасть с исходным.
+
+Книги, которые так преобразовать нельзя (повреждённые, зашифрованные, с листами макросов
+Excel 4.0 или диалогов), вызывают XlsxError — их конвертирует Excel.
+"""
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import unescape
+
+from xlsx_reader import XlsxError, open_workbook
+
+_CONTENT_TYPES_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+_PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Основная часть книги с макросами (.xlsm) и шаблона с макросами (.xltm) → основная часть .xlsx
+MACRO_ENABLED_MAIN_TYPES = (
+    "application/vnd.ms-excel.sheet.macroEnabled.main+xml",
+    "application/vnd.ms-excel.template.macroEnabled.main+xml",
+)
+WORKBOOK_MAIN_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"
+
+# Связи с частями проекта VBA (окончание атрибута Type); части удаляются вместе со связями
+_MACRO_RELATIONSHIPS = ("vbaProject", "vbaProjectSignature", "vbaProjectSignatureAgile", "vbaProjectSignatureV3")
+_MACRO_CONTENT_TYPE_PREFIX = "application/vnd.ms-office.vbaProject"
+
+# Листы, которые Excel не сохраняет в .xlsx: удаление изменило бы количество листов
+_UNSUPPORTED_SHEETS = ("xlMacrosheet", "xlIntlMacrosheet", "dialogsheet")
+
+_COPY_BUFFER = 1024 * 1024
+
+# Элементы [Content_Types].xml и файлов связей: пустые (<... />) или с закрывающим тегом без содержимого
+_ELEMENT = re.compile(rb"<(\w+:)?(Override|Default|Relationship)\b[^>]*?(?:/>|>\s*</(?:\w+:)?\2\s*>)")
+_ATTRIBUTE = re.compile(rb"""([\w:]+)\s*=\s*(["'])(.*?)\2""")
+
+
+def _rels_path(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def _macro_targets(source, rels_name):
+    """Возвращает пути частей VBA, на которые ссылается файл связей rels_name."""
+    if rels_name not in source.namelist():
+        return set()
+    directory = posixpath.dirname(posixpath.dirname(rels_name))
+    root = ElementTree.fromstring(source.read(rels_name))
+    targets = set()
+    for rel in root.iter(f"{{{_PACKAGE_REL_NS}}}Relationship"):
+        if rel.get("Type", "").rsplit("/", 1)[-1] in _MACRO_RELATIONSHIPS and rel.get("TargetMode") != "External":
+            target = rel.get("Target", "")
+            targets.add(target.lstrip("/") if target.startswith("/")
+                        else posixpath.normpath(posixpath.join(directory, target)))
+    return targets
+
+
+def _edit_elements(data, edit):
+    """
+    Применяет edit(тег, атрибуты) к каждому элементу Override, Default и Relationship и подставляет
+    возвращённые байты (b"" — удалить элемент). Остальной текст файла не изменяется.
+    """
+    def replace(match):
+        attributes = {name.decode(): unescape(value.decode("utf-8"))
+                      for name, _, value in _ATTRIBUTE.findall(match.group(0))}
+        return edit(match.group(2).decode(), attributes, match.group(0))
+    return _ELEMENT.sub(replace, data)
+
+
+def _rewrite_relationships(data):
+    def edit(tag, attributes, text):
+        return b"" if attributes.get("Type", "").rsplit("/", 1)[-1] in _MACRO_RELATIONSHIPS else text
+    return _edit_elements(data, edit)
+
+
+def _rewrite_content_types(data, workbook_part, removed, remaining_names):
+    root = ElementTree.fromstring(data)
+    overridden = {element.get("PartName", "").lstrip("/") for element in root
+                  if element.tag.rsplit("}", 1)[-1] == "Override"}
+
+    def edit(tag, attributes, text):
+        content_type = attributes.get("ContentType", "")
+        if tag == "Override":
+            part = attributes.get("PartName", "").lstrip("/")
+            if part in removed:
+                return b""
+            if part == workbook_part and content_type in MACRO_ENABLED_MAIN_TYPES:
+                return text.replace(content_type.encode(), WORKBOOK_MAIN_TYPE.encode())
+        elif tag == "Default" and content_type.startswith(_MACRO_CONTENT_TYPE_PREFIX):
+            extension = attributes.get("Extension", "").lower()
+            dependent = [name for name in remaining_names
+                         if name not in overridden and name.lower().endswith("." + extension)]
+            if dependent:
+                raise XlsxError(f"Тип содержимого .{extension} используется не только проектом VBA: {dependent[0]}")
+            return b""
+        return text
+    return _edit_elements(data, edit)
+
+
+def _copy_entry(source, target, info):
+    entry = zipfile.ZipInfo(info.filename, info.date_time)
+    entry.compress_type = info.compress_type
+    entry.external_attr = info.external_attr
+    with source.open(info) as src, target.open(entry, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+        shutil.copyfileobj(src, dst, _COPY_BUFFER)
+
+
+def convert_xlsm(source_path, xlsx_path):
+    """
+    Записывает в xlsx_path копию книги source_path без макросов.
+    Возвращает количество удалённых частей пакета. Если книгу нельзя преобразовать напрямую,
+    вызывает XlsxError; xlsx_path при этом не создаётся.
+    """
+    with open_workbook(source_path) as workbook:
+        unsupported = [info.name for info in workbook.sheets if info.kind in _UNSUPPORTED_SHEETS]
+        if unsupported:
+            raise XlsxError(f"Листы макросов Excel 4.0 и диалогов сохраняются в .xlsx только Excel: "
+                            f"{', '.join(unsupported)}")
+        workbook_part = workbook.workbook_part
+        sheet_count = len(workbook.sheets)
+
+    temp_path = xlsx_path + ".tmp"
+    try:
+        with zipfile.ZipFile(source_path) as source:
+            workbook_rels = _rels_path(workbook_part)
+            removed = _macro_targets(source, workbook_rels)
+            # Подписи проекта VBA связаны с самим проектом
+            for part in list(removed):
+                removed |= _macro_targets(source, _rels_path(part))
+            removed |= {_rels_path(part) for part in removed}
+            remaining_names = [name for name in source.namelist() if name not in removed]
+            removed_count = len(source.namelist()) - len(remaining_names)
+
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as target:
+                for info in source.infolist():
+                    if info.filename in removed:
+                        continue
+                    if info.filename == "[Content_Types].xml":
+                        target.writestr(info, _rewrite_content_types(source.read(info), workbook_part, removed,
+                                                                     remaining_names))
+                    elif info.filename == workbook_rels:
+                        target.writestr(info, _rewrite_relationships(source.read(info)))
+                    else:
+                        _copy_entry(source, target, info)
+
+        with open_workbook(temp_path) as converted:
+            if len(converted.sheets) != sheet_count:
+                raise XlsxError(f"После конвертации листов {len(converted.sheets)} вместо {sheet_count}")
+        os.replace(temp_path, xlsx_path)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise XlsxError(f"Не удалось переписать пакет книги: {e}") from e
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return removed_count
@@ -0,0 +1,583 @@
+"""
+Чтение книг Excel (.xlsx, .xlsm) без Excel: только zipfile и xml.etree из стандартной библиотеки.
+
+    workbook = open_workbook("a.xlsx")
+    for info in workbook.sheets:               # все листы в порядке книги, включая скрытые
+        sheet = workbook.load_sheet(info)      # значения ячеек, размеры, объединения, параметры страницы
+        text = sheet.cell_text(1, 1)           # отформатированное значение ячейки A1
+
+Загружаются только данные, нужные для печати: значения (для формул — последнее вычисленное
+значение, сохранённое Excel), числовые форматы, шрифт, выравнивание, границы и заливка ячеек,
+ширина столбцов и высота строк, область печати и параметры страницы. Формат .xls не поддерживается.
+"""
+import datetime
+import posixpath
+import re
+import zipfile
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def _q(tag):
+    return f"{{{_MAIN_NS}}}{tag}"
+
+
+# Встроенные числовые форматы (коды 14 и 22 — как их показывает Excel с русскими региональными настройками)
+BUILTIN_NUMBER_FORMATS = {
+    0: "General", 1: "0", 2: "0.00", 3: "#,##0", 4: "#,##0.00",
+    9: "0%", 10: "0.00%", 11: "0.00E+00", 12: "# ?/?", 13: "# ??/??",
+    14: "dd.mm.yyyy", 15: "d-mmm-yy", 16: "d-mmm", 17: "mmm-yy",
+    18: "h:mm AM/PM", 19: "h:mm:ss AM/PM", 20: "h:mm", 21: "h:mm:ss", 22: "dd.mm.yyyy h:mm",
+    37: "#,##0 ;(#,##0)", 38: "#,##0 ;[Red](#,##0)", 39: "#,##0.00;(#,##0.00)", 40: "#,##0.00;[Red](#,##0.00)",
+    45: "mm:ss", 46: "[h]:mm:ss", 47: "mmss.0", 48: "##0.0E+0", 49: "@",
+}
+
+BOOLEAN_TEXT = {"1": "ИСТИНА", "0": "ЛОЖЬ"}
+DECIMAL_SEPARATOR = ","
+THOUSANDS_SEPARATOR = "\u00a0"  # неразрывный пробел, как в Excel с русскими настройками
+
+_CELL_REF = re.compile(r"\$?([A-Z]{1,3})\$?(\d+)")
+# ошибки чтения повреждённой части архива: XML, контрольная сумма, сжатые данные, обрезанный файл
+_DAMAGED_PART_ERRORS = (ElementTree.ParseError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+class XlsxError(ValueError):
+    """Файл не является книгой Excel в формате Office Open XML или повреждён."""
+
+
+def column_index(letters):
+    """Преобразует буквенное обозначение столбца в номер: A → 1, Z → 26, AA → 27."""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def parse_cell_ref(ref):
+    """Преобразует ссылку на ячейку ("B7", "$B$7") в (строка, столбец)."""
+    match = _CELL_REF.fullmatch(ref.strip().upper())
+    if not match:
+        raise XlsxError(f"Некорректная ссылка на ячейку: {ref}")
+    return int(match.group(2)), column_index(match.group(1))
+
+
+def parse_range(ref):
+    """
+    Преобразует диапазон ("A1:H40", "'Лист 1'!$A$1:$H$40", "C5") в (строка1, столбец1, строка2, столбец2).
+    Для диапазона из нескольких частей через запятую берётся первая часть.
+    """
+    ref = ref.split(",")[0]
+    ref = ref.rsplit("!", 1)[-1]
+    first, _, last = ref.partition(":")
+    row1, col1 = parse_cell_ref(first)
+    row2, col2 = parse_cell_ref(last) if last else (row1, col1)
+    return min(row1, row2), min(col1, col2), max(row1, row2), max(col1, col2)
+
+
+class SheetInfo:
+    """Лист книги: имя, тип ("worksheet" или "chartsheet"), видимость, путь в архиве и область печати."""
+
+    def __init__(self, name, kind, state, path, print_area=None):
+        self.name = name
+        self.kind = kind
+        self.state = state
+        self.path = path
+        self.print_area = print_area
+
+    @property
+    def visible(self):
+        return self.state == "visible"
+
+
+class CellStyle:
+    """Оформление ячейки, влияющее на печать."""
+
+    def __init__(self, number_format="General", font_size=11.0, bold=False, italic=False,
+                 horizontal="general", vertical="bottom", wrap=False, rotation=0, borders=(), fill=None):
+        self.number_format = number_format
+        self.font_size = font_size
+        self.bold = bold
+        self.italic = italic
+        self.horizontal = horizontal
+        self.vertical = vertical
+        self.wrap = wrap
+        self.rotation = rotation
+        self.borders = frozenset(borders)  # стороны с границей: "left", "right", "top", "bottom"
+        self.fill = fill  # цвет заливки (r, g, b) в диапазоне 0..1 или None
+
+
+DEFAULT_STYLE = CellStyle()
+
+
+class PageSetup:
+    """Параметры страницы листа. Поля — в дюймах, как в файле."""
+
+    def __init__(self):
+        self.paper_size = 9  # A4
+        self.orientation = "portrait"
+        self.scale = 100
+        self.fit_to_page = False
+        self.margins = {"left": 0.7, "right": 0.7, "top": 0.75, "bottom": 0.75}
+        self.horizontal_centered = False
+        self.vertical_centered = False
+        self.grid_lines = False
+
+
+class Sheet:
+    """
+    Содержимое листа: cells {(строка, столбец): (значение, стиль)}, где значение — строка, число,
+    bool или datetime. Ширина столбцов задаётся в символах, высота строк — в пунктах.
+    """
+
+    def __init__(self, info, styles, date1904=False):
+        self.info = info
+        self.styles = styles
+        self.date1904 = date1904
+        self.cells = {}
+        self.column_widths = {}
+        self.hidden_columns = set()
+        self.row_heights = {}
+        self.hidden_rows = set()
+        self.default_column_width = 8.43
+        self.default_row_height = 15.0
+        self.merged_ranges = []
+        self.page_setup = PageSetup()
+
+    def style(self, row, column):
+        cell = self.cells.get((row, column))
+        return cell[1] if cell else DEFAULT_STYLE
+
+    def cell_text(self, row, column):
+        """Возвращает значение ячейки так, как оно выводится на печать."""
+        cell = self.cells.get((row, column))
+        if cell is None or cell[0] is None:
+            return ""
+        return format_value(cell[0], cell[1].number_format, self.date1904)
+
+    def used_range(self):
+        """Диапазон ячеек со значениями или оформлением (строка1, столбец1, строка2, столбец2) или None."""
+        keys = [key for key, (value, style) in self.cells.items()
+                if value not in (None, "") or style.borders or style.fill]
+        for row1, col1, row2, col2 in self.merged_ranges:
+            keys.extend(((row1, col1), (row2, col2)))
+        if not keys:
+            return None
+        rows = [row for row, _ in keys]
+        columns = [column for _, column in keys]
+        return 1, 1, max(rows), max(columns)
+
+    def print_range(self):
+        """Область печати листа, а если она не задана — используемый диапазон."""
+        if self.info.print_area:
+            return parse_range(self.info.print_area)
+        return self.used_range()
+
+
+def _is_date_format(code):
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', "", code).lower()
+    return any(symbol in code for symbol in "ydhs") or ("m" in code and "0" not in code and "#" not in code)
+
+
+def _excel_datetime(serial, date1904):
+    origin = datetime.datetime(1904, 1, 1) if date1904 else datetime.datetime(1899, 12, 30)
+    return origin + datetime.timedelta(days=serial)
+
+
+def _format_datetime(moment, code):
+    lowered = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', "", code).lower()
+    has_date = any(symbol in lowered for symbol in "yd")
+    has_time = "h" in lowered or "s" in lowered
+    parts = []
+    if has_date or not has_time:
+        parts.append(f"{moment.day:02d}.{moment.month:02d}.{moment.year:04d}")
+    if has_time:
+        parts.append(f"{moment.hour}:{moment.minute:02d}" + (f":{moment.second:02d}" if "s" in lowered else ""))
+    return " ".join(parts)
+
+
+def _group_thousands(digits):
+    groups = []
+    while len(digits) > 3:
+        groups.insert(0, digits[-3:])
+        digits = digits[:-3]
+    groups.insert(0, digits)
+    return THOUSANDS_SEPARATOR.join(groups)
+
+
+_FORMAT_TOKEN = re.compile(r'"[^"]*"|\\.|_.|\*.|[0#?][0#?,.]*|.')
+
+
+def _format_literal(tokens):
+    """Собирает литеральный текст формата: снимает кавычки и экранирование, _x заменяет пробелом."""
+    parts = []
+    for token in tokens:
+        if token.startswith('"'):
+            parts.append(token[1:-1])
+        elif token.startswith("\\"):
+            parts.append(token[1:])
+        elif token.startswith("_"):
+            parts.append(" ")
+        elif not token.startswith("*"):
+            parts.append(token)
+    return "".join(parts)
+
+
+def _format_general(number):
+    if isinstance(number, int) or number == int(number) and abs(number) < 1e15:
+        return str(int(number))
+    text = f"{number:.10g}"
+    return text.replace(".", DECIMAL_SEPARATOR).replace("e", "E")
+
+
+def format_value(value, number_format="General", date1904=False):
+    """Форматирует значение ячейки по числовому формату Excel (упрощённо, с русскими разделителями)."""
+    if isinstance(value, bool):
+        return BOOLEAN_TEXT["1" if value else "0"]
+    if isinstance(value, str):
+        return value
+    if isinstance(value, datetime.datetime):
+        return _format_datetime(value, number_format)
+
+    section = number_format.split(";")[0] if number_format else "General"
+    if section.lower() in ("general", "@", ""):
+        return _format_general(value)
+    if _is_date_format(section):
+        try:
+            return _format_datetime(_excel_datetime(value, date1904), section)
+        except OverflowError:
+            return _format_general(value)
+
+    # Формат делится на литеральный текст до числа, шаблон числа (0, #, разделители) и текст после него
+    prefix, pattern, suffix = [], None, []
+    for token in _FORMAT_TOKEN.findall(re.sub(r"\[[^\]]*\]", "", section)):
+        if pattern is None and token[0] in "0#?":
+            pattern = token
+        else:
+            (prefix if pattern is None else suffix).append(token)
+    if pattern is None or "?" in pattern or any(token.upper().startswith("E") for token in suffix[:1]):
+        return _format_general(value)
+    prefix, suffix = _format_literal(prefix), _format_literal(suffix)
+
+    number = value * 100 if "%" in prefix + suffix else value
+    integer_pattern, _, fraction_pattern = pattern.partition(".")
+    decimals = sum(1 for symbol in fraction_pattern if symbol in "0#")
+    text = f"{abs(number):.{decimals}f}"
+    integer, _, fraction = text.partition(".")
+    if "," in integer_pattern:
+        integer = _group_thousands(integer)
+    text = integer + (DECIMAL_SEPARATOR + fraction if fraction else "")
+    sign = "-" if number < 0 and any(digit in "123456789" for digit in text) else ""
+    return sign + prefix + text + suffix
+
+
+def _parse_color(element):
+    if element is None:
+        return None
+    rgb = element.get("rgb")
+    if not rgb or len(rgb) < 6:
+        return None
+    try:
+        red, green, blue = (int(rgb[-6:][i:i + 2], 16) / 255 for i in (0, 2, 4))
+    except ValueError:
+        return None
+    return red, green, blue
+
+
+def _bool_attribute(element, name, default=False):
+    if element is None:
+        return default
+    value = element.get(name)
+    if value is None:
+        return default
+    return value not in ("0", "false")
+
+
+class Workbook:
+    """Открытая книга. Листы загружаются по запросу через load_sheet()."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise XlsxError(f"Не удалось открыть книгу как архив Office Open XML: {e}") from e
+        try:
+            self._read_workbook()
+        except XlsxError:
+            self._zip.close()
+            raise
+        except (ValueError, IndexError) as e:
+            self._zip.close()
+            raise XlsxError(f"Некорректные данные в описании книги: {e}") from e
+        except Exception:
+            self._zip.close()
+            raise
+        self._styles = None
+        self._shared_strings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    def _xml(self, name):
+        try:
+            with self._zip.open(name) as f:
+                return ElementTree.parse(f).getroot()
+        except KeyError as e:
+            raise XlsxError(f"В книге отсутствует часть {name}") from e
+        except _DAMAGED_PART_ERRORS as e:
+            raise XlsxError(f"Повреждена часть книги {name}: {e}") from e
+
+    def _workbook_part(self):
+        root = self._xml("_rels/.rels")
+        for rel in root.iter(f"{{{_PACKAGE_REL_NS}}}Relationship"):
+            if rel.get("Type", "").endswith("/officeDocument"):
+                return rel.get("Target").lstrip("/")
+        raise XlsxError("В книге не найдена основная часть (officeDocument)")
+
+    def _relationships(self, part):
+        directory, name = posixpath.split(part)
+        rels_name = posixpath.join(directory, "_rels", name + ".rels")
+        if rels_name not in self._zip.namelist():
+            return {}
+        targets = {}
+        for rel in self._xml(rels_name).iter(f"{{{_PACKAGE_REL_NS}}}Relationship"):
+            target = rel.get("Target", "")
+            if rel.get("TargetMode") == "External":
+                continue
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+                posixpath.join(directory, target))
+            targets[rel.get("Id")] = (rel.get("Type", "").rsplit("/", 1)[-1], path)
+        return targets
+
+    def _read_workbook(self):
+        self.workbook_part = self._workbook_part()
+        root = self._xml(self.workbook_part)
+        self.relationships = self._relationships(self.workbook_part)
+        self.date1904 = _bool_attribute(root.find(_q("workbookPr")), "date1904")
+
+        print_areas = {}
+        defined_names = root.find(_q("definedNames"))
+        if defined_names is not None:
+            for defined in defined_names.findall(_q("definedName")):
+                if defined.get("name") == "_xlnm.Print_Area" and defined.get("localSheetId") is not None:
+                    print_areas[int(defined.get("localSheetId"))] = (defined.text or "").strip()
+
+        self.sheets = []
+        sheets = root.find(_q("sheets"))
+        for index, element in enumerate(sheets.findall(_q("sheet")) if sheets is not None else []):
+            kind, path = self.relationships.get(element.get(f"{{{_REL_NS}}}id"), ("", None))
+            self.sheets.append(SheetInfo(element.get("name", ""), kind or "worksheet",
+                                         element.get("state", "visible"), path, print_areas.get(index) or None))
+
+    def _part_path(self, kind):
+        for rel_kind, path in self.relationships.values():
+            if rel_kind == kind:
+                return path
+        return None
+
+    def shared_strings(self):
+        if self._shared_strings is None:
+            self._shared_strings = []
+            path = self._part_path("sharedStrings")
+            if path:
+                for item in self._xml(path).iter(_q("si")):
+                    # Текст — в t или в частях форматированной строки r/t; фонетические подсказки rPh не печатаются
+                    texts = [item.findtext(_q("t"), "")]
+                    texts.extend(run.findtext(_q("t"), "") for run in item.findall(_q("r")))
+                    self._shared_strings.append("".join(texts))
+        return self._shared_strings
+
+    def styles(self):
+        """Возвращает список CellStyle в порядке cellXfs (индекс — атрибут s ячейки)."""
+        if self._styles is not None:
+            return self._styles
+        self._styles = []
+        path = self._part_path("styles")
+        if not path:
+            return self._styles
+        root = self._xml(path)
+
+        number_formats = dict(BUILTIN_NUMBER_FORMATS)
+        formats = root.find(_q("numFmts"))
+        for element in formats.findall(_q("numFmt")) if formats is not None else []:
+            number_formats[int(element.get("numFmtId"))] = element.get("formatCode", "General")
+
+        fonts = []
+        fonts_element = root.find(_q("fonts"))
+        for font in fonts_element.findall(_q("font")) if fonts_element is not None else []:
+            size = font.find(_q("sz"))
+            fonts.append({
+                "font_size": float(size.get("val")) if size is not None and size.get("val") else 11.0,
+                "bold": _bool_attribute(font.find(_q("b")), "val", font.find(_q("b")) is not None),
+                "italic": _bool_attribute(font.find(_q("i")), "val", font.find(_q("i")) is not None),
+            })
+
+        fills = []
+        fills_element = root.find(_q("fills"))
+        for fill in fills_element.findall(_q("fill")) if fills_element is not None else []:
+            pattern = fill.find(_q("patternFill"))
+            color = None
+            if pattern is not None and pattern.get("patternType") == "solid":
+                color = _parse_color(pattern.find(_q("fgColor")))
+            fills.append(color)
+
+        borders = []
+        borders_element = root.find(_q("borders"))
+        for border in borders_element.findall(_q("border")) if borders_element is not None else []:
+            sides = []
+            for side in ("left", "right", "top", "bottom"):
+                element = border.find(_q(side))
+                if element is not None and element.get("style") not in (None, "none"):
+                    sides.append(side)
+            borders.append(sides)
+
+        cell_xfs = root.find(_q("cellXfs"))
+        for xf in cell_xfs.findall(_q("xf")) if cell_xfs is not None else []:
+            font = fonts[int(xf.get("fontId", 0))] if int(xf.get("fontId", 0)) < len(fonts) else {}
+            fill_id, border_id = int(xf.get("fillId", 0)), int(xf.get("borderId", 0))
+            alignment = xf.find(_q("alignment"))
+            rotation = int(alignment.get("textRotation", 0)) if alignment is not None else 0
+            self._styles.append(CellStyle(
+                number_format=number_formats.get(int(xf.get("numFmtId", 0)), "General"),
+                horizontal=alignment.get("horizontal", "general") if alignment is not None else "general",
+                vertical=alignment.get("vertical", "bottom") if alignment is not None else "bottom",
+                wrap=_bool_attribute(alignment, "wrapText"),
+                rotation=rotation,
+                borders=borders[border_id] if border_id < len(borders) else (),
+                fill=fills[fill_id] if fill_id < len(fills) else None,
+                **font,
+            ))
+        return self._styles
+
+    def load_sheet(self, info):
+        """Загружает лист. Для листа диаграммы возвращает лист без ячеек."""
+        styles = self.styles()
+        sheet = Sheet(info, styles, self.date1904)
+        if info.kind != "worksheet" or not info.path:
+            return sheet
+        shared_strings = self.shared_strings()
+        try:
+            with self._zip.open(info.path) as f:
+                self._parse_sheet(f, sheet, styles, shared_strings)
+        except KeyError as e:
+            raise XlsxError(f"В книге отсутствует лист {info.name} ({info.path})") from e
+        except _DAMAGED_PART_ERRORS as e:
+            raise XlsxError(f"Повреждён лист {info.name}: {e}") from e
+        return sheet
+
+    def sheet_has_cells(self, info):
+        """
+        Проверяет, есть ли на листе хотя бы одна ячейка. Лист читается только до первой ячейки,
+        поэтому проверка быстрая и для больших листов. Лист диаграммы считается непустым.
+        """
+        if info.kind != "worksheet" or not info.path:
+            return True
+        try:
+            with self._zip.open(info.path) as f:
+                for event, element in ElementTree.iterparse(f, events=("start",)):
+                    if element.tag == _q("c"):
+                        return True
+        except KeyError as e:
+            raise XlsxError(f"В книге отсутствует лист {info.name} ({info.path})") from e
+        except _DAMAGED_PART_ERRORS as e:
+            raise XlsxError(f"Повреждён лист {info.name}: {e}") from e
+        return False
+
+    @staticmethod
+    def _cell_value(cell, shared_strings):
+        kind = cell.get("t", "n")
+        if kind == "inlineStr":
+            inline = cell.find(_q("is"))
+            return "".join(t.text or "" for t in inline.iter(_q("t"))) if inline is not None else ""
+        value_element = cell.find(_q("v"))
+        if value_element is None or value_element.text is None:
+            return None
+        text = value_element.text
+        if kind == "s":
+            index = int(text)
+            return shared_strings[index] if index < len(shared_strings) else ""
+        if kind == "b":
+            return text == "1"
+        if kind in ("str", "e"):
+            return text
+        if kind == "d":
+            try:
+                return datetime.datetime.fromisoformat(text)
+            except ValueError:
+                return text
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return int(number) if number.is_integer() and "." not in text and "E" not in text.upper() else number
+
+    def _parse_sheet(self, stream, sheet, styles, shared_strings):
+        setup = sheet.page_setup
+        next_row = 1
+        for event, element in ElementTree.iterparse(stream, events=("end",)):
+            tag = element.tag
+            if tag == _q("c"):
+                continue  # ячейки обрабатываются вместе со строкой
+            if tag == _q("row"):
+                row = int(element.get("r", next_row))
+                next_row = row + 1
+                if element.get("ht"):
+                    sheet.row_heights[row] = float(element.get("ht"))
+                if _bool_attribute(element, "hidden"):
+                    sheet.hidden_rows.add(row)
+                next_column = 1
+                for cell in element.findall(_q("c")):
+                    ref = cell.get("r")
+                    column = parse_cell_ref(ref)[1] if ref else next_column
+                    next_column = column + 1
+                    style_index = int(cell.get("s", 0))
+                    style = styles[style_index] if style_index < len(styles) else DEFAULT_STYLE
+                    value = self._cell_value(cell, shared_strings)
+                    if value is not None or style is not DEFAULT_STYLE:
+                        sheet.cells[(row, column)] = (value, style)
+                element.clear()
+            elif tag == _q("col"):
+                for column in range(int(element.get("min")), int(element.get("max")) + 1):
+                    if element.get("width"):
+                        sheet.column_widths[column] = float(element.get("width"))
+                    if _bool_attribute(element, "hidden"):
+                        sheet.hidden_columns.add(column)
+            elif tag == _q("sheetFormatPr"):
+                if element.get("defaultColWidth"):
+                    sheet.default_column_width = float(element.get("defaultColWidth"))
+                elif element.get("baseColWidth"):
+                    sheet.default_column_width = float(element.get("baseColWidth")) + 0.71
+                if element.get("defaultRowHeight"):
+                    sheet.default_row_height = float(element.get("defaultRowHeight"))
+            elif tag == _q("mergeCell"):
+                if element.get("ref"):
+                    sheet.merged_ranges.append(parse_range(element.get("ref")))
+            elif tag == _q("pageSetUpPr"):
+                setup.fit_to_page = _bool_attribute(element, "fitToPage")
+            elif tag == _q("pageSetup"):
+                setup.paper_size = int(element.get("paperSize", setup.paper_size))
+                setup.orientation = element.get("orientation", setup.orientation)
+                setup.scale = int(element.get("scale", setup.scale))
+            elif tag == _q("pageMargins"):
+                for side in setup.margins:
+                    if element.get(side):
+                        setup.margins[side] = float(element.get(side))
+            elif tag == _q("printOptions"):
+                setup.horizontal_centered = _bool_attribute(element, "horizontalCentered")
+                setup.vertical_centered = _bool_attribute(element, "verticalCentered")
+                setup.grid_lines = _bool_attribute(element, "gridLines")
+
+
+def open_workbook(path):
+    """Открывает книгу .xlsx или .xlsm. При ошибке формата вызывает XlsxError."""
+    return Workbook(path)